@@ -3,13 +3,18 @@ import asyncio
 import pandas as pd
 import sys
 import os
+import uuid
 
 # Add the project root to the python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.agent.sql_agent import SQLAgent
+from src.agent.sql_agent import SQLAgent, start_warm_up
+from src.database.profiles import get_profiles
 from src.visualisation.chart_selector import ChartSelector
 from src.visualisation.plotly_generator import PlotlyGenerator
+from src.visualisation.render_planner import RenderPlanner
+from src.tracing import span, stage_summary, start_trace
+from src.history_store import HistoryStore
 from dotenv import load_dotenv
 
 # Load env vars
@@ -17,40 +22,80 @@ load_dotenv()
 
 st.set_page_config(page_title="AI SQL Dashboard", page_icon="📊", layout="wide")
 
+# Results rendered in full on every rerun; older ones only when toggled open
+EAGER_RESULTS = int(os.getenv("HISTORY_EAGER_RESULTS", "1"))
+
+def render_result(store: HistoryStore, message: dict, eager: bool):
+    """Draw a past result from its on-disk files."""
+    ref = message["result"]
+    if not store.available(ref):
+        st.caption("This result is no longer kept in the history.")
+        return
+    if not eager and not st.toggle(f"Show chart and data ({ref['rows']:,} rows)", key=f"show_{ref['result_id']}"):
+        return
+    figure = store.load_figure(ref)
+    if figure is not None:
+        st.plotly_chart(figure, use_container_width=True, key=f"chart_{ref['result_id']}")
+    for note in message.get("notes", []):
+        st.caption(note)
+    with st.expander("View Raw Data"):
+        st.dataframe(store.load_frame(ref))
+
 def main():
     st.title("📊 AI Database-to-Dashboard Agent")
     st.markdown("Ask questions about your data in plain English.")
 
-    # Sidebar Config
+    # Identifies this browser session, e.g. for fair sharing of MCP sessions
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    # Sidebar Config: kept in this session's state, never in the process environment
     with st.sidebar:
         st.header("Configuration")
         st.subheader("Database")
-        db_name = st.text_input("DB Name", value=os.getenv("DB_NAME", "postgres"))
-        db_user = st.text_input("User", value=os.getenv("DB_USER", "postgres"))
-        # Update env vars for the session (Agent uses os.getenv)
-        if db_name: os.environ["DB_NAME"] = db_name
-        if db_user: os.environ["DB_USER"] = db_user
+        profiles = get_profiles()
+        profile_name = st.selectbox("Profile", list(profiles)) if len(profiles) > 1 else "default"
+        profile = profiles[profile_name]
+        db_name = st.text_input("DB Name", value=profile.dbname or "postgres")
+        db_user = st.text_input("User", value=profile.user or "postgres")
+        st.session_state.profile = profile.with_overrides(dbname=db_name, user=db_user)
         
         st.subheader("LLM")
-        model = st.selectbox("Model", ["llama3", "llama2", "mistral", "codellama"], index=0)
-        os.environ["OLLAMA_MODEL"] = model
+        st.session_state.model = st.selectbox("Model", ["llama3", "llama2", "mistral", "codellama"], index=0)
+
+    # Load the model, start MCP servers and fetch the schema while the user types
+    start_warm_up(st.session_state.profile, st.session_state.model, modules=("plotly.express",))
 
     # Initialize Session State
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "history" not in st.session_state:
+        # Results live on disk; messages only keep references to them
+        st.session_state.history = HistoryStore(session_id=st.session_state.session_id)
+    store = st.session_state.history
+
+    with st.sidebar:
+        st.subheader("History")
+        stats = store.stats()
+        st.caption(
+            f"{stats['results']} results · {stats['disk_bytes'] / 1e6:.1f} MB on disk · "
+            f"{stats['cached_bytes'] / 1e6:.1f} of {stats['memory_cap_bytes'] / 1e6:.0f} MB in memory"
+        )
+        if st.button("Clear history"):
+            store.clear()
+            st.session_state.messages = []
 
     # Chat Interface
-    for message in st.session_state.messages:
+    results = [i for i, message in enumerate(st.session_state.messages) if "result" in message]
+    eager = set(results[-EAGER_RESULTS:]) if EAGER_RESULTS > 0 else set()
+    for i, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
             if "sql" in message:
                 with st.expander("View SQL"):
                     st.code(message["sql"], language="sql")
-            if "chart" in message:
-                st.plotly_chart(message["chart"], use_container_width=True)
-            if "data" in message:
-                with st.expander("View Raw Data"):
-                    st.dataframe(message["data"])
+            if "result" in message:
+                render_result(store, message, eager=i in eager)
 
     if prompt := st.chat_input("What would you like to know?"):
         # User Message
@@ -60,10 +105,29 @@ def main():
 
         # Assistant Response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                agent = SQLAgent()
+            with st.spinner("Thinking..."), start_trace() as trace:
+                agent = SQLAgent(
+                    profile=st.session_state.profile,
+                    model=st.session_state.model,
+                    tenant=st.session_state.session_id
+                )
+                # Show the SQL as it streams in from the LLM
+                partial_sql = st.empty()
                 # Run async agent in sync streamlit
-                response = asyncio.run(agent.process_query(prompt))
+                response = asyncio.run(
+                    agent.process_query(prompt, on_sql_token=lambda sql: partial_sql.code(sql, language="sql"))
+                )
+                partial_sql.empty()
+
+                attempts = response.get("attempts", [])
+                if len(attempts) > 1:
+                    with st.expander(f"SQL was corrected {len(attempts) - 1} time(s)"):
+                        for i, attempt in enumerate(attempts, 1):
+                            status = "succeeded" if attempt["error"] is None else f"failed ({attempt['stage']})"
+                            st.markdown(f"**Attempt {i}** ({attempt['source']}, {attempt['duration_ms']:.0f} ms) {status}")
+                            st.code(attempt["sql"], language="sql")
+                            if attempt["error"]:
+                                st.caption(attempt["error"])
 
                 if "error" in response:
                     st.error(response["error"])
@@ -71,38 +135,71 @@ def main():
                 else:
                     # Success
                     sql = response["sql"]
-                    data = response["results"]
+                    df = response["results"]
                     
                     st.success("Query executed successfully!")
+                    result_cache = response.get("result_cache", {})
+                    if result_cache.get("hit"):
+                        st.caption(f"Served from result cache · data is {result_cache['age_seconds']:.0f}s old")
+                    rollup = response.get("rollup")
+                    if rollup:
+                        st.caption(
+                            f"Answered from rollup `{rollup['name']}` ({rollup['rows']:,} rows) · "
+                            f"refreshed {rollup['age_seconds']:.0f}s ago"
+                        )
                     with st.expander("View SQL"):
                         st.code(sql, language="sql")
 
-                    if data:
-                        df = pd.DataFrame(data)
-                        
+                    cost_guard = response.get("cost_guard") or {}
+                    if cost_guard.get("action") == "limited":
+                        st.info(
+                            f"The planner estimated ~{cost_guard['estimated_rows']:,.0f} rows, "
+                            f"so the query was limited to {cost_guard['limit'] - 1:,} rows."
+                        )
+                    if response["truncated"]:
+                        st.warning(f"The result was too large; showing the first {response['row_count']:,} rows.")
+
+                    if not df.empty:
                         # Visualization
                         selector = ChartSelector()
-                        chart_type = selector.select_chart_type(df)
+                        with span("chart.select") as attrs:
+                            chart_type = attrs["chart"] = selector.select_chart_type(df)
                         
-                        generator = PlotlyGenerator()
-                        fig = generator.generate_chart(df, chart_type)
+                        # Fit the chart to the point budget, aggregating in SQL where possible
+                        planner = RenderPlanner()
+                        plan = asyncio.run(planner.plan_with_pushdown(
+                            df, chart_type, sql, agent.run_sql, truncated=response["truncated"]
+                        ))
+                        generator = PlotlyGenerator(planner)
+                        fig = generator.generate_chart(plan.data, plan.chart_type, plan=plan)
+                        for note in plan.notes:
+                            st.caption(note)
+                        if plan.pushdown_sql:
+                            with st.expander("View aggregation SQL"):
+                                st.code(plan.pushdown_sql, language="sql")
                         
-                        st.plotly_chart(fig, use_container_width=True)
+                        with span("chart.display"):
+                            st.plotly_chart(fig, use_container_width=True)
                         
                         with st.expander("View Raw Data"):
                             st.dataframe(df)
 
-                        # Save to history
+                        # Save to history: the frame and figure go to disk, not session state
                         st.session_state.messages.append({
                             "role": "assistant", 
                             "content": "Here is the data you requested.",
                             "sql": sql,
-                            "chart": fig,
-                            "data": df
+                            "result": store.save(df, fig),
+                            "notes": plan.notes
                         })
                     else:
                         st.info("Query returned no results.")
                         st.session_state.messages.append({"role": "assistant", "content": "Query returned no results.", "sql": sql})
 
+                with st.expander("⏱ Timing breakdown"):
+                    st.dataframe(pd.DataFrame(trace.breakdown()), hide_index=True)
+                    st.caption("Rolling latency per stage")
+                    st.dataframe(pd.DataFrame.from_dict(stage_summary(), orient="index"))
+
 if __name__ == "__main__":
     main()
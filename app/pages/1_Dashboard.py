@@ -0,0 +1,184 @@
+import streamlit as st
+import asyncio
+import time
+import pandas as pd
+import sys
+import os
+
+# Add the project root to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.agent.sql_agent import SQLAgent, start_warm_up
+from src.visualisation.chart_selector import ChartSelector
+from src.visualisation.dashboard_spec import load_dashboard_spec
+from src.visualisation.live_panel import make_live_panel, refresh_live_panels
+from src.visualisation.plotly_generator import PlotlyGenerator
+from src.visualisation.render_planner import RenderPlanner
+from dotenv import load_dotenv
+
+# Load env vars
+load_dotenv()
+
+st.set_page_config(page_title="AI SQL Dashboard Builder", page_icon="📋", layout="wide")
+
+EXAMPLE_SPEC = """title: Sales overview
+columns: 2
+refresh: 60              # seconds between live updates of time-series panels; 0 turns them off
+panels:
+  - question: What is the total order amount per month?
+    chart: line
+  - question: Which 10 customers placed the most orders?
+  - question: How many orders were placed per region?
+    chart: bar
+  - question: What are the 5 best selling products by quantity?
+"""
+
+def build_view(panel, response, live: bool) -> dict:
+    """
+    Plan and draw a finished panel once. Time-series panels of a live
+    dashboard also get a LivePanel, which later refreshes extend in place.
+    """
+    view = {"figure": None, "notes": [], "live": None}
+    if "error" in response or response["results"].empty:
+        return view
+    df = response["results"]
+    chart_type = panel["chart"] if panel["chart"] != "auto" else ChartSelector().select_chart_type(df)
+    planner = RenderPlanner()
+    plan = planner.plan(df, chart_type)
+    view["figure"] = PlotlyGenerator(planner).generate_chart(plan.data, plan.chart_type, plan=plan)
+    view["notes"] = plan.notes
+    if live and panel["live"]:
+        view["live"] = make_live_panel(response["sql"], df, plan, view["figure"])
+    return view
+
+def render_panel(panel, response, view, key: str):
+    """Render one finished panel: chart, timings and SQL."""
+    st.subheader(panel["title"])
+    if "error" in response:
+        st.error(response["error"])
+        return
+
+    live = view["live"]
+    if view["figure"] is None:
+        st.info("Query returned no results.")
+    else:
+        st.plotly_chart(live.figure if live else view["figure"], use_container_width=True, key=key)
+        for note in view["notes"]:
+            st.caption(note)
+        if live:
+            st.caption(
+                f"🟢 Live · {len(live.data):,} rows · updated {time.time() - live.refreshed_at:.0f}s ago · "
+                f"{live.rows_added:,} new rows in {live.refreshes} refreshes"
+            )
+            if live.error:
+                st.warning(f"Last refresh failed: {live.error}")
+
+    timings = response["timings"]
+    st.caption(
+        f"{response['row_count']:,} rows · LLM {timings['generate_ms']:.0f} ms · "
+        f"query {timings['execute_ms']:.0f} ms · total {timings['total_ms']:.0f} ms"
+    )
+    with st.expander("View SQL"):
+        st.code(response["sql"], language="sql")
+
+def timings_table(spec, responses) -> pd.DataFrame:
+    rows = []
+    for panel, response in zip(spec["panels"], responses):
+        timings = response.get("timings", {})
+        rows.append({
+            "panel": panel["title"],
+            "status": "error" if "error" in response else "ok",
+            "rows": response.get("row_count"),
+            "attempts": len(response.get("attempts", [])),
+            "llm_ms": timings.get("generate_ms"),
+            "query_ms": timings.get("execute_ms"),
+            "total_ms": timings.get("total_ms"),
+        })
+    return pd.DataFrame(rows)
+
+def draw_dashboard(dashboard):
+    spec = dashboard["spec"]
+    st.header(spec["title"])
+    columns = st.columns(spec["columns"])
+    for i, (panel, response, view) in enumerate(zip(spec["panels"], dashboard["responses"], dashboard["views"])):
+        with columns[i % len(columns)]:
+            render_panel(panel, response, view, key=f"panel_{i}")
+    with st.expander(f"Panel timings (built in {dashboard['elapsed']:.1f}s)"):
+        st.dataframe(timings_table(spec, dashboard["responses"]))
+
+def live_dashboard(dashboard):
+    """Fetch rows added since the last update for every live panel, then redraw."""
+    panels = [view["live"] for view in dashboard["views"] if view["live"] is not None]
+    # Reruns from other widgets do not refresh; timer ticks arrive about one interval apart
+    if time.time() - min(panel.refreshed_at for panel in panels) >= dashboard["spec"]["refresh"] / 2:
+        agent = SQLAgent(
+            profile=st.session_state.get("profile"),
+            model=st.session_state.get("model"),
+            tenant=st.session_state.get("session_id")
+        )
+        # Delta queries only: no LLM call, no result cache
+        asyncio.run(refresh_live_panels(panels, agent.run_sql))
+    draw_dashboard(dashboard)
+
+def main():
+    st.title("📋 Dashboard Builder")
+    st.markdown("Describe a dashboard as a list of questions (YAML or JSON) and build every panel in one go.")
+    start_warm_up(st.session_state.get("profile"), st.session_state.get("model"), modules=("plotly.express",))
+
+    spec_text = st.text_area("Dashboard spec", value=EXAMPLE_SPEC, height=260)
+    uploaded = st.file_uploader("...or upload a spec", type=["yaml", "yml", "json"])
+    if uploaded is not None:
+        spec_text = uploaded.getvalue().decode("utf-8")
+
+    if st.button("Build dashboard", type="primary"):
+        try:
+            spec = load_dashboard_spec(spec_text)
+        except ValueError as e:
+            st.error(str(e))
+            return
+
+        st.header(spec["title"])
+        columns = st.columns(spec["columns"])
+        placeholders = [columns[i % len(columns)].empty() for i in range(len(spec["panels"]))]
+        for placeholder, panel in zip(placeholders, spec["panels"]):
+            placeholder.info(f"⏳ {panel['title']}")
+
+        # Panels are drawn as their answers arrive, not in spec order
+        views = [None] * len(spec["panels"])
+        def on_result(i, response):
+            views[i] = build_view(spec["panels"][i], response, live=spec["refresh"] > 0)
+            with placeholders[i].container():
+                render_panel(spec["panels"][i], response, views[i], key=f"panel_{i}")
+
+        started = time.perf_counter()
+        # Same database, model and queue identity as the chat page of this session
+        agent = SQLAgent(
+            profile=st.session_state.get("profile"),
+            model=st.session_state.get("model"),
+            tenant=st.session_state.get("session_id")
+        )
+        responses = asyncio.run(
+            agent.process_batch([panel["question"] for panel in spec["panels"]], on_result=on_result)
+        )
+        elapsed = time.perf_counter() - started
+        st.session_state.dashboard = {"spec": spec, "responses": responses, "views": views, "elapsed": elapsed}
+        if any(view["live"] for view in views):
+            # Hand the panels over to the refreshing fragment
+            st.rerun()
+
+        succeeded = sum(1 for response in responses if "error" not in response)
+        st.success(f"Built {succeeded}/{len(responses)} panels in {elapsed:.1f}s.")
+        with st.expander("Panel timings"):
+            st.dataframe(timings_table(spec, responses))
+
+    elif "dashboard" in st.session_state:
+        # Redraw the last dashboard after other widgets trigger a rerun
+        dashboard = st.session_state.dashboard
+        if any(view["live"] for view in dashboard["views"]):
+            # Only this fragment reruns on each tick, not the whole page
+            st.fragment(live_dashboard, run_every=dashboard["spec"]["refresh"])(dashboard)
+        else:
+            draw_dashboard(dashboard)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark the few-shot example store at scale.
+
+Fills a fresh store with synthetic (question, SQL) pairs over a generated
+schema, then reports record throughput, lookup latency (p50/p95, including
+rendering the prompt section), the size of the prompt section, and the cost
+of a schema change: the sync itself and lookups that re-check the examples
+it marked.
+
+    python benchmarks/example_store_benchmark.py --examples 1000 10000 100000
+"""
+import argparse
+import copy
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate_schema
+from src.agent.example_store import ExampleStore
+from src.agent.query_validator import QueryValidator
+from src.agent.schema_retriever import estimate_tokens
+
+CONNECTION = ("localhost", "5432", "benchmark", "postgres")
+
+
+def generate_examples(schema, count, seed=11):
+    """Distinct questions with SQL that fits the schema."""
+    rng = random.Random(seed)
+    examples = {}
+    while len(examples) < count:
+        table = rng.choice(schema["tables"])
+        domain, entity = table["name"].split("_")[:2]
+        measures = [col["name"] for col in table["columns"] if col["type"].startswith("numeric")]
+        dims = [col["name"] for col in table["columns"] if col["type"] == "text" and col["name"] != "name"]
+        measure, dim, year, n = rng.choice(measures), rng.choice(dims), rng.randint(1990, 2030), rng.randint(3, 50)
+        question = f"Top {n} {dim} by total {measure} of {domain} {entity}s in {year}"
+        sql = (
+            f"SELECT {dim}, SUM({measure}) AS total FROM {table['name']} "
+            f"WHERE EXTRACT(YEAR FROM created_at) = {year} GROUP BY {dim} ORDER BY total DESC LIMIT {n}"
+        )
+        examples[question] = (sql, [table["name"]])
+    return list(examples.items())
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def lookup_ms(store, schema, validator, questions):
+    samples, tokens = [], []
+    for question in questions:
+        started = time.perf_counter()
+        text = store.render(store.similar(CONNECTION, question, schema, validator))
+        samples.append((time.perf_counter() - started) * 1000)
+        tokens.append(estimate_tokens(text))
+    return samples, tokens
+
+
+def run(count, args):
+    schema = generate_schema(args.tables)
+    validator = QueryValidator()
+    examples = generate_examples(schema, count)
+    queries = [question for question, _ in generate_examples(schema, args.queries, seed=99)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExampleStore(path=os.path.join(directory, "examples.sqlite"), max_entries=count)
+        store.sync_schema(CONNECTION, schema)
+        started = time.perf_counter()
+        for question, (sql, tables) in examples:
+            store.record(CONNECTION, question, sql, tables)
+        record_s = time.perf_counter() - started
+
+        samples, tokens = lookup_ms(store, schema, validator, queries)
+
+        # Drop a measure from a third of the tables: examples using them must be re-checked
+        changed = copy.deepcopy(schema)
+        changed["fingerprint"] += "-changed"
+        for table in changed["tables"][::3]:
+            measures = [col for col in table["columns"] if col["type"].startswith("numeric")]
+            table["columns"].remove(measures[0])
+        started = time.perf_counter()
+        store.sync_schema(CONNECTION, changed)
+        sync_ms = (time.perf_counter() - started) * 1000
+        stale_samples, _ = lookup_ms(store, changed, validator, queries)
+        stats = store.stats()
+
+    print(f"{count:>9,} examples: record {count / record_s:,.0f}/s · lookup p50 {statistics.median(samples):.2f} ms, "
+          f"p95 {percentile(samples, 0.95):.2f} ms · prompt ~{statistics.mean(tokens):.0f} tokens")
+    print(f"{'':>20}schema change: sync {sync_ms:.1f} ms, lookup p50 {statistics.median(stale_samples):.2f} ms, "
+          f"p95 {percentile(stale_samples, 0.95):.2f} ms · {stats['stale_deleted']} stale deleted, "
+          f"{stats['unverified']:,} left to re-check")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--examples", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--tables", type=int, default=100, help="Tables in the synthetic schema")
+    parser.add_argument("--queries", type=int, default=200, help="Lookups timed per store size")
+    args = parser.parse_args()
+    for count in args.examples:
+        run(count, args)
+
+
+if __name__ == "__main__":
+    main()
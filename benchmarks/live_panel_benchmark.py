@@ -0,0 +1,137 @@
+"""
+Benchmark live panel refreshes against re-running the panel's query.
+
+Seeds a disposable database on the Postgres server configured by the DB_*
+variables (live panels filter with Postgres timestamp literals, so there is
+no SQLite mode) with ``--rows`` rows one minute apart, and draws two
+time-series panels: the raw series and an hourly aggregate. Each tick then
+appends ``--new-rows`` rows and refreshes every panel both ways:
+
+``full``   run the whole query again, plan and draw a new figure (what
+           asking the question again costs, minus LLM generation)
+``delta``  ``refresh_live_panels``: the watermark delta query, merged into
+           the stored rows and the figure extended in place
+
+and checks that the live panel holds the same rows as the full result.
+
+    python benchmarks/live_panel_benchmark.py --rows 10000 100000 1000000 --new-rows 60
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.pipeline_benchmark import PostgresFixture, fact_table
+from benchmarks.synthetic import generate_schema
+
+
+def panel_queries(schema):
+    table, measures, _ = fact_table(schema)
+    name, measure = table["name"], measures[0]
+    return {
+        "raw": f"SELECT created_at, {measure} FROM {name} ORDER BY created_at",
+        "hourly": (
+            f"SELECT date_trunc('hour', created_at) AS hour, SUM({measure}) AS total "
+            f"FROM {name} GROUP BY 1 ORDER BY 1"
+        ),
+    }
+
+
+def append_sql(schema, start, count):
+    """Rows ``start + 1`` to ``start + count``, continuing the seeded minute series."""
+    table, measures, _ = fact_table(schema)
+    return (
+        f"INSERT INTO {table['name']} (id, created_at, {measures[0]}) "
+        f"SELECT g, TIMESTAMP '2024-01-01' + g * INTERVAL '1 minute', (g % 997) * 1.5 "
+        f"FROM generate_series({start + 1}, {start + count}) AS seq(g)"
+    )
+
+
+async def draw(agent, sql):
+    """Run a query, plan and draw its line chart: (frame, plan, figure)."""
+    from src.visualisation.plotly_generator import PlotlyGenerator
+    from src.visualisation.render_planner import RenderPlanner
+
+    df, _ = await agent.run_sql(sql, fresh=True)
+    planner = RenderPlanner()
+    plan = planner.plan(df, "line")
+    return df, plan, PlotlyGenerator(planner).generate_chart(plan.data, plan.chart_type, plan=plan)
+
+
+def same_rows(panel, df):
+    expected = panel._converted(df)[panel.value_column]
+    return len(expected) == len(panel.data) and expected.sum() == panel.data[panel.value_column].sum()
+
+
+def run_size(args, num_rows):
+    from src.agent.sql_agent import SQLAgent
+    from src.visualisation.live_panel import make_live_panel, refresh_live_panels
+
+    schema = generate_schema(args.tables, seed=args.seed)
+    queries = panel_queries(schema)
+    fixture = PostgresFixture(schema, num_rows)
+    with fixture:
+        agent = SQLAgent(profile=fixture.profile)
+        loaded = num_rows
+
+        async def run():
+            nonlocal loaded
+            panels = {}
+            for key, sql in queries.items():
+                df, plan, figure = await draw(agent, sql)
+                panels[key] = make_live_panel(sql, df, plan, figure, max_rows=num_rows * 2)
+            samples = {key: {"full": [], "delta": [], "match": True} for key in queries}
+            conn = fixture._connect(fixture.name)
+            try:
+                for _ in range(args.ticks):
+                    with conn.cursor() as cur:
+                        cur.execute(append_sql(schema, loaded, args.new_rows))
+                    loaded += args.new_rows
+                    for key, sql in queries.items():
+                        started = time.perf_counter()
+                        df, _, _ = await draw(agent, sql)
+                        samples[key]["full"].append((time.perf_counter() - started) * 1000)
+
+                        started = time.perf_counter()
+                        await refresh_live_panels([panels[key]], agent.run_sql)
+                        samples[key]["delta"].append((time.perf_counter() - started) * 1000)
+                        samples[key]["match"] &= panels[key].error is None and same_rows(panels[key], df)
+            finally:
+                conn.close()
+            return samples
+
+        return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--new-rows", type=int, default=60, help="Rows appended before each refresh")
+    parser.add_argument("--ticks", type=int, default=5, help="Refreshes timed per panel")
+    parser.add_argument("--tables", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # Full re-runs must return every row, as the live panel keeps them
+    os.environ.setdefault("RESULT_MAX_ROWS", str(2 * max(args.rows)))
+    os.environ.setdefault("RESULT_MAX_BYTES", str(4 * 1024 ** 3))
+    os.environ.setdefault("QUERY_COST_GUARD", "off")
+
+    print(f"{'rows':>10} {'panel':>8} {'full p50 ms':>12} {'delta p50 ms':>13} {'speedup':>8}  same rows")
+    failures = 0
+    for num_rows in args.rows:
+        for key, samples in run_size(args, num_rows).items():
+            full, delta = statistics.median(samples["full"]), statistics.median(samples["delta"])
+            failures += not samples["match"]
+            print(f"{num_rows:>10,} {key:>8} {full:>12.1f} {delta:>13.1f} {full / delta:>7.1f}x  "
+                  f"{'yes' if samples['match'] else 'NO'}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
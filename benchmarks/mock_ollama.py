@@ -0,0 +1,157 @@
+"""
+A stand-in Ollama server for offline benchmarks.
+
+Serves ``/api/chat`` (streamed NDJSON or a single JSON reply) with canned
+answers keyed by the prompt's "User Question:" line, so generation and
+repair prompts for the same question get the same SQL. ``/api/generate``
+with an empty prompt answers model preloads after ``load_latency_ms``.
+Prompt evaluation and per-token latency are configurable, and the final
+chunk carries Ollama-style timings so the tracing stages stay populated.
+
+    server = MockOllama({"How many orders?": "SELECT COUNT(*) FROM orders;"}).start()
+    os.environ["OLLAMA_HOST"] = server.url
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+TOKEN_PATTERN = re.compile(r"\s*\S+")
+
+
+class MockOllama:
+    def __init__(
+        self,
+        answers: Dict[str, str],
+        prompt_latency_ms: float = 200.0,
+        token_latency_ms: float = 10.0,
+        load_latency_ms: float = 0.0,
+        default_answer: str = "ERROR: Cannot answer query with available data.",
+        port: int = 0
+    ):
+        self.answers = answers
+        self.prompt_latency_ms = prompt_latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.load_latency_ms = load_latency_ms
+        self.default_answer = default_answer
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockOllama":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def answer(self, prompt: str) -> str:
+        # Only look at the question line, not the schema above it
+        match = re.search(r"User Question: (.*)", prompt)
+        question = match.group(1).strip() if match else prompt
+        return self.answers.get(question, self.default_answer)
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/generate" and not body.get("prompt"):
+                    self._preload(body)
+                    return
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                mock.requests += 1
+                prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+                tokens = TOKEN_PATTERN.findall(mock.answer(prompt)) or [""]
+                limit = (body.get("options") or {}).get("num_predict")
+                if limit:
+                    tokens = tokens[:limit]
+
+                started = time.perf_counter_ns()
+                time.sleep(mock.prompt_latency_ms / 1000)
+                prompt_done = time.perf_counter_ns()
+                if body.get("stream", True):
+                    self._stream(body, tokens, started, prompt_done)
+                else:
+                    time.sleep(mock.token_latency_ms * len(tokens) / 1000)
+                    self._send_json(self._final(body, "".join(tokens), len(tokens), started, prompt_done))
+
+            def _preload(self, body):
+                started = time.perf_counter_ns()
+                time.sleep(mock.load_latency_ms / 1000)
+                self._send_json({
+                    "model": body.get("model"),
+                    "created_at": "1970-01-01T00:00:00Z",
+                    "response": "",
+                    "done": True,
+                    "done_reason": "load",
+                    "load_duration": time.perf_counter_ns() - started,
+                })
+
+            def _stream(self, body, tokens, started, prompt_done):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        self._chunk({
+                            "model": body.get("model"),
+                            "created_at": "1970-01-01T00:00:00Z",
+                            "message": {"role": "assistant", "content": token},
+                            "done": False,
+                        })
+                        time.sleep(mock.token_latency_ms / 1000)
+                    self._chunk(self._final(body, "", len(tokens), started, prompt_done))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading once it had a complete statement
+                    pass
+
+            def _final(self, body, content, eval_count, started, prompt_done):
+                now = time.perf_counter_ns()
+                return {
+                    "model": body.get("model"),
+                    "created_at": "1970-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": content},
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": now - started,
+                    "load_duration": 0,
+                    "prompt_eval_count": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+                    "prompt_eval_duration": prompt_done - started,
+                    "eval_count": eval_count,
+                    "eval_duration": now - prompt_done,
+                }
+
+            def _chunk(self, payload):
+                line = (json.dumps(payload) + "\n").encode()
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
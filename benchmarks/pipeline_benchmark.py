@@ -0,0 +1,381 @@
+"""
+End-to-end benchmark of the question-to-DataFrame pipeline.
+
+Drives ``SQLAgent.process_query`` against a stand-in Ollama server
+(``benchmarks.mock_ollama``) with canned SQL and configurable latency, and
+against either a disposable database on the Postgres server configured by
+the DB_* variables (``--backend postgres``, through the real MCP server) or
+a SQLite fake of the MCP tools (``--backend sqlite``). Each scenario seeds a
+synthetic schema of ``--tables`` tables, fills one fact table with enough
+rows for the largest result in ``--rows``, and asks one question per result
+size plus an aggregate over the whole table.
+
+Reports per-question latency (p50/p95), the p50 of every traced stage,
+sequential and concurrent throughput, and peak RSS of the client and of the
+MCP server processes. RSS peaks are process-lifetime highs, so they only
+grow from one scenario to the next.
+
+    python benchmarks/pipeline_benchmark.py --backend sqlite --tables 10 1000 --rows 10 1000000
+    python benchmarks/pipeline_benchmark.py --output baseline.json
+    python benchmarks/pipeline_benchmark.py --baseline baseline.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.mock_ollama import MockOllama
+from benchmarks.synthetic import generate_schema
+
+
+def fact_table(schema):
+    table = schema["tables"][0]
+    measures = [col["name"] for col in table["columns"] if col["type"].startswith("numeric")]
+    dims = [col["name"] for col in table["columns"] if col["type"] == "text" and col["name"] != "name"]
+    return table, measures, dims
+
+
+def create_tables_sql(schema):
+    statements = []
+    for table in schema["tables"]:
+        columns = ", ".join(f"{col['name']} {col['type']}" for col in table["columns"])
+        statements.append(f"CREATE TABLE {table['name']} ({columns}, PRIMARY KEY (id))")
+    return statements
+
+
+def populate_sql(schema, num_rows, backend):
+    """One INSERT filling the fact table with ``num_rows`` deterministic rows."""
+    table, measures, dims = fact_table(schema)
+    columns = ["id", "name", "created_at"] + measures + dims
+    if backend == "postgres":
+        source = f"FROM generate_series(1, {num_rows}) AS seq(g)"
+        created_at = "TIMESTAMP '2024-01-01' + g * INTERVAL '1 minute'"
+        prefix = ""
+    else:
+        source = "FROM seq"
+        created_at = "datetime('2024-01-01', '+' || g || ' minutes')"
+        prefix = f"WITH RECURSIVE seq(g) AS (SELECT 1 UNION ALL SELECT g + 1 FROM seq WHERE g < {num_rows}) "
+    values = ["g", "'name ' || g", created_at]
+    values += [f"(g % {997 + i}) * 1.5" for i in range(len(measures))]
+    values += [f"CASE g % {5 + i} WHEN 0 THEN 'north' WHEN 1 THEN 'south' WHEN 2 THEN 'east' ELSE 'west' END"
+               for i in range(len(dims))]
+    return f"INSERT INTO {table['name']} ({', '.join(columns)}) {prefix}SELECT {', '.join(values)} {source}"
+
+
+def build_workload(schema, row_counts):
+    """Canned questions and the SQL the mock LLM answers them with."""
+    table, measures, dims = fact_table(schema)
+    name = table["name"]
+    workload = []
+    for rows in row_counts:
+        workload.append({
+            "key": f"rows={rows}",
+            "question": f"List the first {rows} {name} records",
+            "sql": f"SELECT id, name, created_at, {measures[0]} FROM {name} WHERE id <= {rows};",
+        })
+    workload.append({
+        "key": "aggregate",
+        "question": f"What is the total {measures[0]} per {dims[0]}?",
+        "sql": f"SELECT {dims[0]}, SUM({measures[0]}) AS total FROM {name} GROUP BY {dims[0]} ORDER BY total DESC;",
+    })
+    return workload
+
+
+class PostgresFixture:
+    """A scratch database on the configured server, dropped afterwards."""
+
+    def __init__(self, schema, num_rows):
+        self.schema = schema
+        self.num_rows = num_rows
+        self.name = f"bench_{len(schema['tables'])}_tables"
+        self.original_db = os.getenv("DB_NAME")
+        self.profile = None
+
+    def _connect(self, dbname):
+        import psycopg2
+        conn = psycopg2.connect(
+            host=os.getenv("DB_HOST", "localhost"),
+            port=os.getenv("DB_PORT", "5432"),
+            dbname=dbname,
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD")
+        )
+        conn.autocommit = True
+        return conn
+
+    def _drop(self):
+        conn = self._connect(self.original_db)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP DATABASE IF EXISTS {self.name} WITH (FORCE)")
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._drop()
+        conn = self._connect(self.original_db)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE DATABASE {self.name}")
+        finally:
+            conn.close()
+
+        conn = self._connect(self.name)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(";\n".join(create_tables_sql(self.schema)))
+                cur.execute(populate_sql(self.schema, self.num_rows, "postgres"))
+                cur.execute("ANALYZE")
+        finally:
+            conn.close()
+        from src.database.profiles import default_profile
+
+        # The agent queries the scratch database through a profile override
+        self.profile = default_profile().with_overrides(dbname=self.name)
+        return None
+
+    def __exit__(self, *exc):
+        from src.database.mcp_client import MCPClient
+        from src.database.session_pool import get_session_pool
+
+        # Record the servers' peak RSS before they are stopped
+        self.server_rss_mb = server_peak_rss_mb()
+        get_session_pool(MCPClient().server_script).close()
+        self._drop()
+
+
+class SQLiteFixture:
+    """A temporary SQLite file served through ``SQLiteMCPClient``."""
+
+    def __init__(self, schema, num_rows):
+        self.schema = schema
+        self.num_rows = num_rows
+
+    def __enter__(self):
+        import sqlite3
+        from benchmarks.sqlite_mcp import SQLiteMCPClient
+
+        self._dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self._dir.name, "bench.sqlite")
+        conn = sqlite3.connect(path)
+        try:
+            for statement in create_tables_sql(self.schema):
+                conn.execute(statement)
+            conn.execute(populate_sql(self.schema, self.num_rows, "sqlite"))
+            conn.commit()
+        finally:
+            conn.close()
+        return SQLiteMCPClient(path, self.schema)
+
+    def __exit__(self, *exc):
+        self.server_rss_mb = None
+        self._dir.cleanup()
+
+
+def client_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def server_peak_rss_mb():
+    """Largest peak RSS among this process's children (the MCP servers), Linux only."""
+    peaks = []
+    try:
+        pids = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            if ppid != os.getpid():
+                continue
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peaks.append(int(line.split()[1]) / 1024)
+        except (OSError, ValueError, IndexError):
+            continue
+    return round(max(peaks), 1) if peaks else None
+
+
+def percentile(samples, q):
+    if len(samples) < 2:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+
+def stage_totals(trace):
+    totals = defaultdict(float)
+    for entry in trace:
+        totals[entry["name"]] += entry["duration_ms"]
+    return totals
+
+
+async def run_sequential(agent, item, repeat):
+    latencies, stages, rows = [], defaultdict(list), None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        query_started = time.perf_counter()
+        response = await agent.process_query(item["question"])
+        latencies.append((time.perf_counter() - query_started) * 1000)
+        if "error" in response:
+            raise RuntimeError(f"{item['key']}: {response['error']}")
+        rows = response["row_count"]
+        for name, ms in stage_totals(response["trace"]).items():
+            stages[name].append(ms)
+    elapsed = time.perf_counter() - started
+    return {
+        "key": item["key"],
+        "rows": rows,
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "throughput_qps": round(repeat / elapsed, 2),
+        "stages_p50_ms": {name: round(statistics.median(samples), 1) for name, samples in sorted(stages.items())},
+    }
+
+
+async def run_concurrent(agent, workload, repeat, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def ask(question):
+        async with slots:
+            return await agent.process_query(question)
+
+    questions = [item["question"] for item in workload for _ in range(repeat)]
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(ask(question) for question in questions))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for response in responses if "error" in response)
+    return {"queries": len(questions), "failed": failed, "throughput_qps": round(len(questions) / elapsed, 2)}
+
+
+def run_scenario(args, num_tables, mock):
+    from src.agent.sql_agent import SQLAgent
+
+    schema = generate_schema(num_tables, seed=args.seed)
+    workload = build_workload(schema, args.rows)
+    mock.answers.update({item["question"]: item["sql"] for item in workload})
+
+    fixture_class = PostgresFixture if args.backend == "postgres" else SQLiteFixture
+    fixture = fixture_class(schema, max(args.rows))
+    setup_started = time.perf_counter()
+    with fixture as fake_client:
+        setup_s = time.perf_counter() - setup_started
+        agent = SQLAgent(profile=getattr(fixture, "profile", None))
+        if fake_client is not None:
+            agent.mcp_client = fake_client
+
+        async def run():
+            # One untimed pass warms the session pool and the schema cache
+            await agent.process_query(workload[0]["question"])
+            results = [await run_sequential(agent, item, args.repeat) for item in workload]
+            concurrent = await run_concurrent(agent, workload, args.repeat, args.concurrency)
+            return results, concurrent
+
+        results, concurrent = asyncio.run(run())
+
+    return {
+        "backend": args.backend,
+        "tables": num_tables,
+        "setup_s": round(setup_s, 2),
+        "questions": results,
+        "concurrent": concurrent,
+        "client_peak_rss_mb": client_peak_rss_mb(),
+        "server_peak_rss_mb": fixture.server_rss_mb,
+    }
+
+
+def print_scenario(scenario):
+    print(f"\n{scenario['backend']} · {scenario['tables']} tables (setup {scenario['setup_s']}s)")
+    print(f"{'question':>14} {'rows':>9} {'p50 ms':>9} {'p95 ms':>9} {'q/s':>7}  slowest stages (p50 ms)")
+    for row in scenario["questions"]:
+        slowest = sorted(row["stages_p50_ms"].items(), key=lambda stage: -stage[1])[:4]
+        stages = ", ".join(f"{name} {ms:.0f}" for name, ms in slowest)
+        print(f"{row['key']:>14} {row['rows']:>9,} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['throughput_qps']:>7.2f}  {stages}")
+    concurrent = scenario["concurrent"]
+    print(f"concurrent: {concurrent['queries']} queries, {concurrent['failed']} failed, "
+          f"{concurrent['throughput_qps']:.2f} q/s · peak RSS client {scenario['client_peak_rss_mb']} MB, "
+          f"server {scenario['server_peak_rss_mb']} MB")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a saved baseline and return the number of regressions."""
+    previous = {
+        (scenario["backend"], scenario["tables"], row["key"]): row
+        for scenario in baseline["scenarios"] for row in scenario["questions"]
+    }
+    regressions = 0
+    print(f"\nChanges against baseline (tolerance {tolerance:.0%}):")
+    for scenario in results["scenarios"]:
+        for row in scenario["questions"]:
+            old = previous.get((scenario["backend"], scenario["tables"], row["key"]))
+            if old is None:
+                continue
+            change = row["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+            flag = ""
+            if change > tolerance:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"{scenario['tables']:>6} tables {row['key']:>14}: p50 {old['p50_ms']:.1f} -> "
+                  f"{row['p50_ms']:.1f} ms ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["postgres", "sqlite"], default="sqlite")
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each question")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight for the throughput run")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Mock prompt evaluation time")
+    parser.add_argument("--token-latency-ms", type=float, default=10.0, help="Mock time per generated token")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this path (a baseline for --baseline)")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown before flagging")
+    args = parser.parse_args()
+
+    mock = MockOllama({}, prompt_latency_ms=args.llm_latency_ms, token_latency_ms=args.token_latency_ms).start()
+    os.environ["OLLAMA_HOST"] = mock.url
+    # Measure generation on every run and return the largest results untruncated
+    os.environ.setdefault("SQL_CACHE_ENABLED", "false")
+    os.environ.setdefault("RESULT_MAX_ROWS", str(max(args.rows)))
+    os.environ.setdefault("RESULT_MAX_BYTES", str(4 * 1024 ** 3))
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "scenarios": [],
+    }
+    try:
+        for num_tables in args.tables:
+            scenario = run_scenario(args, num_tables, mock)
+            results["scenarios"].append(scenario)
+            print_scenario(scenario)
+    finally:
+        mock.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
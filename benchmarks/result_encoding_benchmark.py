@@ -0,0 +1,98 @@
+"""
+Benchmark the result wire formats between the MCP server and the client.
+
+For synthetic mixed-type rows (int, numeric, timestamp, timestamptz, text,
+uuid) it reports the serialized payload size and the time spent encoding on
+the server and decoding into a DataFrame on the client for the ``rows``,
+``columns`` and ``arrow`` formats. ``legacy`` is the pre-columnar path:
+RealDictCursor rows serialized by FastMCP and rebuilt with ``pd.DataFrame``.
+
+    python benchmarks/result_encoding_benchmark.py --rows 10000 100000 1000000
+"""
+import argparse
+import datetime
+import decimal
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pandas as pd
+import pydantic_core
+
+from src.database.result_encoding import _pyarrow, decode_page, encode_page, to_json
+
+COLUMNS = ["id", "amount", "ordered_at", "created_at", "status", "ref"]
+TYPES = ["int", "decimal", "timestamp", "timestamptz", "string", "uuid"]
+
+
+def generate_rows(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    statuses = ["pending", "shipped", "delivered", "cancelled"]
+    return [
+        (
+            i,
+            decimal.Decimal(rng.randint(100, 100000)) / 100,
+            start + datetime.timedelta(seconds=rng.randint(0, 365 * 86400)),
+            (start + datetime.timedelta(seconds=i)).replace(tzinfo=datetime.timezone.utc),
+            rng.choice(statuses),
+            uuid.UUID(int=rng.getrandbits(128)),
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_round_trip(rows):
+    started = time.perf_counter()
+    payload = pydantic_core.to_json(
+        {"columns": COLUMNS, "rows": [dict(zip(COLUMNS, row)) for row in rows]}, fallback=str, indent=2
+    )
+    encoded = time.perf_counter()
+    pd.DataFrame(json.loads(payload)["rows"])
+    return len(payload), encoded - started, time.perf_counter() - encoded
+
+
+def round_trip(rows, fmt):
+    started = time.perf_counter()
+    payload = to_json({"columns": COLUMNS, **encode_page(COLUMNS, TYPES, rows, fmt)})
+    encoded = time.perf_counter()
+    decode_page(json.loads(payload), COLUMNS)
+    return len(payload), encoded - started, time.perf_counter() - encoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    formats = ["rows", "columns"] + (["arrow"] if _pyarrow() is not None else [])
+    results = []
+    print(f"{'rows':>9}  {'format':<8} {'payload MB':>10} {'encode s':>9} {'decode s':>9}")
+    for count in args.rows:
+        rows = generate_rows(count, args.seed)
+        measurements = [("legacy", *legacy_round_trip(rows))]
+        measurements += [(fmt, *round_trip(rows, fmt)) for fmt in formats]
+        for fmt, size, encode_secs, decode_secs in measurements:
+            results.append({
+                "rows": count,
+                "format": fmt,
+                "payload_bytes": size,
+                "encode_secs": round(encode_secs, 4),
+                "decode_secs": round(decode_secs, 4),
+            })
+            print(f"{count:>9}  {fmt:<8} {size / 1e6:>10.2f} {encode_secs:>9.3f} {decode_secs:>9.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
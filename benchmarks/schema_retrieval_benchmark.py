@@ -0,0 +1,122 @@
+"""
+Benchmark relevance-pruned schema context against the full schema dump.
+
+Reports prompt size before/after pruning, how often the tables a question
+needs ("gold" tables) survive pruning, and retrieval latency. With ``--llm``
+it also asks the local Ollama model to answer each question with both
+contexts and compares how often the generated SQL parses and references the
+gold tables.
+
+    python benchmarks/schema_retrieval_benchmark.py --tables 10 100 300 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.synthetic import generate_questions, generate_schema
+from src.agent.schema_retriever import SchemaRetriever, estimate_tokens
+from src.llm.prompts import SQL_GENERATION_TEMPLATE, SQL_SYSTEM_PROMPT
+
+
+def legacy_context(schema):
+    """The pre-retrieval prompt context: every table as a repr of column dicts."""
+    context = ""
+    for table in schema["tables"]:
+        columns = [
+            {"column_name": col["name"], "data_type": col["type"], "is_nullable": "YES" if col["nullable"] else "NO"}
+            for col in table["columns"]
+        ]
+        context += f"Table: {table['name']}\nColumns: {columns}\n\n"
+    return context
+
+
+def llm_accuracy(schema, questions, build_context):
+    """Fraction of questions whose generated SQL parses and uses every gold table."""
+    import sqlglot
+    from sqlglot import exp
+    from src.agent.query_validator import QueryValidator
+    from src.llm.ollama_client import OllamaClient
+
+    client = OllamaClient()
+    validator = QueryValidator()
+    correct = 0
+    for item in questions:
+        prompt = SQL_GENERATION_TEMPLATE.format(
+            schema_context=build_context(item["question"]), examples="", user_query=item["question"]
+        )
+        sql = validator.sanitize(client.generate_response(prompt, system_prompt=SQL_SYSTEM_PROMPT))
+        try:
+            tables = {table.name for table in sqlglot.parse_one(sql, read="postgres").find_all(exp.Table)}
+        except Exception:
+            continue
+        if set(item["gold_tables"]) <= tables:
+            correct += 1
+    return correct / len(questions)
+
+
+def run(num_tables, num_questions, retriever, with_llm):
+    schema = generate_schema(num_tables)
+    questions = generate_questions(schema, num_questions)
+    full = legacy_context(schema)
+    full_tokens = estimate_tokens(SQL_GENERATION_TEMPLATE.format(schema_context=full, examples="", user_query=""))
+
+    # Build the index outside the timed loop, as the agent does once per fingerprint
+    retriever.build_context(schema, "warm up")
+
+    pruned_tokens, latencies, recalls, covered = [], [], [], 0
+    for item in questions:
+        started = time.perf_counter()
+        selected = {table["name"] for table in retriever.select_tables(schema, item["question"])}
+        context = retriever.build_context(schema, item["question"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        pruned_tokens.append(estimate_tokens(SQL_GENERATION_TEMPLATE.format(schema_context=context, examples="", user_query="")))
+        in_context = {name for name in selected if f"CREATE TABLE {name} (" in context}
+        hits = len(set(item["gold_tables"]) & in_context)
+        recalls.append(hits / len(item["gold_tables"]))
+        covered += hits == len(item["gold_tables"])
+
+    result = {
+        "tables": num_tables,
+        "questions": num_questions,
+        "full_prompt_tokens": full_tokens,
+        "pruned_prompt_tokens_avg": round(statistics.mean(pruned_tokens), 1),
+        "prompt_reduction_pct": round(100 * (1 - statistics.mean(pruned_tokens) / full_tokens), 1),
+        "gold_table_recall": round(statistics.mean(recalls), 3),
+        "all_gold_tables_included": round(covered / num_questions, 3),
+        "retrieval_ms_p50": round(statistics.median(latencies), 3),
+        "retrieval_ms_max": round(max(latencies), 3),
+    }
+    if with_llm:
+        result["llm_accuracy_full"] = llm_accuracy(schema, questions, lambda q: full)
+        result["llm_accuracy_pruned"] = llm_accuracy(
+            schema, questions, lambda q: retriever.build_context(schema, q)
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 300, 1000])
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--token-budget", type=int, default=None)
+    parser.add_argument("--llm", action="store_true", help="also measure SQL accuracy with the local Ollama model")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    retriever = SchemaRetriever(top_k=args.top_k, token_budget=args.token_budget, mode="bm25")
+    results = [run(n, args.questions, retriever, args.llm) for n in args.tables]
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+A SQLite-backed fake of the MCP client for benchmarks without Postgres.
+
+``SQLiteMCPClient`` exposes the parts of ``MCPClient`` the agent uses
+(``connect``, ``connection_key``, ``get_full_schema``,
+``get_schema_fingerprint`` and ``fetch_dataframe``). Schemas come from
+``benchmarks.synthetic`` and results take the same paged, JSON-encoded
+round trip as the real server, so only the MCP subprocess and Postgres
+itself are left out.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from src.database.mcp_client import ToolError
+from src.database.result_encoding import decode_page, encode_page, to_json
+from src.tracing import record, span
+
+SQLITE_TYPES = {"integer": "int", "text": "string", "timestamp without time zone": "timestamp"}
+
+
+def _logical_type(sql_type: str) -> str:
+    if sql_type.startswith("numeric"):
+        return "decimal"
+    return SQLITE_TYPES.get(sql_type, "string")
+
+
+def _value_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "string"
+
+
+class SQLiteMCPClient:
+    def __init__(self, path: str, schema: Dict[str, Any], result_format: str = "columns"):
+        self.path = path
+        self.schema = schema
+        self.result_format = result_format
+        self.max_rows = int(os.getenv("RESULT_MAX_ROWS", "100000"))
+        self.page_size = int(os.getenv("RESULT_PAGE_SIZE", "5000"))
+        # Column types by name, standing in for the cursor description
+        self._types = {
+            column["name"]: _logical_type(column["type"])
+            for table in schema["tables"] for column in table["columns"]
+        }
+
+    @asynccontextmanager
+    async def connect(self):
+        record("mcp.connect", 0.0, pooled=True)
+        yield self
+
+    @property
+    def connection_key(self) -> Tuple:
+        return ("sqlite", self.path)
+
+    async def get_full_schema(self) -> Dict[str, Any]:
+        return self.schema
+
+    async def get_schema_fingerprint(self) -> str:
+        return self.schema["fingerprint"]
+
+    def _run(self, query: str, page_size: int, max_rows: int) -> List[str]:
+        """Execute ``query`` and return its pages encoded as they would be sent."""
+        conn = sqlite3.connect(self.path)
+        try:
+            with span("server.execute"):
+                cur = conn.execute(query)
+            names = [desc[0] for desc in cur.description]
+            types = None
+            pages, row_count = [], 0
+            while True:
+                with span("server.fetch"):
+                    rows = cur.fetchmany(min(page_size, max_rows + 1 - row_count))
+                row_count += len(rows)
+                truncated = row_count > max_rows
+                if truncated:
+                    rows = rows[:-1]
+                    row_count -= 1
+                if types is None:
+                    first = rows[0] if rows else (None,) * len(names)
+                    types = [self._types.get(name) or _value_type(value) for name, value in zip(names, first)]
+                done = truncated or len(rows) < page_size
+                with span("server.encode"):
+                    page = {
+                        "columns": names, "done": done, "truncated": truncated, "row_count": row_count,
+                        **encode_page(names, types, rows, self.result_format),
+                    }
+                    pages.append(to_json(page))
+                if done:
+                    return pages
+        finally:
+            conn.close()
+
+    async def fetch_dataframe(
+        self, query: str, page_size: Optional[int] = None, max_rows: Optional[int] = None,
+        timeout_ms: Optional[int] = None, fresh: bool = False
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        try:
+            pages = await asyncio.to_thread(self._run, query, page_size or self.page_size, max_rows or self.max_rows)
+        except sqlite3.Error as e:
+            # The real server reports database errors as tool errors
+            raise ToolError(str(e)) from e
+        frames = []
+        meta: Dict[str, Any] = {
+            "pages": len(pages),
+            "cost_guard": None,
+            "result_cache": {"hit": False, "age_seconds": 0.0, "ttl_seconds": 0},
+            "rollup": None,
+        }
+        for text in pages:
+            with span("mcp.json_decode", bytes=len(text)):
+                page = json.loads(text)
+            with span("result.dataframe"):
+                frames.append(decode_page(page, page["columns"]))
+            meta["truncated"] = page["truncated"]
+            meta["row_count"] = page["row_count"]
+        frames = [frame for frame in frames if not frame.empty] or frames[:1]
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        return df, meta
@@ -0,0 +1,167 @@
+"""
+Cold-start profile: import time of each entry point in a fresh interpreter.
+
+Every target is imported ``--repeat`` times in a new ``python -X importtime``
+process, and the median import time, process wall time and the packages
+that took longest to import (self time summed per top-level package) are
+reported. ``mcp_server_ready`` additionally times a spawned MCP server from
+launch to a completed ``initialize`` handshake, the cost paid by every new
+pooled session.
+
+Modules the app loads lazily (plotly.express, sqlglot, mcp, ollama) are
+listed per target; if one of them is imported eagerly again, the run fails.
+
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --output startup.json
+    python benchmarks/startup_benchmark.py --baseline startup.json --tolerance 0.15
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+SERVER_SCRIPT = os.path.join(ROOT, "src", "database", "postgres_mcp_server.py")
+
+# name -> (code run in the fresh interpreter, modules that must not be imported by it)
+TARGETS = {
+    "agent": ("import src.agent.sql_agent", ("mcp", "ollama", "sqlglot", "plotly")),
+    "charts": (
+        "import src.visualisation.plotly_generator, src.visualisation.chart_selector",
+        ("plotly.express", "sqlglot"),
+    ),
+    # Runs the page script up to main(); Streamlit warns about the missing script context
+    "app": (
+        "import runpy; runpy.run_path('app/main.py', run_name='app_main')",
+        ("plotly.express", "sqlglot", "mcp", "ollama"),
+    ),
+    "mcp_server": ("import src.database.postgres_mcp_server", ("pyarrow",)),
+}
+
+
+def parse_importtime(stderr):
+    """Total import ms, self ms per top-level package, and every imported module name."""
+    total_ms = 0.0
+    packages = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            total_ms += int(cumulative) / 1000
+        name = name.strip()
+        modules.add(name)
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1000
+    return total_ms, packages, modules
+
+
+def profile_target(code, forbidden, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if process.returncode != 0:
+            raise RuntimeError(f"'{code}' failed:\n{process.stderr[-2000:]}")
+        import_ms, packages, modules = parse_importtime(process.stderr)
+        runs.append((import_ms, wall_ms, packages, modules))
+
+    runs.sort(key=lambda run: run[0])
+    import_ms, _, packages, modules = runs[len(runs) // 2]
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:6]
+    return {
+        "import_ms": round(import_ms, 1),
+        "wall_ms": round(statistics.median(run[1] for run in runs), 1),
+        "slowest": {name: round(ms, 1) for name, ms in slowest},
+        "eager": sorted(name for name in forbidden if name in modules),
+    }
+
+
+async def server_ready_ms():
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+
+    params = StdioServerParameters(command=sys.executable, args=[SERVER_SCRIPT], env=os.environ.copy())
+    started = time.perf_counter()
+    async with stdio_client(params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            return (time.perf_counter() - started) * 1000
+
+
+def profile_server(repeat):
+    samples = sorted(asyncio.run(server_ready_ms()) for _ in range(repeat))
+    median = round(statistics.median(samples), 1)
+    return {"import_ms": median, "wall_ms": median, "slowest": {}, "eager": []}
+
+
+def print_results(results):
+    print(f"{'target':>18} {'import ms':>10} {'wall ms':>9}  slowest packages (self ms)")
+    for name, row in results["targets"].items():
+        slowest = ", ".join(f"{module} {ms:.0f}" for module, ms in row["slowest"].items())
+        print(f"{name:>18} {row['import_ms']:>10.1f} {row['wall_ms']:>9.1f}  {slowest}")
+        if row["eager"]:
+            print(f"{'':>18} imported eagerly: {', '.join(row['eager'])}")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a saved baseline and return the number of regressions."""
+    regressions = 0
+    print(f"\nChanges against baseline (tolerance {tolerance:.0%}):")
+    for name, row in results["targets"].items():
+        old = baseline["targets"].get(name)
+        if old is None:
+            continue
+        change = row["import_ms"] / old["import_ms"] - 1 if old["import_ms"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{name:>18}: {old['import_ms']:.1f} -> {row['import_ms']:.1f} ms ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=[*TARGETS, "mcp_server_ready"],
+                        default=[*TARGETS, "mcp_server_ready"])
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per target (the median is kept)")
+    parser.add_argument("--output", help="Write the results as JSON to this path (a baseline for --baseline)")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed import time increase before flagging")
+    args = parser.parse_args()
+
+    results = {"config": {"repeat": args.repeat, "python": sys.version.split()[0]}, "targets": {}}
+    for name in args.targets:
+        if name == "mcp_server_ready":
+            results["targets"][name] = profile_server(args.repeat)
+        else:
+            results["targets"][name] = profile_target(*TARGETS[name], args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = sum(1 for row in results["targets"].values() if row["eager"])
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures += compare(results, baseline, args.tolerance)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Seeded synthetic schemas and questions shared by the benchmarks.
+
+Schemas use the same structure as the ``get_full_schema`` MCP tool so they
+can be fed straight into the agent's schema stages.
+"""
+import random
+from typing import Any, Dict, List
+
+DOMAINS = [
+    "sales", "hr", "inventory", "marketing", "finance", "support", "logistics",
+    "billing", "procurement", "analytics", "crm", "payroll", "retail", "web",
+]
+ENTITIES = [
+    "customer", "order", "invoice", "product", "employee", "shipment", "ticket",
+    "campaign", "payment", "supplier", "warehouse", "region", "account", "contract",
+    "store", "session", "refund", "budget", "vendor", "department",
+]
+MEASURES = ["amount", "quantity", "price", "revenue", "cost", "discount", "score", "duration", "weight", "balance"]
+DIMENSIONS = ["status", "category", "channel", "country", "segment", "priority", "currency", "tier"]
+
+
+def generate_schema(num_tables: int, seed: int = 42) -> Dict[str, Any]:
+    """Generate ``num_tables`` tables with columns, keys and FK references."""
+    rng = random.Random(seed)
+    names: List[str] = []
+    for domain in DOMAINS:
+        for entity in ENTITIES:
+            names.append(f"{domain}_{entity}")
+    rng.shuffle(names)
+    suffix = 1
+    while len(names) < num_tables:
+        names += [f"{name}_{suffix}" for name in names[:num_tables - len(names)]]
+        suffix += 1
+    names = names[:num_tables]
+
+    tables = []
+    for i, name in enumerate(names):
+        columns = [
+            {"name": "id", "type": "integer", "nullable": False, "comment": None},
+            {"name": "name", "type": "text", "nullable": True, "comment": None},
+            {"name": "created_at", "type": "timestamp without time zone", "nullable": True, "comment": None},
+        ]
+        for measure in rng.sample(MEASURES, rng.randint(2, 5)):
+            columns.append({"name": measure, "type": "numeric(12,2)", "nullable": True, "comment": None})
+        for dim in rng.sample(DIMENSIONS, rng.randint(1, 3)):
+            columns.append({"name": dim, "type": "text", "nullable": True, "comment": None})
+        foreign_keys = []
+        for ref in rng.sample(names[:i], min(i, rng.randint(0, 2))):
+            column = f"{ref.split('_')[1]}_id"
+            if any(col["name"] == column for col in columns):
+                continue
+            columns.append({"name": column, "type": "integer", "nullable": True, "comment": None})
+            foreign_keys.append({"columns": [column], "ref_table": ref, "ref_columns": ["id"]})
+        tables.append({
+            "name": name,
+            "kind": "table",
+            "comment": f"{name.split('_')[1].title()} records for the {name.split('_')[0]} team",
+            "row_estimate": rng.randint(100, 5_000_000),
+            "columns": columns,
+            "primary_key": ["id"],
+            "foreign_keys": foreign_keys,
+        })
+    return {"fingerprint": f"synthetic-{num_tables}-{seed}", "tables": tables}
+
+
+def generate_questions(schema: Dict[str, Any], count: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Generate questions whose answers need known ("gold") tables."""
+    rng = random.Random(seed)
+    questions = []
+    tables = schema["tables"]
+    for _ in range(count):
+        table = rng.choice(tables)
+        domain, entity = table["name"].split("_")[:2]
+        measures = [col["name"] for col in table["columns"] if col["type"].startswith("numeric")]
+        measure = rng.choice(measures)
+        if table["foreign_keys"] and rng.random() < 0.5:
+            fk = rng.choice(table["foreign_keys"])
+            ref_entity = fk["ref_table"].split("_")[1]
+            questions.append({
+                "question": f"What is the total {measure} of {domain} {entity}s per {ref_entity} name?",
+                "gold_tables": [table["name"], fk["ref_table"]],
+            })
+        else:
+            dims = [col["name"] for col in table["columns"] if col["type"] == "text" and col["name"] != "name"]
+            questions.append({
+                "question": f"Show the average {measure} of {domain} {entity}s by {rng.choice(dims)}",
+                "gold_tables": [table["name"]],
+            })
+    return questions
@@ -0,0 +1,103 @@
+"""
+Microbenchmark SQL validation latency on large generated queries.
+
+Compares the previous two-pass check (a dialect-less ``sqlglot.parse_one``
+in the agent plus the server's upper-cased keyword scan) with the shared
+``analyze_query`` stage, both on a cold parse cache and on a cached parse
+(the agent validated the query, then the result cache, cost guard and
+server reuse it).
+
+    python benchmarks/validation_benchmark.py --ctes 10 50 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import sqlglot
+
+from src.database.query_analysis import analyze_query, parse_statements
+
+LEGACY_FORBIDDEN_KEYWORDS = [
+    "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "TRUNCATE",
+    "CREATE", "GRANT", "REVOKE", "COMMIT", "ROLLBACK"
+]
+
+
+def legacy_validate(query):
+    """The pre-analysis checks: root-node parse, then the server's keyword scan."""
+    sqlglot.parse_one(query)
+    normalized = query.strip().upper()
+    for keyword in LEGACY_FORBIDDEN_KEYWORDS:
+        if normalized.startswith(keyword) or f"; {keyword}" in normalized or f";{keyword}" in normalized:
+            return False
+    return True
+
+
+def generate_query(num_ctes, seed=0):
+    """A reporting-style query: many CTEs with joins, filters and aggregates, unioned at the end."""
+    rng = random.Random(seed)
+    ctes = []
+    for i in range(num_ctes):
+        columns = ", ".join(f"t{i}.col_{rng.randint(0, 40)} AS c{j}" for j in range(8))
+        ctes.append(
+            f"cte_{i} AS (SELECT {columns}, SUM(t{i}.amount) AS total "
+            f"FROM table_{rng.randint(0, 300)} AS t{i} "
+            f"JOIN table_{rng.randint(0, 300)} AS u{i} ON u{i}.id = t{i}.ref_id "
+            f"WHERE t{i}.created_at >= DATE '2024-01-01' AND t{i}.status IN ('a', 'b', 'c') "
+            f"AND t{i}.id IN (SELECT id FROM table_{rng.randint(0, 300)} WHERE flag) "
+            f"GROUP BY {', '.join(f'c{j}' for j in range(8))})"
+        )
+    unions = " UNION ALL ".join(f"SELECT c0, total FROM cte_{i}" for i in range(num_ctes))
+    return f"WITH {', '.join(ctes)} SELECT c0, SUM(total) FROM ({unions}) AS combined GROUP BY c0 ORDER BY 2 DESC LIMIT 100"
+
+
+def time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def cold_analyze(query):
+    parse_statements.cache_clear()
+    analyze_query.cache_clear()
+    analyze_query(query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ctes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'ctes':>5} {'chars':>8} {'legacy ms':>10} {'cold ms':>9} {'cached ms':>10}")
+    for num_ctes in args.ctes:
+        query = generate_query(num_ctes)
+        assert analyze_query(query).ok
+        row = {
+            "ctes": num_ctes,
+            "chars": len(query),
+            "legacy_ms": round(time_ms(lambda: legacy_validate(query), args.repeat), 3),
+            "cold_ms": round(time_ms(lambda: cold_analyze(query), args.repeat), 3),
+            "cached_ms": round(time_ms(lambda: analyze_query(query), args.repeat), 4),
+        }
+        results.append(row)
+        print(f"{num_ctes:>5} {row['chars']:>8} {row['legacy_ms']:>10.2f} {row['cold_ms']:>9.2f} {row['cached_ms']:>10.4f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
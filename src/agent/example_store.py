@@ -0,0 +1,381 @@
+"""
+Few-shot examples for SQL generation, learned from questions answered before.
+
+Every question the agent answers successfully is recorded with its
+validated SQL for the database it ran against. For a new question the most
+similar examples are looked up in a SQLite FTS5 index (BM25 over the same
+stemmed terms the schema retriever uses), so a lookup stays in the
+milliseconds with 100k stored examples, and rendered into the prompt within
+a token budget.
+
+Examples go stale when the schema changes. ``sync_schema`` compares
+per-table signatures with the last schema seen for the database and marks
+the examples that read a changed or dropped table as unverified; they are
+re-checked against the current schema when a lookup picks them and deleted
+if they no longer fit. Beyond ``max_entries`` the least recently used
+examples are evicted.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from src.agent.schema_retriever import estimate_tokens, tokenize
+from src.agent.sql_cache import normalize_question
+
+logger = logging.getLogger("example-store")
+
+# Candidates fetched per requested example, to leave room for duplicates and stale entries
+CANDIDATE_FACTOR = 4
+# Matches ranked in full by BM25; above this, candidates must contain the rarest terms
+MAX_RANKED_POSTINGS = 20000
+# Candidates must contain up to this many of the question's rarest terms
+REQUIRED_TERMS = 3
+# Terms in more than this share of a database's examples are not searched for
+MAX_TERM_SHARE = 0.5
+# Records between checks of the size cap
+EVICT_EVERY = 100
+
+
+def _connection_id(connection: Hashable) -> str:
+    return hashlib.sha256(repr(connection).encode()).hexdigest()[:16]
+
+
+def table_signatures(schema: Dict[str, Any]) -> Dict[str, str]:
+    """A hash of each table's columns, to tell which tables a schema change touched."""
+    return {
+        table["name"]: hashlib.sha256(
+            json.dumps([(col["name"], col["type"]) for col in table["columns"]]).encode()
+        ).hexdigest()[:16]
+        for table in schema["tables"]
+    }
+
+
+class ExampleStore:
+    """
+    Persistent (question, SQL) pairs per database, retrieved as few-shot examples.
+
+    Lookups match the question's terms against an FTS5 index restricted to
+    the database's examples and rank them with BM25; examples with the same
+    SQL are only shown once.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        top_k: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.path = path or os.getenv("EXAMPLES_PATH", os.path.join(".cache", "examples.sqlite"))
+        self.top_k = top_k if top_k is not None else int(os.getenv("EXAMPLES_TOP_K", "3"))
+        self.token_budget = (
+            token_budget if token_budget is not None else int(os.getenv("EXAMPLES_TOKEN_BUDGET", "600"))
+        )
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("EXAMPLES_MAX_ENTRIES", "100000"))
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._records = 0
+
+        self.lookups = 0
+        self.served = 0
+        self.stale = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS examples (
+                    id INTEGER PRIMARY KEY,
+                    connection TEXT NOT NULL,
+                    normalized TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    verified INTEGER NOT NULL DEFAULT 1,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    uses INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (connection, normalized)
+                );
+                CREATE INDEX IF NOT EXISTS examples_last_used ON examples (last_used);
+                CREATE TABLE IF NOT EXISTS example_tables (
+                    example_id INTEGER NOT NULL,
+                    table_name TEXT NOT NULL,
+                    PRIMARY KEY (table_name, example_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS example_tables_example ON example_tables (example_id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS example_terms USING fts5(terms, scope);
+                -- Examples per term and database ('' counts all), kept here because
+                -- fts5vocab counts them by scanning the whole index
+                CREATE TABLE IF NOT EXISTS example_term_docs (
+                    connection TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    docs INTEGER NOT NULL,
+                    PRIMARY KEY (connection, term)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS schema_versions (
+                    connection TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    tables TEXT NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _scope(conn_id: str) -> str:
+        # A single alphanumeric token, so it can be matched in the FTS index
+        return f"c{conn_id}"
+
+    def sync_schema(self, connection: Hashable, schema: Dict[str, Any]):
+        """Mark examples that read tables changed or dropped since the last schema seen for this database."""
+        conn_id = _connection_id(connection)
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT fingerprint, tables FROM schema_versions WHERE connection = ?", (conn_id,)
+            ).fetchone()
+            if row and row[0] == schema["fingerprint"]:
+                return
+            signatures = table_signatures(schema)
+            if row:
+                previous = json.loads(row[1])
+                changed = [name for name, signature in previous.items() if signatures.get(name) != signature]
+                marked = 0
+                for start in range(0, len(changed), 500):
+                    batch = changed[start:start + 500]
+                    marked += db.execute(
+                        "UPDATE examples SET verified = 0 WHERE connection = ? AND verified = 1 AND id IN "
+                        f"(SELECT example_id FROM example_tables WHERE table_name IN ({', '.join('?' * len(batch))}))",
+                        (conn_id, *batch)
+                    ).rowcount
+                if marked:
+                    logger.info(f"Schema changed ({len(changed)} tables), {marked} examples will be re-checked")
+            db.execute(
+                "INSERT OR REPLACE INTO schema_versions (connection, fingerprint, tables) VALUES (?, ?, ?)",
+                (conn_id, schema["fingerprint"], json.dumps(signatures))
+            )
+            db.commit()
+
+    def record(self, connection: Hashable, question: str, sql: str, tables: Iterable[str]):
+        """Store SQL that validated and executed successfully for a question."""
+        normalized = normalize_question(question)
+        terms = " ".join(dict.fromkeys(tokenize(question)))
+        if not terms:
+            return
+        conn_id = _connection_id(connection)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT id FROM examples WHERE connection = ? AND normalized = ?", (conn_id, normalized)
+            ).fetchone()
+            if row:
+                example_id = row[0]
+                db.execute(
+                    "UPDATE examples SET question = ?, sql = ?, verified = 1, last_used = ? WHERE id = ?",
+                    (question, sql, now, example_id)
+                )
+                db.execute("DELETE FROM example_tables WHERE example_id = ?", (example_id,))
+            else:
+                example_id = db.execute(
+                    "INSERT INTO examples (connection, normalized, question, sql, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (conn_id, normalized, question, sql, now, now)
+                ).lastrowid
+                db.execute(
+                    "INSERT INTO example_terms (rowid, terms, scope) VALUES (?, ?, ?)",
+                    (example_id, terms, self._scope(conn_id))
+                )
+                db.executemany(
+                    "INSERT INTO example_term_docs (connection, term, docs) VALUES (?, ?, 1) "
+                    "ON CONFLICT (connection, term) DO UPDATE SET docs = docs + 1",
+                    [(conn_id, term) for term in ["", *terms.split()]]
+                )
+            db.executemany(
+                "INSERT OR IGNORE INTO example_tables (example_id, table_name) VALUES (?, ?)",
+                [(example_id, name) for name in tables]
+            )
+            self._records += 1
+            if self._records % EVICT_EVERY == 0:
+                self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        """Drop the least recently used examples beyond ``max_entries`` (lock held)."""
+        ids = [row[0] for row in db.execute(
+            "SELECT id FROM examples ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+        )]
+        if ids:
+            self._delete(db, ids)
+            logger.info(f"Evicted {len(ids)} least recently used examples")
+
+    @staticmethod
+    def _delete(db: sqlite3.Connection, ids: List[int]):
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            counts: Dict[tuple, int] = {}
+            for conn_id, terms in db.execute(
+                "SELECT e.connection, t.terms FROM examples e JOIN example_terms t ON t.rowid = e.id "
+                f"WHERE e.id IN ({placeholders})", batch
+            ):
+                for term in ["", *terms.split()]:
+                    counts[conn_id, term] = counts.get((conn_id, term), 0) + 1
+            db.executemany(
+                "UPDATE example_term_docs SET docs = docs - ? WHERE connection = ? AND term = ?",
+                [(count, conn_id, term) for (conn_id, term), count in counts.items()]
+            )
+            db.execute(f"DELETE FROM examples WHERE id IN ({placeholders})", batch)
+            db.execute(f"DELETE FROM example_tables WHERE example_id IN ({placeholders})", batch)
+            db.execute(f"DELETE FROM example_terms WHERE rowid IN ({placeholders})", batch)
+
+    def _candidates(self, db: sqlite3.Connection, conn_id: str, terms: List[str], limit: int) -> List[tuple]:
+        """
+        The best BM25 matches for the question's terms (lock held).
+
+        While the terms occur in few enough examples, every match is ranked.
+        In a large store that would score most of it, since nearly every
+        question says "total" or "by", so candidates must then contain all
+        of the rarest informative terms instead, relaxed one term at a time
+        until enough are found.
+        """
+        scope = self._scope(conn_id)
+        placeholders = ", ".join("?" * (len(terms) + 1))
+        frequencies = dict(db.execute(
+            f"SELECT term, docs FROM example_term_docs WHERE connection = ? AND term IN ({placeholders})",
+            (conn_id, "", *terms)
+        ))
+        total = frequencies.pop("", 0)
+        # Numbers are literals: they say nothing about which SQL fits
+        terms = sorted((term for term in terms if frequencies.get(term) and not term.isdigit()), key=frequencies.get)
+        if sum(frequencies[term] for term in terms) <= MAX_RANKED_POSTINGS:
+            levels = [[]]
+        else:
+            # Terms found in most examples are left out altogether
+            terms = [term for term in terms if frequencies[term] <= total * MAX_TERM_SHARE]
+            levels = [terms[:required] for required in range(min(len(terms), REQUIRED_TERMS), 0, -1)]
+        if not terms:
+            return []
+        any_term = " OR ".join(f'"{term}"' for term in terms)
+        rows, seen = [], set()
+        for required in levels:
+            match = f"scope : {scope} AND terms : ({any_term})"
+            if required:
+                all_required = " AND ".join(f'"{term}"' for term in required)
+                match += f" AND terms : ({all_required})"
+            for row in db.execute(
+                "SELECT e.id, e.question, e.sql, e.verified FROM example_terms "
+                "JOIN examples e ON e.id = example_terms.rowid "
+                "WHERE example_terms MATCH ? ORDER BY bm25(example_terms, 1.0, 0.0) LIMIT ?",
+                (match, limit)
+            ):
+                if row[0] not in seen:
+                    seen.add(row[0])
+                    rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+
+    def similar(
+        self, connection: Hashable, question: str, schema: Dict[str, Any], validator, k: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """The ``k`` stored examples most similar to the question that still fit the schema."""
+        k = self.top_k if k is None else k
+        terms = list(dict.fromkeys(tokenize(question)))
+        if k <= 0 or not terms:
+            return []
+        self.lookups += 1
+        with self._lock:
+            rows = self._candidates(self._db(), _connection_id(connection), terms, k * CANDIDATE_FACTOR)
+
+        examples, used, stale, verified = [], [], [], []
+        seen_sql = set()
+        for example_id, example_question, sql, is_verified in rows:
+            if len(examples) == k:
+                break
+            if sql in seen_sql:
+                continue
+            if not is_verified:
+                # Reads a table that changed since the example was recorded
+                if validator.check_schema(sql, schema):
+                    stale.append(example_id)
+                    continue
+                verified.append(example_id)
+            seen_sql.add(sql)
+            examples.append({"question": example_question, "sql": sql})
+            used.append(example_id)
+
+        if used or stale:
+            now = time.time()
+            with self._lock:
+                db = self._db()
+                db.executemany("UPDATE examples SET verified = 1 WHERE id = ?", [(i,) for i in verified])
+                db.executemany(
+                    "UPDATE examples SET last_used = ?, uses = uses + 1 WHERE id = ?", [(now, i) for i in used]
+                )
+                if stale:
+                    self._delete(db, stale)
+                    logger.info(f"Deleted {len(stale)} examples that no longer fit the schema")
+                db.commit()
+        self.served += len(examples)
+        self.stale += len(stale)
+        return examples
+
+    def render(self, examples: List[Dict[str, str]]) -> str:
+        """Examples as prompt text within the token budget, most similar first."""
+        blocks = []
+        used = 0
+        for example in examples:
+            block = f"Question: {example['question']}\nSQL: {example['sql'].rstrip().rstrip(';')};"
+            cost = estimate_tokens(block) + 1
+            if used + cost > self.token_budget:
+                continue
+            blocks.append(block)
+            used += cost
+        if not blocks:
+            return ""
+        return "\nSimilar questions answered before:\n" + "\n\n".join(blocks) + "\n"
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            for table in ("examples", "example_tables", "example_terms", "example_term_docs", "schema_versions"):
+                db.execute(f"DELETE FROM {table}")
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counters for this process plus the number of stored examples."""
+        with self._lock:
+            entries, unverified = self._db().execute(
+                "SELECT COUNT(*), COUNT(*) - COALESCE(SUM(verified), 0) FROM examples"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "unverified": unverified,
+            "lookups": self.lookups,
+            "served": self.served,
+            "stale_deleted": self.stale,
+        }
+
+
+_example_store: Optional[ExampleStore] = None
+_example_store_lock = threading.Lock()
+
+
+def get_example_store() -> ExampleStore:
+    """Return the process-wide example store."""
+    global _example_store
+    with _example_store_lock:
+        if _example_store is None:
+            _example_store = ExampleStore()
+        return _example_store
@@ -1,31 +1,94 @@
+import difflib
 import logging
-import sqlglot
-from sqlglot import exp
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+# sqlglot (through query_analysis) is imported on the first check, not with the agent
+if TYPE_CHECKING:
+    from src.database.query_analysis import QueryAnalysis
 
 logger = logging.getLogger("query-validator")
 
+def _suggestion(name: str, candidates) -> str:
+    match = difflib.get_close_matches(name, list(candidates), n=1, cutoff=0.6)
+    return f' (did you mean "{match[0]}"?)' if match else ""
+
 class QueryValidator:
+    def analyze(self, query: str) -> "QueryAnalysis":
+        """Parse and check the query once; the result carries the AST and tables."""
+        from src.database.query_analysis import analyze_query
+
+        analysis = analyze_query(query)
+        if not analysis.ok:
+            logger.warning(f"Query rejected: {analysis.error}")
+        return analysis
+
     def validate(self, query: str) -> bool:
         """Validate that the query is a safe, read-only SELECT statement."""
+        return self.analyze(query).ok
+
+    def check_schema(self, query: str, schema: Dict[str, Any]) -> List[str]:
+        """
+        Check table and column references against the cached schema.
+
+        Returns Postgres-style error messages (empty when nothing is wrong) so
+        obviously broken SQL can be repaired without a database round trip.
+        Only references that are certainly wrong are reported: unqualified
+        columns are not checked when the query reads from CTEs, subqueries or
+        set-returning functions.
+        """
+        from sqlglot import exp
+        from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+        from src.database.query_analysis import parse_query
+
         try:
-            # Parse the query
-            parsed = sqlglot.parse_one(query)
-            
-            # Check if it's a SELECT statement
-            if not isinstance(parsed, exp.Select):
-                logger.warning(f"Query rejected: Not a SELECT statement. Type: {type(parsed)}")
-                return False
-            
-            # Check for any modification statements (redundant if we check root type, but good for subqueries)
-            # Actually, sqlglot parse_one returns the root expression. 
-            # If it's a Select, it shouldn't be a Delete/Update.
-            # But we should check for CTEs or other structures that might hide things?
-            # For now, strictly enforcing root node is SELECT is a good start.
-            
-            return True
+            expression = parse_query(query)
         except Exception as e:
-            logger.error(f"Query validation failed: {e}")
-            return False
+            return [f"syntax error: {str(e).splitlines()[0]}"]
+        # The parsed tree is shared through the parse cache, so normalize a copy
+        expression = normalize_identifiers(expression.copy(), dialect="postgres")
+
+        columns_by_table = {table["name"]: {col["name"] for col in table["columns"]} for table in schema["tables"]}
+        ctes = {cte.alias_or_name for cte in expression.find_all(exp.CTE)}
+        errors = []
+        sources: Dict[str, Optional[str]] = {}
+        derived = any(True for _ in expression.find_all(exp.Subquery, exp.Unnest, exp.Lateral, exp.Values))
+
+        for table in expression.find_all(exp.Table):
+            name = table.name
+            if not isinstance(table.this, exp.Identifier) or name in ctes or table.db not in ("", "public"):
+                # Functions, CTEs and other schemas are not in the cached schema
+                sources[table.alias_or_name] = None
+                derived = True
+            elif name not in columns_by_table:
+                errors.append(f'relation "{name}" does not exist{_suggestion(name, columns_by_table)}')
+                sources[table.alias_or_name] = None
+                derived = True
+            else:
+                sources[table.alias_or_name] = name
+        for subquery in expression.find_all(exp.Subquery):
+            if subquery.alias:
+                sources[subquery.alias] = None
+
+        aliases = {alias.alias for alias in expression.find_all(exp.Alias)}
+        for table_alias in expression.find_all(exp.TableAlias):
+            aliases.update(col.name for col in table_alias.columns)
+        known = set().union(*(columns_by_table[name] for name in sources.values() if name))
+
+        for column in expression.find_all(exp.Column):
+            if isinstance(column.this, exp.Star):
+                continue
+            name = column.name
+            if column.table:
+                if column.table not in sources:
+                    errors.append(f'missing FROM-clause entry for table "{column.table}"')
+                elif sources[column.table] and name not in columns_by_table[sources[column.table]]:
+                    columns = columns_by_table[sources[column.table]]
+                    errors.append(f'column {column.table}.{name} does not exist{_suggestion(name, columns)}')
+            elif not derived and name not in known and name not in aliases:
+                errors.append(f'column "{name}" does not exist{_suggestion(name, known)}')
+        return errors
 
     def sanitize(self, query: str) -> str:
         """Clean up the query string."""
@@ -36,3 +99,46 @@ class QueryValidator:
         if clean_query.endswith(";"):
             clean_query = clean_query[:-1]
         return clean_query
+
+    def complete_statement(self, text: str) -> Optional[str]:
+        """
+        Return ``text`` up to the end of its first statement once that
+        statement is complete, otherwise None. A statement ends at a semicolon
+        outside quotes and comments, or at a closing markdown fence. Lets the
+        LLM stream be cut off as soon as the SQL is written.
+        """
+        if text.lstrip().startswith("ERROR:") and "\n" in text.lstrip():
+            return text.lstrip().split("\n", 1)[0]
+
+        fenced = re.match(r"\s*```[a-zA-Z]*\n", text)
+        i = fenced.end() if fenced else 0
+        quote = None
+        while i < len(text):
+            ch = text[i]
+            if quote == "--":
+                if ch == "\n":
+                    quote = None
+            elif quote == "/*":
+                if text.startswith("*/", i):
+                    quote = None
+                    i += 1
+            elif quote:
+                if text.startswith(quote, i):
+                    i += len(quote) - 1
+                    quote = None
+            elif ch in ("'", '"'):
+                quote = ch
+            elif text.startswith("--", i) or text.startswith("/*", i):
+                quote = text[i:i + 2]
+                i += 1
+            elif ch == "$":
+                tag = re.match(r"\$[A-Za-z_]*\$", text[i:])
+                if tag:
+                    quote = tag.group(0)
+                    i += len(quote) - 1
+            elif ch == ";":
+                return text[:i + 1]
+            elif fenced and text.startswith("```", i):
+                return text[:i + 3]
+            i += 1
+        return None
@@ -0,0 +1,264 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("schema-retriever")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Tables joined to a relevant table inherit this fraction of its score, so
+# lookup tables needed for joins make it into the prompt.
+FK_NEIGHBOR_DECAY = 0.5
+
+# Term weights per field of a table document
+TABLE_NAME_WEIGHT = 3
+COLUMN_NAME_WEIGHT = 1
+COMMENT_WEIGHT = 1
+NEIGHBOR_NAME_WEIGHT = 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    """Split identifiers and prose into normalized search terms."""
+    if not text:
+        return []
+    # Split camelCase before lowercasing, then break on anything non-alphanumeric
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    terms = []
+    for word in re.split(r"[^a-zA-Z0-9]+", text.lower()):
+        if len(word) < 2:
+            continue
+        # Light plural stemming so "customers" matches "customer"
+        if word.endswith("ies") and len(word) > 4:
+            word = word[:-3] + "y"
+        elif word.endswith("ses") and len(word) > 4:
+            word = word[:-2]
+        elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def render_table_ddl(table: Dict[str, Any], max_columns: Optional[int] = None) -> str:
+    """Render one table as a single compact CREATE TABLE line."""
+    pk = table.get("primary_key") or []
+    single_fks = {
+        fk["columns"][0]: fk for fk in table.get("foreign_keys") or [] if len(fk["columns"]) == 1
+    }
+    columns = table["columns"] if max_columns is None else table["columns"][:max_columns]
+
+    parts = []
+    for col in columns:
+        part = f"{col['name']} {col['type']}"
+        if len(pk) == 1 and col["name"] == pk[0]:
+            part += " PRIMARY KEY"
+        fk = single_fks.get(col["name"])
+        if fk:
+            part += f" REFERENCES {fk['ref_table']}({fk['ref_columns'][0]})"
+        parts.append(part)
+    if max_columns is not None and len(table["columns"]) > max_columns:
+        parts.append(f"/* {len(table['columns']) - max_columns} more columns */")
+    if len(pk) > 1:
+        parts.append(f"PRIMARY KEY ({', '.join(pk)})")
+    for fk in table.get("foreign_keys") or []:
+        if len(fk["columns"]) > 1:
+            parts.append(
+                f"FOREIGN KEY ({', '.join(fk['columns'])}) "
+                f"REFERENCES {fk['ref_table']}({', '.join(fk['ref_columns'])})"
+            )
+
+    ddl = f"CREATE TABLE {table['name']} ({', '.join(parts)});"
+    notes = []
+    if table.get("row_estimate") is not None:
+        notes.append(f"~{table['row_estimate']} rows")
+    if table.get("comment"):
+        notes.append(table["comment"])
+    if notes:
+        ddl += f" -- {'; '.join(notes)}"
+    return ddl
+
+
+class _SchemaIndex:
+    """BM25 index over table documents plus the FK adjacency graph."""
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.tables = schema["tables"]
+        self.names = [table["name"] for table in self.tables]
+        self.neighbors: Dict[str, set] = {name: set() for name in self.names}
+        for table in self.tables:
+            for fk in table.get("foreign_keys") or []:
+                if fk["ref_table"] in self.neighbors:
+                    self.neighbors[table["name"]].add(fk["ref_table"])
+                    self.neighbors[fk["ref_table"]].add(table["name"])
+
+        self.doc_terms: List[Counter] = []
+        for table in self.tables:
+            terms = Counter()
+            for term in tokenize(table["name"]):
+                terms[term] += TABLE_NAME_WEIGHT
+            for col in table["columns"]:
+                for term in tokenize(col["name"]):
+                    terms[term] += COLUMN_NAME_WEIGHT
+                for term in tokenize(col.get("comment") or ""):
+                    terms[term] += COMMENT_WEIGHT
+            for term in tokenize(table.get("comment") or ""):
+                terms[term] += COMMENT_WEIGHT
+            for neighbor in self.neighbors[table["name"]]:
+                for term in tokenize(neighbor):
+                    terms[term] += NEIGHBOR_NAME_WEIGHT
+            self.doc_terms.append(terms)
+
+        self.doc_lengths = [sum(terms.values()) for terms in self.doc_terms]
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        doc_freq = Counter()
+        for terms in self.doc_terms:
+            doc_freq.update(terms.keys())
+        n = len(self.tables)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()
+        }
+        self.embeddings = None
+        self.full_tokens = sum(estimate_tokens(render_table_ddl(table)) + 1 for table in self.tables)
+
+    def bm25(self, query: str) -> List[float]:
+        query_terms = set(tokenize(query))
+        scores = []
+        for terms, length in zip(self.doc_terms, self.doc_lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term)
+                if not tf:
+                    continue
+                norm = K1 * (1 - B + B * length / self.avg_length)
+                score += self.idf[term] * tf * (K1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def document(self, i: int) -> str:
+        """Text used to embed a table."""
+        return render_table_ddl(self.tables[i])
+
+
+# Indexes are kept for the few most recently seen schema fingerprints
+MAX_CACHED_INDEXES = 8
+_indexes: Dict[str, _SchemaIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+class SchemaRetriever:
+    """
+    Selects the tables relevant to a question and renders them as compact DDL.
+
+    Tables are ranked with BM25 over table/column names, comments and FK
+    neighbour names (optionally blended with Ollama embeddings), expanded
+    along foreign keys, capped at ``top_k`` and rendered until the token
+    budget is spent. Indexes are built once per schema fingerprint.
+    """
+
+    def __init__(
+        self,
+        top_k: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        mode: Optional[str] = None,
+        llm_client=None,
+    ):
+        self.top_k = top_k if top_k is not None else int(os.getenv("SCHEMA_TOP_K", "8"))
+        self.token_budget = (
+            token_budget if token_budget is not None else int(os.getenv("SCHEMA_TOKEN_BUDGET", "2000"))
+        )
+        # "bm25" (default) or "hybrid" (BM25 + Ollama embeddings)
+        self.mode = (mode or os.getenv("SCHEMA_RETRIEVAL", "bm25")).lower()
+        self.llm_client = llm_client
+
+    def _get_index(self, schema: Dict[str, Any]) -> _SchemaIndex:
+        key = schema.get("fingerprint") or str(id(schema))
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _SchemaIndex(schema)
+                if len(_indexes) >= MAX_CACHED_INDEXES:
+                    _indexes.pop(next(iter(_indexes)))
+                _indexes[key] = index
+            return index
+
+    def _embedding_scores(self, index: _SchemaIndex, query: str) -> Optional[List[float]]:
+        if self.llm_client is None:
+            return None
+        try:
+            import numpy as np
+
+            if index.embeddings is None:
+                docs = self.llm_client.embed([index.document(i) for i in range(len(index.tables))])
+                matrix = np.asarray(docs, dtype=np.float32)
+                index.embeddings = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+            vector = np.asarray(self.llm_client.embed([query])[0], dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-9)
+            return (index.embeddings @ vector).tolist()
+        except Exception as e:
+            logger.warning(f"Embedding retrieval unavailable, using BM25 only: {e}")
+            return None
+
+    def rank(self, schema: Dict[str, Any], query: str) -> List[Tuple[str, float]]:
+        """Score every table for the question, including FK neighbour expansion."""
+        index = self._get_index(schema)
+        scores = index.bm25(query)
+        top = max(scores) if scores else 0.0
+        if top > 0:
+            scores = [score / top for score in scores]
+
+        if self.mode == "hybrid":
+            semantic = self._embedding_scores(index, query)
+            if semantic is not None:
+                scores = [0.5 * lexical + 0.5 * max(sim, 0.0) for lexical, sim in zip(scores, semantic)]
+
+        by_name = dict(zip(index.names, scores))
+        expanded = dict(by_name)
+        for name, score in by_name.items():
+            for neighbor in index.neighbors[name]:
+                expanded[neighbor] = max(expanded[neighbor], score * FK_NEIGHBOR_DECAY)
+
+        if not any(expanded.values()):
+            # No lexical overlap at all: prefer well-connected tables
+            expanded = {name: len(index.neighbors[name]) * 1e-3 for name in index.names}
+        return sorted(expanded.items(), key=lambda item: item[1], reverse=True)
+
+    def select_tables(self, schema: Dict[str, Any], query: str) -> List[Dict[str, Any]]:
+        """Return the tables to include in the prompt, most relevant first."""
+        tables = schema["tables"]
+        index = self._get_index(schema)
+        # Small schemas fit whole; pruning them only risks dropping a needed table
+        if self.top_k <= 0 or (len(tables) <= self.top_k and index.full_tokens <= self.token_budget):
+            return tables
+        by_name = {table["name"]: table for table in tables}
+        ranked = self.rank(schema, query)
+        return [by_name[name] for name, _ in ranked[:self.top_k]]
+
+    def build_context(self, schema: Dict[str, Any], query: str) -> str:
+        """Render the selected tables as DDL within the token budget."""
+        lines = []
+        used = 0
+        for table in self.select_tables(schema, query):
+            ddl = render_table_ddl(table)
+            cost = estimate_tokens(ddl) + 1
+            if used + cost > self.token_budget:
+                if lines:
+                    break
+                # Always include the best table, trimming columns to fit
+                max_columns = len(table["columns"])
+                while max_columns > 1 and used + cost > self.token_budget:
+                    max_columns = max_columns // 2
+                    ddl = render_table_ddl(table, max_columns=max_columns)
+                    cost = estimate_tokens(ddl) + 1
+            lines.append(ddl)
+            used += cost
+        return "\n".join(lines)
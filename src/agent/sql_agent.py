@@ -1,63 +1,400 @@
 import logging
 import asyncio
-from typing import Dict, Any, List, Optional
+import contextlib
+import importlib
+import os
+import threading
+import time
+from typing import Dict, Any, Hashable, List, Optional, Callable, Awaitable, Sequence, Tuple
 
-from src.database.mcp_client import MCPClient
-from src.llm.ollama_client import OllamaClient
+from src.database.mcp_client import MCPClient, ToolError
+from src.database.profiles import ConnectionProfile
+from src.database.schema_cache import get_schema_cache
+from src.database.session_pool import get_session_pool
+from src.llm.ollama_client import OllamaClient, SQL_STOP_SEQUENCES
 from src.llm.prompts import SQL_SYSTEM_PROMPT, SQL_GENERATION_TEMPLATE, ERROR_CORRECTION_TEMPLATE
+from src.agent.example_store import get_example_store
 from src.agent.query_validator import QueryValidator
+from src.agent.schema_retriever import SchemaRetriever
+from src.agent.sql_cache import get_sql_cache
+from src.tracing import span, start_trace
 
 logger = logging.getLogger("sql-agent")
 
 class SQLAgent:
-    def __init__(self):
-        self.mcp_client = MCPClient()
-        self.llm_client = OllamaClient()
+    def __init__(
+        self,
+        profile: Optional[ConnectionProfile] = None,
+        model: Optional[str] = None,
+        tenant: Optional[str] = None
+    ):
+        # Per-session settings: which database, which model, and who to queue as for MCP sessions
+        self.mcp_client = MCPClient(profile=profile, tenant=tenant)
+        self.llm_client = OllamaClient(model=model)
         self.validator = QueryValidator()
+        self.schema_cache = get_schema_cache()
+        self.schema_retriever = SchemaRetriever(llm_client=self.llm_client)
+        self.sql_cache = (
+            get_sql_cache(self.llm_client)
+            if os.getenv("SQL_CACHE_ENABLED", "true").lower() == "true" else None
+        )
+        # Past answers for this database, shown to the LLM as few-shot examples
+        self.examples = get_example_store() if os.getenv("EXAMPLES_ENABLED", "true").lower() == "true" else None
+        # Corrections of failed SQL per question, and the time allowed for them
+        self.max_repairs = int(os.getenv("SQL_REPAIR_MAX_ATTEMPTS", "2"))
+        self.repair_budget = float(os.getenv("SQL_REPAIR_BUDGET_SECS", "30"))
 
-    async def process_query(self, user_query: str) -> Dict[str, Any]:
+    async def _generate_sql(
+        self,
+        prompt: str,
+        on_sql_token: Optional[Callable[[str], None]] = None,
+        llm_slots: Optional[asyncio.Semaphore] = None
+    ) -> str:
+        """Stream SQL from the LLM, stopping as soon as one complete statement is in."""
+        on_token = None
+        if on_sql_token:
+            on_token = lambda text: on_sql_token(self.validator.sanitize(text))
+        async with llm_slots or contextlib.nullcontext():
+            generated_sql = await self.llm_client.stream_response(
+                prompt,
+                system_prompt=SQL_SYSTEM_PROMPT,
+                on_token=on_token,
+                stop_when=self.validator.complete_statement,
+                stop=SQL_STOP_SEQUENCES
+            )
+        return self.validator.sanitize(generated_sql)
+
+    async def _load_schema(self, mcp) -> Dict[str, Any]:
+        """Fetch the (cached) schema and drop cached SQL written for an older one."""
+        with span("agent.schema"):
+            schema = await self.schema_cache.get(mcp)
+        if self.sql_cache is not None:
+            try:
+                await asyncio.to_thread(self.sql_cache.sync_schema, mcp.connection_key, schema["fingerprint"])
+            except Exception as e:
+                logger.warning(f"SQL cache unavailable: {e}")
+        if self.examples is not None:
+            try:
+                await asyncio.to_thread(self.examples.sync_schema, mcp.connection_key, schema)
+            except Exception as e:
+                logger.warning(f"Example store unavailable: {e}")
+        return schema
+
+    async def _schema_context(self, schema: Dict[str, Any], user_query: str) -> str:
+        """The prompt's schema DDL; hybrid retrieval embeds with blocking Ollama calls, so it runs in a thread."""
+        if self.schema_retriever.mode == "hybrid":
+            return await asyncio.to_thread(self.schema_retriever.build_context, schema, user_query)
+        return self.schema_retriever.build_context(schema, user_query)
+
+    async def _examples_context(self, user_query: str, schema: Dict[str, Any]) -> str:
+        """Similar past questions and their SQL, rendered for the prompt (searched in a thread)."""
+        if self.examples is None:
+            return ""
+
+        def lookup():
+            examples = self.examples.similar(self.mcp_client.connection_key, user_query, schema, self.validator)
+            return len(examples), self.examples.render(examples)
+
+        try:
+            with span("agent.examples") as attributes:
+                attributes["examples"], rendered = await asyncio.to_thread(lookup)
+                return rendered
+        except Exception as e:
+            logger.warning(f"Example store unavailable: {e}")
+            return ""
+
+    async def warm_up(self) -> Dict[str, Any]:
+        """
+        Pay the cold-start costs before the first question: load the model
+        into Ollama, start the pooled MCP servers, prime the schema cache and
+        import the SQL parser. The steps run concurrently and fail
+        independently; returns each step's duration in ms, or its error.
+        """
+        async def sessions():
+            if self.mcp_client.use_pool:
+                await get_session_pool(self.mcp_client.server_script).warm_up()
+            async with self.mcp_client.connect() as mcp:
+                await self._load_schema(mcp)
+
+        steps = {
+            "llm": self.llm_client.preload(),
+            "mcp": sessions(),
+            # Runs in a thread so the import overlaps the network waits
+            "parser": asyncio.to_thread(self.validator.validate, "SELECT 1"),
+        }
+
+        async def timed(name, step):
+            started = time.perf_counter()
+            try:
+                with span(f"warmup.{name}"):
+                    await step
+            except Exception as e:
+                logger.warning(f"Warm-up step '{name}' failed: {e}")
+                return name, str(e)
+            return name, round((time.perf_counter() - started) * 1000, 1)
+
+        return dict(await asyncio.gather(*(timed(name, step) for name, step in steps.items())))
+
+    async def process_query(
+        self, user_query: str, on_sql_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         Process a natural language query and return the results.
+
+        ``on_sql_token`` is called with the partial SQL as the LLM streams it.
+        Failing SQL is fed back to the LLM with the error for up to
+        ``max_repairs`` corrections within ``repair_budget`` seconds; every
+        attempt is timed and reported under "attempts". Spans for every stage
+        are returned under "trace".
+        """
+        with start_trace() as trace:
+            async with self.mcp_client.connect() as mcp:
+                # 1. Fetch Schema Context
+                try:
+                    schema = await self._load_schema(mcp)
+                except Exception as e:
+                    logger.error(f"Failed to fetch schema: {e}")
+                    return {"error": "Failed to retrieve database schema.", "trace": trace.breakdown()}
+
+                response = await self._answer(user_query, schema, mcp.fetch_dataframe, on_sql_token)
+            response["trace"] = trace.breakdown()
+            return response
+
+    async def run_sql(
+        self, sql: str, max_rows: Optional[int] = None, fresh: bool = False
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Execute SQL that was not written by the LLM (e.g. a chart aggregation
+        over an earlier answer or a live panel's delta query), after the same
+        read-only check. ``fresh`` skips the server's result cache and rollups.
         """
+        if not self.validator.validate(sql):
+            raise ValueError("Only a single read-only SELECT statement is allowed.")
         async with self.mcp_client.connect() as mcp:
-            # 1. Fetch Schema Context
+            return await mcp.fetch_dataframe(sql, max_rows=max_rows, fresh=fresh)
+
+    async def process_batch(
+        self,
+        questions: List[str],
+        on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+        llm_concurrency: Optional[int] = None,
+        query_concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer several questions concurrently, e.g. the panels of a dashboard.
+
+        The schema is fetched once for the whole batch. LLM generations and
+        query executions are bounded separately (BATCH_LLM_CONCURRENCY and
+        BATCH_QUERY_CONCURRENCY); each execution borrows its own pooled MCP
+        session. ``on_result(index, response)`` is called as each question
+        finishes, and responses are returned in question order.
+        """
+        llm_slots = asyncio.Semaphore(llm_concurrency or int(os.getenv("BATCH_LLM_CONCURRENCY", "2")))
+        query_slots = asyncio.Semaphore(query_concurrency or int(os.getenv("BATCH_QUERY_CONCURRENCY", "4")))
+
+        try:
+            async with self.mcp_client.connect() as mcp:
+                schema = await self._load_schema(mcp)
+        except Exception as e:
+            logger.error(f"Failed to fetch schema: {e}")
+            responses = [{"error": "Failed to retrieve database schema."} for _ in questions]
+            if on_result:
+                for i, response in enumerate(responses):
+                    on_result(i, response)
+            return responses
+
+        async def execute(sql: str):
+            async with query_slots:
+                async with self.mcp_client.connect() as mcp:
+                    return await mcp.fetch_dataframe(sql)
+
+        async def answer(i: int, question: str) -> Dict[str, Any]:
+            with start_trace(new=True) as trace:
+                try:
+                    response = await self._answer(question, schema, execute, llm_slots=llm_slots)
+                except Exception as e:
+                    logger.error(f"Batch question {i} failed: {e}")
+                    response = {"error": str(e)}
+                response["trace"] = trace.breakdown()
+            if on_result:
+                on_result(i, response)
+            return response
+
+        return list(await asyncio.gather(*(answer(i, question) for i, question in enumerate(questions))))
+
+    async def _answer(
+        self,
+        user_query: str,
+        schema: Dict[str, Any],
+        execute: Callable[[str], Awaitable[Tuple[Any, Dict[str, Any]]]],
+        on_sql_token: Optional[Callable[[str], None]] = None,
+        llm_slots: Optional[asyncio.Semaphore] = None
+    ) -> Dict[str, Any]:
+        """Generate, check, execute and repair SQL for one question."""
+        timings = {"generate_ms": 0.0, "execute_ms": 0.0}
+        answer_started = time.perf_counter()
+
+        # 2. Generate SQL, unless an equivalent question was answered before
+        fingerprint = schema["fingerprint"]
+        cached = None
+        if self.sql_cache is not None:
             try:
-                tables = await mcp.list_tables()
-                schema_context = ""
-                for table in tables:
-                    schema = await mcp.get_schema(table)
-                    schema_context += f"Table: {table}\nColumns: {schema}\n\n"
+                with span("agent.sql_cache"):
+                    cached = await asyncio.to_thread(
+                        self.sql_cache.lookup, user_query, self.llm_client.model, fingerprint, self.validator
+                    )
             except Exception as e:
-                logger.error(f"Failed to fetch schema: {e}")
-                return {"error": "Failed to retrieve database schema."}
+                logger.warning(f"SQL cache unavailable: {e}")
 
-            # 2. Generate SQL
+        schema_context = None
+        started = time.perf_counter()
+        if cached:
+            cleaned_sql = cached["sql"]
+        else:
+            with span("agent.schema_context"):
+                schema_context = await self._schema_context(schema, user_query)
             prompt = SQL_GENERATION_TEMPLATE.format(
                 schema_context=schema_context,
+                examples=await self._examples_context(user_query, schema),
                 user_query=user_query
             )
-            
             try:
-                generated_sql = self.llm_client.generate_response(prompt, system_prompt=SQL_SYSTEM_PROMPT)
-                cleaned_sql = self.validator.sanitize(generated_sql)
+                cleaned_sql = await self._generate_sql(prompt, on_sql_token, llm_slots)
             except Exception as e:
                 logger.error(f"LLM generation failed: {e}")
                 return {"error": "Failed to generate SQL query."}
+            timings["generate_ms"] += (time.perf_counter() - started) * 1000
+
+        # 3. Validate and execute, repairing failed SQL on the same session
+        deadline = time.monotonic() + self.repair_budget
+        attempts = []
+        while True:
+            error = None
+            stage = "ok"
+            # Cheap local checks first, so broken SQL never reaches the database
+            with span("agent.validate"):
+                if not self.validator.validate(cleaned_sql):
+                    error, stage = "Only a single read-only SELECT statement is allowed.", "unsafe"
+                else:
+                    problems = self.validator.check_schema(cleaned_sql, schema)
+                    if problems:
+                        error, stage = "; ".join(problems), "schema"
+            if error is None:
+                execute_started = time.perf_counter()
+                try:
+                    with span("agent.execute"):
+                        results, meta = await execute(cleaned_sql)
+                except ToolError as e:
+                    # Tool errors carry the Postgres message; transport and pool failures are not repairable
+                    error, stage = str(e).strip(), "database"
+                except Exception as e:
+                    logger.error(f"Query execution failed: {e}")
+                    return {"error": f"Database error: {str(e)}", "sql": cleaned_sql, "attempts": attempts}
+                finally:
+                    timings["execute_ms"] += (time.perf_counter() - execute_started) * 1000
 
-            # 3. Validate SQL
-            if not self.validator.validate(cleaned_sql):
-                return {"error": "Generated SQL was invalid or unsafe.", "sql": cleaned_sql}
+            attempts.append({
+                "sql": cleaned_sql,
+                "source": "cache" if cached and not attempts else ("llm" if not attempts else "repair"),
+                "stage": stage,
+                "error": error,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+            })
+            if error is None:
+                break
+            logger.warning(f"Attempt {len(attempts)} failed ({stage}): {error}")
 
-            # 4. Execute SQL
+            remaining = deadline - time.monotonic()
+            if len(attempts) > self.max_repairs or remaining <= 0:
+                if stage == "unsafe":
+                    return {"error": "Generated SQL was invalid or unsafe.", "sql": cleaned_sql, "attempts": attempts}
+                if stage == "schema":
+                    return {"error": f"Generated SQL was invalid: {error}", "sql": cleaned_sql, "attempts": attempts}
+                return {"error": f"Database error: {error}", "sql": cleaned_sql, "attempts": attempts}
+
+            if schema_context is None:
+                schema_context = await self._schema_context(schema, user_query)
+            prompt = ERROR_CORRECTION_TEMPLATE.format(
+                schema_context=schema_context,
+                user_query=user_query,
+                previous_sql=cleaned_sql,
+                error_message=error
+            )
+            started = time.perf_counter()
             try:
-                results = await mcp.execute_query(cleaned_sql)
-                return {
-                    "success": True,
-                    "sql": cleaned_sql,
-                    "results": results,
-                    "columns": list(results[0].keys()) if results else []
-                }
+                cleaned_sql = await asyncio.wait_for(self._generate_sql(prompt, on_sql_token, llm_slots), remaining)
             except Exception as e:
-                # Optional: Implement retry with error correction here
-                logger.error(f"Query execution failed: {e}")
-                return {"error": f"Database error: {str(e)}", "sql": cleaned_sql}
+                logger.error(f"SQL repair failed: {e}")
+                return {"error": f"Database error: {error}", "sql": cleaned_sql, "attempts": attempts}
+            timings["generate_ms"] += (time.perf_counter() - started) * 1000
+
+        if self.sql_cache is not None and (not cached or len(attempts) > 1):
+            try:
+                await asyncio.to_thread(
+                    self.sql_cache.store, user_query, self.llm_client.model, fingerprint, cleaned_sql
+                )
+            except Exception as e:
+                logger.warning(f"Failed to cache SQL: {e}")
+        # Empty results are weak evidence that the SQL answers the question
+        if self.examples is not None and not results.empty:
+            try:
+                tables = self.validator.analyze(cleaned_sql).tables
+                await asyncio.to_thread(
+                    self.examples.record, self.mcp_client.connection_key, user_query, cleaned_sql, tables
+                )
+            except Exception as e:
+                logger.warning(f"Failed to record example: {e}")
+
+        timings = {name: round(ms, 1) for name, ms in timings.items()}
+        timings["total_ms"] = round((time.perf_counter() - answer_started) * 1000, 1)
+        return {
+            "success": True,
+            "sql": cleaned_sql,
+            "results": results,
+            "columns": list(results.columns),
+            "row_count": meta["row_count"],
+            "truncated": meta["truncated"],
+            "cost_guard": meta["cost_guard"],
+            "attempts": attempts,
+            "timings": timings,
+            "sql_cache": cached if cached and len(attempts) == 1 else {"match": None},
+            "result_cache": meta["result_cache"],
+            "rollup": meta.get("rollup")
+        }
+
+
+_warm_ups: Dict[Hashable, threading.Thread] = {}
+_warm_ups_lock = threading.Lock()
+
+
+def start_warm_up(
+    profile: Optional[ConnectionProfile] = None,
+    model: Optional[str] = None,
+    modules: Sequence[str] = ()
+) -> Optional[threading.Thread]:
+    """
+    Warm up an agent for this profile and model in a background thread, once
+    per process, then import ``modules`` (e.g. the charting library) so the
+    first answer does not wait for them. Returns the thread, or None when
+    WARM_UP_ENABLED is off.
+    """
+    if os.getenv("WARM_UP_ENABLED", "true").lower() != "true":
+        return None
+    agent = SQLAgent(profile=profile, model=model)
+    key = (agent.mcp_client.connection_key, agent.llm_client.model)
+
+    def run():
+        timings = asyncio.run(agent.warm_up())
+        for module in modules:
+            started = time.perf_counter()
+            importlib.import_module(module)
+            timings[module] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Warm-up finished: {timings}")
+
+    with _warm_ups_lock:
+        thread = _warm_ups.get(key)
+        if thread is None:
+            thread = threading.Thread(target=run, name="agent-warm-up", daemon=True)
+            thread.start()
+            _warm_ups[key] = thread
+        return thread
@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+logger = logging.getLogger("sql-cache")
+
+
+def normalize_question(question: str) -> str:
+    """Canonicalize a question so trivially different phrasings share a key."""
+    text = question.lower().replace("’", "'").replace("“", '"').replace("”", '"')
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?.!;: ")
+
+
+def _literals(normalized: str) -> List[str]:
+    """Numbers and quoted strings: questions differing in these need different SQL."""
+    return sorted(re.findall(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"", normalized))
+
+
+class SQLCache:
+    """
+    Persistent cache of generated SQL in front of the LLM.
+
+    Exact hits match on the normalized question, model name and schema
+    fingerprint. Near hits compare question embeddings from the local Ollama
+    embedding model against entries for the same model and schema, and only
+    count when the numbers and quoted literals in both questions agree.
+    Entries expire after ``ttl`` seconds, the least recently used entries are
+    evicted beyond ``max_entries``, and entries for a database are dropped
+    when its schema fingerprint changes.
+
+    ``lookup`` and ``store`` call Ollama and SQLite synchronously; async
+    callers run them in a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        similarity_threshold: Optional[float] = None,
+        llm_client=None,
+    ):
+        self.path = path or os.getenv("SQL_CACHE_PATH", os.path.join(".cache", "sql_cache.sqlite"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SQL_CACHE_MAX_ENTRIES", "5000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SQL_CACHE_TTL_SECS", str(7 * 24 * 3600)))
+        # A threshold above 1 disables near-hit lookups
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None
+            else float(os.getenv("SQL_CACHE_SIMILARITY", "0.95"))
+        )
+        self.llm_client = llm_client
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._embeddings: "OrderedDict[str, Any]" = OrderedDict()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    key TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    normalized TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    embedding BLOB,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS sql_cache_scope ON sql_cache (model, fingerprint);
+                CREATE INDEX IF NOT EXISTS sql_cache_last_used ON sql_cache (last_used);
+                CREATE TABLE IF NOT EXISTS schema_versions (
+                    connection TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _key(normalized: str, model: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{model}\x00{fingerprint}\x00{normalized}".encode()).hexdigest()
+
+    def _embed(self, normalized: str):
+        """Embed a question, memoizing the most recent ones."""
+        import numpy as np
+
+        with self._lock:
+            vector = self._embeddings.get(normalized)
+        if vector is None:
+            vector = np.asarray(self.llm_client.embed([normalized])[0], dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-9)
+            with self._lock:
+                self._embeddings[normalized] = vector
+                if len(self._embeddings) > 256:
+                    self._embeddings.popitem(last=False)
+        return vector
+
+    def sync_schema(self, connection: Hashable, fingerprint: str):
+        """Drop entries generated against an older schema of this database."""
+        conn_id = hashlib.sha256(repr(connection).encode()).hexdigest()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT fingerprint FROM schema_versions WHERE connection = ?", (conn_id,)).fetchone()
+            if row and row[0] == fingerprint:
+                return
+            if row:
+                deleted = db.execute("DELETE FROM sql_cache WHERE fingerprint = ?", (row[0],)).rowcount
+                logger.info(f"Schema changed, invalidated {deleted} cached queries")
+            db.execute(
+                "INSERT OR REPLACE INTO schema_versions (connection, fingerprint) VALUES (?, ?)",
+                (conn_id, fingerprint)
+            )
+            db.commit()
+
+    def lookup(self, question: str, model: str, fingerprint: str, validator) -> Optional[Dict[str, Any]]:
+        """Return a cached SQL for the question, or None on a miss."""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT key, sql, created_at FROM sql_cache WHERE key = ?",
+                (self._key(normalized, model, fingerprint),)
+            ).fetchone()
+        candidates = []
+        if row:
+            candidates.append((row, "exact", 1.0))
+
+        if not candidates and self.llm_client is not None and self.similarity_threshold <= 1:
+            try:
+                candidates = self._nearest(normalized, model, fingerprint)
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup unavailable: {e}")
+
+        for (key, sql, created_at), match, similarity in candidates:
+            if now - created_at > self.ttl:
+                self._delete(key)
+                continue
+            # Cached SQL gets the same safety checks as freshly generated SQL
+            if not validator.validate(sql):
+                self.rejected += 1
+                self._delete(key)
+                continue
+            with self._lock:
+                db = self._db()
+                db.execute("UPDATE sql_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                db.commit()
+            if match == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            return {"sql": sql, "match": match, "similarity": round(similarity, 4)}
+
+        self.misses += 1
+        return None
+
+    def _nearest(self, normalized: str, model: str, fingerprint: str) -> List:
+        import numpy as np
+
+        vector = self._embed(normalized)
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT key, sql, created_at, normalized, embedding FROM sql_cache "
+                "WHERE model = ? AND fingerprint = ? AND embedding IS NOT NULL",
+                (model, fingerprint)
+            ).fetchall()
+        # Skip entries written with a different embedding model
+        rows = [row for row in rows if len(row[4]) == vector.nbytes]
+        if not rows:
+            return []
+        matrix = np.frombuffer(b"".join(row[4] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        similarities = matrix @ vector
+        literals = _literals(normalized)
+        matches = []
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.similarity_threshold:
+                break
+            if _literals(rows[i][3]) == literals:
+                matches.append((rows[i][:3], "semantic", float(similarities[i])))
+        return matches
+
+    def store(self, question: str, model: str, fingerprint: str, sql: str):
+        """Record SQL that validated and executed successfully."""
+        normalized = normalize_question(question)
+        embedding = None
+        if self.llm_client is not None and self.similarity_threshold <= 1:
+            try:
+                embedding = self._embed(normalized).tobytes()
+            except Exception as e:
+                logger.warning(f"Storing cache entry without embedding: {e}")
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO sql_cache "
+                "(key, question, normalized, model, fingerprint, sql, embedding, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (self._key(normalized, model, fingerprint), question, normalized, model,
+                 fingerprint, sql, embedding, now, now)
+            )
+            db.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - self.ttl,))
+            db.execute(
+                "DELETE FROM sql_cache WHERE key IN "
+                "(SELECT key FROM sql_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            db.commit()
+
+    def _delete(self, key: str):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM sql_cache")
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process plus the number of stored entries."""
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_sql_cache: Optional[SQLCache] = None
+_sql_cache_lock = threading.Lock()
+
+
+def get_sql_cache(llm_client=None) -> SQLCache:
+    """Return the process-wide SQL cache."""
+    global _sql_cache
+    with _sql_cache_lock:
+        if _sql_cache is None:
+            _sql_cache = SQLCache(llm_client=llm_client)
+        return _sql_cache
@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("postgres-connection-pool")
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class PostgresConnectionPool:
+    """
+    Bounded, thread-safe pool of read-only PostgreSQL connections.
+
+    Connections are configured once when opened (read-only transactions and a
+    statement timeout), rolled back when returned, and evicted when they are
+    found closed or fail a liveness check. Callers block up to ``timeout``
+    seconds when every connection is in use.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        statement_timeout_ms: Optional[int] = None,
+        max_idle_secs: Optional[float] = None,
+    ):
+        self._connect = connect
+        self.min_size = min_size if min_size is not None else int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+        self.max_size = max_size if max_size is not None else int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("DB_POOL_TIMEOUT_SECS", "30"))
+        self.statement_timeout_ms = (
+            statement_timeout_ms if statement_timeout_ms is not None
+            else int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+        )
+        # Idle connections older than this are pinged before being handed out
+        self.max_idle_secs = (
+            max_idle_secs if max_idle_secs is not None
+            else float(os.getenv("DB_POOL_MAX_IDLE_SECS", "60"))
+        )
+
+        self._cond = threading.Condition()
+        self._idle: List[Tuple[Any, float]] = []
+        self._open = 0
+        self._waiting = 0
+
+        # Metrics
+        self._acquired_total = 0
+        self._created_total = 0
+        self._evicted_total = 0
+        self._timeouts_total = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _open_connection(self):
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SET default_transaction_read_only = on; SET statement_timeout = %s",
+                    (self.statement_timeout_ms,)
+                )
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        with self._cond:
+            self._created_total += 1
+        return conn
+
+    def _is_alive(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.max_idle_secs:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Evicting stale connection: {e}")
+            return False
+
+    def _evict(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._evicted_total += 1
+            self._cond.notify()
+
+    def warm_up(self):
+        """Open connections up to ``min_size`` so the first requests skip the handshake."""
+        conns = []
+        try:
+            while len(conns) < self.min_size:
+                conns.append(self.acquire())
+        except Exception as e:
+            logger.warning(f"Could not pre-open database connections: {e}")
+        for conn in conns:
+            self.release(conn)
+
+    def acquire(self):
+        """Check out a connection, blocking until one is free or the timeout expires."""
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts_total += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    self._waiting += 1
+                    self._cond.wait(remaining)
+                    self._waiting -= 1
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    conn = self._open_connection()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_alive(conn, idle_since):
+                self._evict(conn)
+                continue
+
+            waited = time.perf_counter() - started
+            with self._cond:
+                self._acquired_total += 1
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+            return conn
+
+    def release(self, conn):
+        """Return a connection, ending its transaction or evicting it if broken."""
+        if conn.closed:
+            self._evict(conn)
+            return
+        try:
+            conn.rollback()
+        except Exception as e:
+            # Its transaction state is unknown, so it must not be lent out again
+            logger.warning(f"Evicting connection that failed to reset: {e}")
+            self._evict(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the context."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool occupancy and wait-time metrics."""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                "waiting": self._waiting,
+                "acquired_total": self._acquired_total,
+                "created_total": self._created_total,
+                "evicted_total": self._evicted_total,
+                "timeouts_total": self._timeouts_total,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round(self._wait_time_total * 1000 / self._acquired_total, 3)
+                if self._acquired_total else 0.0,
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+            }
+
+    def close(self):
+        """Close all idle connections."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,116 @@
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from sqlglot import exp
+
+from src.database.query_analysis import parse_query
+
+logger = logging.getLogger("cost-guard")
+
+ACTIONS = ("limit", "reject", "off")
+
+
+class QueryRejectedError(Exception):
+    """Raised when a query's estimated cost is above the configured limit."""
+
+
+def inject_limit(query: str, limit: int) -> Optional[str]:
+    """
+    Return ``query`` with a LIMIT of at most ``limit`` rows, or None when the
+    query already has a smaller literal LIMIT or cannot be rewritten.
+    """
+    try:
+        expression = parse_query(query)
+    except Exception:
+        return None
+    if not isinstance(expression, exp.Query):
+        return None
+    existing = expression.args.get("limit")
+    if existing is not None:
+        value = existing.expression
+        if isinstance(value, exp.Literal) and value.is_int and int(value.name) <= limit:
+            return None
+    return expression.limit(limit).sql(dialect="postgres")
+
+
+class CostGuard:
+    """
+    Gates queries on the planner's estimates before they run.
+
+    Each query is EXPLAINed first. Queries expected to return more rows than
+    the caller will read get a LIMIT injected, so the planner can pick a
+    plan that stops early. Queries whose estimated total cost is still above
+    ``max_cost`` are rejected. With action "reject" no rewrite is attempted,
+    and "off" skips the EXPLAIN entirely.
+    """
+
+    def __init__(self, max_cost: Optional[float] = None, action: Optional[str] = None):
+        self.max_cost = max_cost if max_cost is not None else float(os.getenv("QUERY_MAX_COST", "10000000"))
+        self.action = (action or os.getenv("QUERY_COST_GUARD", "limit")).lower()
+        if self.action not in ACTIONS:
+            raise ValueError(f"Unknown cost guard action '{self.action}'. Expected one of {ACTIONS}.")
+
+        self.allowed = 0
+        self.limited = 0
+        self.rejected = 0
+
+    @staticmethod
+    def explain(cur, query: str) -> Dict[str, float]:
+        """Planner estimates for a query: total cost and rows returned."""
+        cur.execute(f"EXPLAIN (FORMAT JSON) {query}")
+        plan = cur.fetchone()[0][0]["Plan"]
+        return {"cost": plan["Total Cost"], "rows": plan["Plan Rows"]}
+
+    def check(self, cur, query: str, max_rows: int) -> Tuple[str, Dict[str, Any]]:
+        """
+        Return the query to run and the decision for the response.
+
+        ``max_rows`` is the number of rows the caller will read; one extra
+        row is kept by the LIMIT so truncation can still be detected.
+        """
+        if self.action == "off":
+            return query, {"action": "off"}
+
+        estimate = self.explain(cur, query)
+        decision = {
+            "action": "allowed",
+            "estimated_cost": estimate["cost"],
+            "estimated_rows": estimate["rows"],
+            "max_cost": self.max_cost,
+        }
+
+        if self.action == "limit" and (estimate["rows"] > max_rows or estimate["cost"] > self.max_cost):
+            rewritten = inject_limit(query, max_rows + 1)
+            if rewritten is not None:
+                limited = self.explain(cur, rewritten)
+                if limited["cost"] <= self.max_cost:
+                    self.limited += 1
+                    decision.update({
+                        "action": "limited",
+                        "limit": max_rows + 1,
+                        "limited_cost": limited["cost"],
+                        "sql": rewritten,
+                    })
+                    return rewritten, decision
+
+        if estimate["cost"] > self.max_cost:
+            self.rejected += 1
+            logger.warning(f"Rejected query with estimated cost {estimate['cost']:.0f}")
+            raise QueryRejectedError(
+                f"Query rejected: estimated cost {estimate['cost']:.0f} exceeds the limit of "
+                f"{self.max_cost:.0f} (estimated rows: {estimate['rows']}). "
+                "Add filters or join conditions to reduce the work."
+            )
+
+        self.allowed += 1
+        return query, decision
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "max_cost": self.max_cost,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "rejected": self.rejected,
+        }
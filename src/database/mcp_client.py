@@ -1,23 +1,81 @@
 import asyncio
+import copy
+import json
 import os
 import sys
-from typing import Any, Dict, List, Optional
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
 from contextlib import asynccontextmanager
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+import pandas as pd
+
+# Allow running this module directly as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.database.result_encoding import decode_page
+from src.database.profiles import ConnectionProfile, default_profile
+from src.database.session_pool import DEFAULT_TENANT, get_session_pool
+from src.tracing import record, span
+
+if TYPE_CHECKING:
+    from mcp import ClientSession
+
+# Tools that run against a database and so take the caller's connection profile
+PROFILE_TOOLS = {
+    "list_tables", "get_schema", "get_full_schema", "get_schema_fingerprint", "execute_query",
+    "open_query", "pool_stats", "rollup_stats", "refresh_rollups",
+}
+
+class ToolError(Exception):
+    """Raised when an MCP tool reports a failure, e.g. the database rejected the SQL."""
 
 class MCPClient:
-    def __init__(self):
+    def __init__(
+        self,
+        use_pool: Optional[bool] = None,
+        profile: Optional[ConnectionProfile] = None,
+        tenant: Optional[str] = None
+    ):
         # Get the path to the server script
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.server_script = os.path.join(current_dir, "postgres_mcp_server.py")
-        self.session: Optional[ClientSession] = None
+        self.session: Optional["ClientSession"] = None
         self._exit_stack = None
+        # MCP_POOL_SIZE=0 falls back to spawning a server per connection
+        if use_pool is None:
+            use_pool = int(os.getenv("MCP_POOL_SIZE", "2")) > 0
+        self.use_pool = use_pool
+        # Wire format for DataFrame results: "columns" (typed JSON arrays) or "arrow"
+        self.result_format = os.getenv("RESULT_FORMAT", "columns")
+        # The database this client queries, and who it queues as for pooled sessions
+        self.profile = profile or default_profile()
+        self.tenant = tenant or DEFAULT_TENANT
 
     @asynccontextmanager
     async def connect(self):
-        """Establish connection to the MCP server."""
+        """
+        Establish connection to the MCP server.
+
+        Yields a copy of this client bound to the session, so concurrent
+        connections through one client never share or clear each other's session.
+        """
+        started = time.perf_counter()
+        client = copy.copy(self)
+        if self.use_pool:
+            # Borrow a warm session from the process-wide pool, in turn with other tenants
+            pool = get_session_pool(self.server_script)
+            async with pool.session(self.tenant, self.profile.key, self.profile.max_concurrency) as session:
+                record("mcp.connect", (time.perf_counter() - started) * 1000, pooled=True)
+                client.session = session
+                try:
+                    yield client
+                finally:
+                    client.session = None
+            return
+
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
         # Define server parameters
         server_params = StdioServerParameters(
             command=sys.executable,  # Use the same Python interpreter
@@ -27,71 +85,152 @@ class MCPClient:
 
         async with stdio_client(server_params) as (read, write):
             async with ClientSession(read, write) as session:
-                self.session = session
+                client.session = session
                 await session.initialize()
-                yield self
+                record("mcp.connect", (time.perf_counter() - started) * 1000, pooled=False)
+                yield client
 
-    async def list_tables(self) -> List[str]:
-        """List all tables in the database."""
+    @property
+    def connection_key(self) -> Tuple:
+        """Identify the database this client talks to, for keying caches."""
+        return self.profile.key
+
+    async def _call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> Any:
+        """Call a tool and decode its JSON payload."""
         if not self.session:
             raise RuntimeError("Client not connected")
-        
-        result = await self.session.call_tool("list_tables", arguments={})
-        if result.content and result.content[0].type == "text":
-             text = result.content[0].text
-             # print(f"DEBUG: Raw list_tables response: {text!r}")
-             import json
-             try:
-                 data = json.loads(text)
-                 if isinstance(data, list):
-                     return data
-                 return [str(data)]
-             except json.JSONDecodeError:
-                 # If not JSON, maybe it's a raw string representation or just the string
-                 if text.startswith("[") and text.endswith("]"):
-                     try:
-                         import ast
-                         return ast.literal_eval(text)
-                     except:
-                         pass
-                 return [text] if text else []
-        return []
+        if name in PROFILE_TOOLS:
+            arguments = {**(arguments or {}), "profile": self.profile.to_arguments()}
+
+        with span(f"mcp.{name}"):
+            result = await self.session.call_tool(name, arguments=arguments or {})
+        texts = [item.text for item in result.content if item.type == "text"]
+        if result.isError:
+            raise ToolError(texts[0] if texts else f"Tool '{name}' failed")
+
+        # FastMCP sends each element of a returned list as a separate content item
+        values = []
+        with span("mcp.json_decode", bytes=sum(len(text) for text in texts)):
+            for text in texts:
+                try:
+                    values.append(json.loads(text))
+                except json.JSONDecodeError:
+                    values.append(text)
+        for value in values:
+            # Stage timings measured inside the server process
+            if isinstance(value, dict) and isinstance(value.get("timings"), dict):
+                for stage, duration_ms in value.pop("timings").items():
+                    record(f"server.{stage}", duration_ms, export=False)
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    async def list_tables(self) -> List[str]:
+        """List all tables in the database."""
+        data = await self._call_tool("list_tables")
+        return data if isinstance(data, list) else [data]
 
     async def get_schema(self, table_name: str) -> List[Dict[str, Any]]:
         """Get schema for a table."""
-        if not self.session:
-            raise RuntimeError("Client not connected")
-        
-        result = await self.session.call_tool("get_schema", arguments={"table_name": table_name})
-        if result.content and result.content[0].type == "text":
-             text = result.content[0].text
-             import json
-             try:
-                 data = json.loads(text)
-                 if isinstance(data, list):
-                     return data
-                 return [data]
-             except json.JSONDecodeError:
-                 return []
-        return []
-
-    async def execute_query(self, query: str) -> List[Dict[str, Any]]:
-        """Execute a SQL query."""
-        if not self.session:
-            raise RuntimeError("Client not connected")
-        
-        result = await self.session.call_tool("execute_query", arguments={"query": query})
-        if result.content and result.content[0].type == "text":
-             text = result.content[0].text
-             import json
-             try:
-                 data = json.loads(text)
-                 if isinstance(data, list):
-                     return data
-                 return [data]
-             except json.JSONDecodeError:
-                 return []
-        return []
+        data = await self._call_tool("get_schema", {"table_name": table_name})
+        return data if isinstance(data, list) else [data]
+
+    async def get_full_schema(self) -> Dict[str, Any]:
+        """Get every table's columns, keys and row estimates in one round trip."""
+        return await self._call_tool("get_full_schema")
+
+    async def get_schema_fingerprint(self) -> str:
+        """Get a hash identifying the current schema state."""
+        data = await self._call_tool("get_schema_fingerprint")
+        return data["fingerprint"]
+
+    async def execute_query(
+        self, query: str, max_rows: Optional[int] = None, format: str = "rows", timeout_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Execute a SQL query, returning its rows, truncation flag, cost estimate and result-cache metadata."""
+        return await self._call_tool("execute_query", {
+            "query": query, "max_rows": max_rows, "format": format, "timeout_ms": timeout_ms
+        })
+
+    async def stream_query(
+        self, query: str, page_size: Optional[int] = None, max_rows: Optional[int] = None,
+        format: Optional[str] = None, timeout_ms: Optional[int] = None, fresh: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield result pages read through a server-side cursor (``fresh`` bypasses cached results and rollups)."""
+        page = await self._call_tool("open_query", {
+            "query": query, "page_size": page_size, "max_rows": max_rows,
+            "format": format or self.result_format, "timeout_ms": timeout_ms, "fresh": fresh
+        })
+        cursor_id = page["cursor_id"]
+        try:
+            yield page
+            while not page["done"]:
+                page = await self._call_tool("fetch_page", {"cursor_id": cursor_id})
+                yield page
+        finally:
+            if cursor_id and not page["done"]:
+                await self._call_tool("close_query", {"cursor_id": cursor_id})
+
+    async def fetch_dataframe(
+        self, query: str, page_size: Optional[int] = None, max_rows: Optional[int] = None,
+        timeout_ms: Optional[int] = None, fresh: bool = False
+    ) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """
+        Run a query page by page and assemble the pages into a DataFrame.
+
+        Pages arrive column-oriented (see RESULT_FORMAT) and are decoded
+        straight into typed columns as they arrive, without building a dict
+        per row. Returns the frame and metadata (row count, page count,
+        truncation flag, cost guard decision, result-cache info and the
+        rollup that served the query, if any). ``fresh`` reads the database
+        even when a cached result or a rollup could answer.
+        """
+        frames = []
+        columns: List[str] = []
+        meta: Dict[str, Any] = {"pages": 0}
+        async for page in self.stream_query(
+            query, page_size=page_size, max_rows=max_rows, timeout_ms=timeout_ms, fresh=fresh
+        ):
+            if "columns" in page:
+                columns = page["columns"]
+                meta["result_cache"] = page["cache"]
+                meta["cost_guard"] = page["cost_guard"]
+                meta["rollup"] = page.get("rollup")
+            with span("result.dataframe"):
+                frames.append(decode_page(page, columns))
+            meta["pages"] += 1
+            meta["truncated"] = page["truncated"]
+            meta["row_count"] = page["row_count"]
+
+        # Keep the (typed) first page when every page is empty
+        frames = [frame for frame in frames if not frame.empty] or frames[:1]
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        return df, meta
+
+    async def invalidate_result_cache(self, tables: Optional[List[str]] = None) -> int:
+        """Drop server-side cached results for the given tables (all if None)."""
+        data = await self._call_tool("invalidate_result_cache", {"tables": tables})
+        return data["invalidated"]
+
+    async def result_cache_stats(self) -> Dict[str, Any]:
+        """Get the server's result cache metrics."""
+        return await self._call_tool("result_cache_stats")
+
+    async def rollup_stats(self) -> Dict[str, Any]:
+        """Get the server's rollups and how many queries they served."""
+        return await self._call_tool("rollup_stats")
+
+    async def refresh_rollups(self) -> Dict[str, Any]:
+        """Mine the server's query log and rebuild its rollups now."""
+        return await self._call_tool("refresh_rollups")
+
+    async def cost_guard_stats(self) -> Dict[str, Any]:
+        """Get the server's cost guard counters."""
+        return await self._call_tool("cost_guard_stats")
+
+    async def pool_stats(self) -> Dict[str, Any]:
+        """Get the server's database connection pool metrics."""
+        return await self._call_tool("pool_stats")
 
 # Example usage
 async def main():
@@ -109,7 +248,7 @@ async def main():
                 
                 # Test query
                 results = await mcp.execute_query(f"SELECT * FROM {tables[0]} LIMIT 5")
-                print(f"Sample data: {results}")
+                print(f"Sample data: {results['rows']}")
                 
     except Exception as e:
         print(f"Error: {e}")
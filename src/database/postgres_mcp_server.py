@@ -1,5 +1,9 @@
 import os
+import sys
 import json
+import time
+import hashlib
+import uuid
 import logging
 from typing import Any, List, Dict, Optional
 from contextlib import asynccontextmanager
@@ -9,6 +13,18 @@ from psycopg2.extras import RealDictCursor
 from mcp.server.fastmcp import FastMCP
 from dotenv import load_dotenv
 
+# Allow imports from the project root when run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.database.connection_pool import PostgresConnectionPool
+from src.database.profiles import ConnectionProfile, default_profile, resolve_profile
+from src.database.cost_guard import CostGuard
+from src.database.query_analysis import analyze_query
+from src.database.result_cache import ResultCache, canonicalize
+from src.database.result_encoding import FORMATS, column_types, encode_page, to_json
+from src.database.rollups import RollupManager
+from src.tracing import current_trace, span, traced
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("postgres-mcp-server")
@@ -19,41 +35,74 @@ load_dotenv()
 # Initialize FastMCP server
 mcp = FastMCP("postgres-mcp-server")
 
-def get_db_connection():
-    """Get a connection to the PostgreSQL database."""
+def get_db_connection(profile: Optional[ConnectionProfile] = None):
+    """Get a connection to the profile's PostgreSQL database (the default profile if None)."""
+    profile = profile or default_profile()
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST", "localhost"),
-            port=os.getenv("DB_PORT", "5432"),
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD")
-        )
+        conn = psycopg2.connect(**profile.connect_kwargs())
         return conn
     except Exception as e:
         logger.error(f"Failed to connect to database: {e}")
         raise
 
-def is_read_only(query: str) -> bool:
-    """Check if a query is read-only."""
-    forbidden_keywords = [
-        "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "TRUNCATE", 
-        "CREATE", "GRANT", "REVOKE", "COMMIT", "ROLLBACK"
-    ]
-    normalized_query = query.strip().upper()
-    
-    # Check for forbidden keywords at the start or after a semicolon
-    # This is a basic check; for production, use a proper SQL parser
-    for keyword in forbidden_keywords:
-        if normalized_query.startswith(keyword) or f"; {keyword}" in normalized_query or f";{keyword}" in normalized_query:
-            return False
-    return True
+# One pool of read-only connections per database, so sessions on the same profile share connections
+_pools: Dict[tuple, PostgresConnectionPool] = {}
+
+def get_pool(profile: Optional[ConnectionProfile] = None) -> PostgresConnectionPool:
+    """Get the server-wide pool of read-only connections for a profile (the default profile if None)."""
+    profile = profile or default_profile()
+    pool = _pools.get(profile.key)
+    if pool is None:
+        pool = PostgresConnectionPool(lambda: get_db_connection(profile))
+        pool.warm_up()
+        _pools[profile.key] = pool
+    return pool
+
+# Hard caps on what a single query may return, whatever the client asks for
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "100000"))
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", str(50 * 1024 * 1024)))
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "5000"))
+# Open paged queries idle for longer than this are closed
+RESULT_CURSOR_IDLE_SECS = float(os.getenv("RESULT_CURSOR_IDLE_SECS", "60"))
+
+_cost_guard: Optional[CostGuard] = None
+_result_cache: Optional[ResultCache] = None
+_rollups: Dict[tuple, RollupManager] = {}
+_last_fingerprints: Dict[tuple, str] = {}
+
+def get_cost_guard() -> CostGuard:
+    """Get the server-wide EXPLAIN-based cost guard."""
+    global _cost_guard
+    if _cost_guard is None:
+        _cost_guard = CostGuard()
+    return _cost_guard
+
+def get_result_cache() -> ResultCache:
+    """Get the server-wide query result cache (disabled unless RESULT_CACHE_ENABLED=true)."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+def get_rollups(profile: Optional[ConnectionProfile] = None) -> RollupManager:
+    """Get the rollup manager of a profile's database (disabled unless ROLLUPS_ENABLED=true)."""
+    profile = profile or default_profile()
+    rollups = _rollups.get(profile.key)
+    if rollups is None:
+        path = os.getenv("ROLLUP_PATH", os.path.join(".cache", "rollups.sqlite"))
+        if profile.key != default_profile().key:
+            # Each database mines its own query log
+            root, extension = os.path.splitext(path)
+            path = f"{root}.{profile.name}-{hashlib.sha256(repr(profile.key).encode()).hexdigest()[:8]}{extension}"
+        rollups = RollupManager(pool=lambda: get_pool(profile), connect=lambda: get_db_connection(profile), path=path)
+        rollups.start()
+        _rollups[profile.key] = rollups
+    return rollups
 
 @mcp.tool()
-def list_tables() -> List[str]:
+def list_tables(profile: Optional[Dict[str, Any]] = None) -> List[str]:
     """List all tables in the public schema."""
-    conn = get_db_connection()
-    try:
+    with get_pool(resolve_profile(profile)).connection() as conn:
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT table_name 
@@ -62,14 +111,11 @@ def list_tables() -> List[str]:
             """)
             tables = [row[0] for row in cur.fetchall()]
             return tables
-    finally:
-        conn.close()
 
 @mcp.tool()
-def get_schema(table_name: str) -> List[Dict[str, Any]]:
+def get_schema(table_name: str, profile: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """Get the schema for a specific table."""
-    conn = get_db_connection()
-    try:
+    with get_pool(resolve_profile(profile)).connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
                 SELECT column_name, data_type, is_nullable
@@ -78,26 +124,585 @@ def get_schema(table_name: str) -> List[Dict[str, Any]]:
             """, (table_name,))
             schema = cur.fetchall()
             return [dict(row) for row in schema]
-    finally:
-        conn.close()
+
+FULL_SCHEMA_QUERY = """
+    WITH rels AS (
+        SELECT c.oid, c.relname, c.relkind, c.reltuples,
+               obj_description(c.oid, 'pg_class') AS comment
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public'
+          AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+          AND NOT c.relispartition
+    ),
+    cols AS (
+        SELECT a.attrelid,
+               json_agg(json_build_object(
+                   'name', a.attname,
+                   'type', format_type(a.atttypid, a.atttypmod),
+                   'nullable', NOT a.attnotnull,
+                   'comment', col_description(a.attrelid, a.attnum)
+               ) ORDER BY a.attnum) AS columns
+        FROM pg_attribute a
+        JOIN rels r ON r.oid = a.attrelid
+        WHERE a.attnum > 0 AND NOT a.attisdropped
+        GROUP BY a.attrelid
+    ),
+    cons AS (
+        SELECT con.conrelid, con.contype, ref.relname AS ref_table,
+               (SELECT json_agg(a.attname ORDER BY k.ord)
+                FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum) AS columns,
+               (SELECT json_agg(a.attname ORDER BY k.ord)
+                FROM unnest(con.confkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum) AS ref_columns
+        FROM pg_constraint con
+        LEFT JOIN pg_class ref ON ref.oid = con.confrelid
+        WHERE con.contype IN ('p', 'f') AND con.conrelid IN (SELECT oid FROM rels)
+    )
+    SELECT r.relname AS name,
+           CASE r.relkind WHEN 'v' THEN 'view' WHEN 'm' THEN 'materialized view'
+                          WHEN 'f' THEN 'foreign table' ELSE 'table' END AS kind,
+           r.comment,
+           CASE WHEN r.reltuples < 0 THEN NULL ELSE r.reltuples::bigint END AS row_estimate,
+           COALESCE(c.columns, '[]'::json) AS columns,
+           COALESCE((SELECT columns FROM cons WHERE conrelid = r.oid AND contype = 'p' LIMIT 1),
+                    '[]'::json) AS primary_key,
+           COALESCE((SELECT json_agg(json_build_object(
+                         'columns', columns, 'ref_table', ref_table, 'ref_columns', ref_columns))
+                     FROM cons WHERE conrelid = r.oid AND contype = 'f'),
+                    '[]'::json) AS foreign_keys
+    FROM rels r
+    LEFT JOIN cols c ON c.attrelid = r.oid
+    ORDER BY r.relname
+"""
+
+# Hash of the catalog state that affects the schema context: relations,
+# columns, column types and constraints. Cheap enough to run on every
+# cache revalidation.
+SCHEMA_FINGERPRINT_QUERY = """
+    SELECT md5(
+        current_database() || '|' ||
+        COALESCE((
+            SELECT string_agg(
+                c.oid::text || ':' || c.relname || ':' || c.relkind::text || ':' || a.attnum || ':' ||
+                a.attname || ':' || a.atttypid || ':' || a.atttypmod || ':' || a.attnotnull,
+                ',' ORDER BY c.oid, a.attnum)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+        ), '') || '|' ||
+        COALESCE((
+            SELECT string_agg(con.oid::text, ',' ORDER BY con.oid)
+            FROM pg_constraint con
+            JOIN pg_namespace n ON n.oid = con.connamespace
+            WHERE n.nspname = 'public'
+        ), '')
+    )
+"""
+
+def _schema_fingerprint(cur, profile: ConnectionProfile) -> str:
+    cur.execute(SCHEMA_FINGERPRINT_QUERY)
+    fingerprint = cur.fetchone()[0]
+    last = _last_fingerprints.get(profile.key)
+    if last is not None and fingerprint != last:
+        # Cached results may reference dropped or altered tables; other databases' results stand
+        get_result_cache().invalidate(prefix=_cache_prefix(profile))
+    _last_fingerprints[profile.key] = fingerprint
+    return fingerprint
+
+@mcp.tool()
+@traced("tool.get_full_schema")
+def get_full_schema(profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Get every table in the public schema in one catalog query: columns, types,
+    primary and foreign keys, comments and row-count estimates.
+    """
+    db = resolve_profile(profile)
+    with get_pool(db).connection() as conn:
+        with conn.cursor() as cur:
+            fingerprint = _schema_fingerprint(cur, db)
+            cur.execute(FULL_SCHEMA_QUERY)
+            names = [desc[0] for desc in cur.description]
+            tables = [dict(zip(names, row)) for row in cur.fetchall()]
+            return {"fingerprint": fingerprint, "tables": tables}
 
 @mcp.tool()
-def execute_query(query: str) -> List[Dict[str, Any]]:
-    """Execute a read-only SQL query."""
-    if not is_read_only(query):
-        raise ValueError("Only read-only queries (SELECT) are allowed.")
-    
-    conn = get_db_connection()
+def get_schema_fingerprint(profile: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Get a hash of the current schema state, used to revalidate cached schemas."""
+    db = resolve_profile(profile)
+    with get_pool(db).connection() as conn:
+        with conn.cursor() as cur:
+            return {"fingerprint": _schema_fingerprint(cur, db)}
+
+def _estimate_bytes(row: tuple) -> int:
+    """Approximate the serialized size of a row without encoding it."""
+    return sum(len(str(value)) + 4 for value in row)
+
+def _cache_prefix(profile: ConnectionProfile) -> str:
+    """Start of every result-cache key for a profile's database."""
+    return f"{profile.key!r}\n"
+
+def _cached_result(query: str, profile: ConnectionProfile):
+    """Look up a query in the result cache, returning (cache_key, hit)."""
+    cache = get_result_cache()
+    with span("result_cache"):
+        cache_key = canonicalize(query) if cache.enabled else None
+        if cache_key:
+            # The same SQL against another database is a different result
+            cache_key = (f"{_cache_prefix(profile)}{cache_key[0]}", cache_key[1])
+        hit = cache.get(cache_key[0]) if cache_key else None
+    return cache_key, hit
+
+def _cache_meta(cache_key, hit=None) -> Dict[str, Any]:
+    if hit:
+        _, age, ttl = hit
+        return {"hit": True, "age_seconds": round(age, 3), "ttl_seconds": ttl}
+    return {
+        "hit": False,
+        "age_seconds": 0.0,
+        "ttl_seconds": get_result_cache().ttl_for(cache_key[1]) if cache_key else 0
+    }
+
+def _route_rollup(query: str, profile: ConnectionProfile):
+    """Log a query for rollup mining and return its rollup rewrite, if a fresh rollup can answer it."""
+    rollups = get_rollups(profile)
+    if not rollups.enabled:
+        return None
+    with span("rollup"):
+        try:
+            rollups.observe(query)
+            return rollups.route(query)
+        except Exception as e:
+            logger.warning(f"Rollup routing failed: {e}")
+            return None
+
+def _serve_rollup(match, max_rows: int, profile: ConnectionProfile):
+    """Answer a routed query from the SQLite side store: (columns, types, rows, truncated), or None."""
+    rollups = get_rollups(profile)
+    if match is None or rollups.backend != "sqlite":
+        return None
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
-            results = cur.fetchall()
-            return [dict(row) for row in results]
+        with span("rollup.execute"):
+            return rollups.execute(match, max_rows)
     except Exception as e:
-        logger.error(f"Query execution failed: {e}")
+        rollups.fallback(match, e)
+        return None
+
+def _encode(columns: List[str], types: List[str], rows: List[tuple], fmt: str) -> Dict[str, Any]:
+    with span("encode", rows=len(rows)):
+        return encode_page(columns, types, rows, fmt)
+
+def _respond(payload: Dict[str, Any]) -> str:
+    """Serialize a tool response, attaching this call's stage timings."""
+    trace = current_trace()
+    if trace is not None:
+        payload["timings"] = trace.durations()
+    return to_json(payload)
+
+def _check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown result format '{fmt}'. Expected one of {FORMATS}.")
+
+def _statement_timeout(timeout_ms: Optional[int], pool: PostgresConnectionPool) -> int:
+    """Per-query timeout: the caller's, never above the connection default."""
+    default = pool.statement_timeout_ms
+    return min(timeout_ms, default) if timeout_ms and default else (timeout_ms or default)
+
+def _open_stream(
+    pool: PostgresConnectionPool, conn, query: str, page_size: int, max_rows: int, timeout_ms: Optional[int]
+) -> Dict[str, Any]:
+    """Cost-check a query, then execute it through a named (server-side) cursor."""
+    with conn.cursor() as cur:
+        # SET LOCAL lasts until the pool rolls the connection back on release
+        cur.execute("SET LOCAL statement_timeout = %s", (_statement_timeout(timeout_ms, pool),))
+        with span("cost_guard"):
+            query, cost_guard = get_cost_guard().check(cur, query, max_rows)
+
+    cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+    cur.itersize = page_size
+    with span("execute"):
+        cur.execute(query)
+    return {
+        "pool": pool,
+        "conn": conn,
+        "cursor": cur,
+        "page_size": page_size,
+        "max_rows": max_rows,
+        "row_count": 0,
+        "bytes": 0,
+        "last_used": time.monotonic(),
+        "cost_guard": cost_guard,
+    }
+
+def _read_page(stream: Dict[str, Any]):
+    """Fetch the next page of row tuples, enforcing the row and byte caps."""
+    remaining = stream["max_rows"] - stream["row_count"]
+    # Ask for one extra row at the cap to tell "exactly max_rows" from "more"
+    requested = min(stream["page_size"], remaining + 1)
+    with span("fetch"):
+        rows = stream["cursor"].fetchmany(requested)
+    done = len(rows) < requested
+    truncated = len(rows) > remaining
+
+    kept = 0
+    for row in rows[:remaining]:
+        size = _estimate_bytes(row)
+        if stream["bytes"] + size > RESULT_MAX_BYTES:
+            truncated = True
+            break
+        stream["bytes"] += size
+        kept += 1
+    rows = rows[:kept]
+
+    stream["row_count"] += len(rows)
+    stream["last_used"] = time.monotonic()
+    if "columns" not in stream:
+        # Named cursors only have a description after the first fetch
+        description = stream["cursor"].description or []
+        stream["columns"] = [desc[0] for desc in description]
+        stream["types"] = column_types(description)
+    return rows, {
+        "done": done or truncated,
+        "truncated": truncated,
+        "row_count": stream["row_count"],
+    }
+
+class _CachedCursor:
+    """Cursor over a cached result, so cache hits are capped and paged like fresh ones."""
+
+    def __init__(self, rows: List[tuple]):
+        self._rows = rows
+        self._position = 0
+
+    def fetchmany(self, size: int) -> List[tuple]:
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def close(self):
+        self._rows = []
+
+def _cached_stream(result: Dict[str, Any], page_size: int, max_rows: int) -> Dict[str, Any]:
+    """A stream reading a result-cache hit, for _read_page."""
+    return {
+        "pool": None,
+        "conn": None,
+        "cursor": _CachedCursor(result["rows"]),
+        "page_size": page_size,
+        "max_rows": max_rows,
+        "row_count": 0,
+        "bytes": 0,
+        "last_used": time.monotonic(),
+        "cost_guard": None,
+        "columns": result["columns"],
+        "types": result["types"],
+    }
+
+def _close_stream(stream: Dict[str, Any]):
+    try:
+        stream["cursor"].close()
+    except Exception:
+        pass
+    if stream["pool"] is not None:
+        stream["pool"].release(stream["conn"])
+
+_streams: Dict[str, Dict[str, Any]] = {}
+
+def _expire_streams():
+    now = time.monotonic()
+    for cursor_id, stream in list(_streams.items()):
+        if now - stream["last_used"] > RESULT_CURSOR_IDLE_SECS:
+            logger.info(f"Closing idle query cursor {cursor_id}")
+            _close_stream(_streams.pop(cursor_id))
+
+@mcp.tool()
+@traced("tool.execute_query")
+def execute_query(
+    query: str,
+    max_rows: Optional[int] = None,
+    format: str = "rows",
+    timeout_ms: Optional[int] = None,
+    profile: Optional[Dict[str, Any]] = None,
+    fresh: bool = False
+) -> str:
+    """
+    Execute a read-only SQL query.
+
+    Returns at most max_rows rows (capped by RESULT_MAX_ROWS/RESULT_MAX_BYTES)
+    with a "truncated" flag, plus result-cache metadata: whether the rows came
+    from the cache and how old they are. format selects the encoding: "rows"
+    (list of row objects), "columns" (typed column arrays) or "arrow"
+    (base64 Arrow IPC).
+
+    The query is EXPLAINed first: queries over QUERY_MAX_COST are rejected
+    or capped with a LIMIT, and "cost_guard" reports the estimate and the
+    decision. timeout_ms lowers the statement timeout for this query.
+    profile selects the database (a named profile from DB_PROFILES plus
+    dbname/user overrides); the default profile if omitted.
+
+    Aggregate queries that a precomputed rollup can answer (ROLLUPS_ENABLED)
+    are rewritten to read it; "rollup" then names the rollup and its age.
+    fresh=true reads the database directly, bypassing both the result cache
+    and rollups (e.g. for live panels polling for new rows).
+    """
+    with span("validate"):
+        analysis = analyze_query(query)
+    if not analysis.ok:
+        raise ValueError(f"Only read-only queries (SELECT) are allowed. {analysis.error}")
+    _check_format(format)
+    db = resolve_profile(profile)
+
+    max_rows = min(max_rows or RESULT_MAX_ROWS, RESULT_MAX_ROWS)
+    cache_key, hit = _cached_result(query, db) if not fresh else (None, None)
+    if hit:
+        # Cached results are complete; this call's max_rows still applies
+        stream = _cached_stream(hit[0], max_rows + 1, max_rows)
+        rows, page = _read_page(stream)
+        return _respond({
+            "columns": stream["columns"],
+            **_encode(stream["columns"], stream["types"], rows, format),
+            "row_count": len(rows),
+            "truncated": page["truncated"],
+            "cost_guard": None,
+            "cache": _cache_meta(cache_key, hit),
+            "rollup": None
+        })
+
+    match = _route_rollup(query, db) if not fresh else None
+    served = _serve_rollup(match, max_rows, db)
+    if served:
+        columns, types, rows, truncated = served
+        return _respond({
+            "columns": columns,
+            **_encode(columns, types, rows, format),
+            "row_count": len(rows),
+            "truncated": truncated,
+            "cost_guard": None,
+            "cache": _cache_meta(cache_key),
+            "rollup": match.meta
+        })
+
+    def run(sql: str):
+        pool = get_pool(db)
+        with pool.connection() as conn:
+            stream = _open_stream(pool, conn, sql, RESULT_PAGE_SIZE, max_rows, timeout_ms)
+            rows = []
+            page = {"done": False}
+            while not page["done"]:
+                page_rows, page = _read_page(stream)
+                rows.extend(page_rows)
+            stream["cursor"].close()
+        return stream, rows, page
+
+    rollup = None
+    if match is not None and get_rollups(db).backend == "matview":
+        try:
+            stream, rows, page = run(match.sql)
+            rollup = match.meta
+        except Exception as e:
+            get_rollups(db).fallback(match, e)
+    if rollup is None:
+        try:
+            stream, rows, page = run(query)
+        except Exception as e:
+            logger.error(f"Query execution failed: {e}")
+            raise
+
+    if cache_key and not page["truncated"]:
+        get_result_cache().put(
+            cache_key[0], {"columns": stream["columns"], "types": stream["types"], "rows": rows}, cache_key[1]
+        )
+    return _respond({
+        "columns": stream["columns"],
+        **_encode(stream["columns"], stream["types"], rows, format),
+        "row_count": len(rows),
+        "truncated": page["truncated"],
+        "cost_guard": stream["cost_guard"],
+        "cache": _cache_meta(cache_key),
+        "rollup": rollup
+    })
+
+@mcp.tool()
+@traced("tool.open_query")
+def open_query(
+    query: str,
+    page_size: Optional[int] = None,
+    max_rows: Optional[int] = None,
+    format: str = "rows",
+    timeout_ms: Optional[int] = None,
+    profile: Optional[Dict[str, Any]] = None,
+    fresh: bool = False
+) -> str:
+    """
+    Start a paged execution of a read-only SQL query and return its first page.
+
+    Rows are read through a server-side cursor, so memory stays proportional
+    to the page size. While "done" is false, call fetch_page with the returned
+    cursor_id for the next page; close_query releases an unfinished query.
+    format, timeout_ms, profile, fresh, the cost guard and rollups are as
+    for execute_query.
+    """
+    with span("validate"):
+        analysis = analyze_query(query)
+    if not analysis.ok:
+        raise ValueError(f"Only read-only queries (SELECT) are allowed. {analysis.error}")
+    _check_format(format)
+    _expire_streams()
+    db = resolve_profile(profile)
+
+    page_size = min(page_size or RESULT_PAGE_SIZE, RESULT_PAGE_SIZE)
+    max_rows = min(max_rows or RESULT_MAX_ROWS, RESULT_MAX_ROWS)
+    cache_key, hit = _cached_result(query, db) if not fresh else (None, None)
+    if hit:
+        # Cache hits are paged and capped like database results
+        stream = _cached_stream(hit[0], page_size, max_rows)
+        stream["format"] = format
+        rows, page = _read_page(stream)
+        cursor_id = None
+        if page["done"]:
+            _close_stream(stream)
+        else:
+            cursor_id = uuid.uuid4().hex
+            _streams[cursor_id] = stream
+        return _respond({
+            "cursor_id": cursor_id,
+            "columns": stream["columns"],
+            **page,
+            **_encode(stream["columns"], stream["types"], rows, format),
+            "cost_guard": None,
+            "cache": _cache_meta(cache_key, hit),
+            "rollup": None
+        })
+
+    match = _route_rollup(query, db) if not fresh else None
+    served = _serve_rollup(match, max_rows, db)
+    if served:
+        # Rollups are small: the whole result goes in the first page
+        columns, types, rows, truncated = served
+        return _respond({
+            "cursor_id": None,
+            "columns": columns,
+            **_encode(columns, types, rows, format),
+            "done": True,
+            "truncated": truncated,
+            "row_count": len(rows),
+            "cost_guard": None,
+            "cache": _cache_meta(cache_key),
+            "rollup": match.meta
+        })
+
+    def start(sql: str):
+        pool = get_pool(db)
+        conn = pool.acquire()
+        try:
+            stream = _open_stream(pool, conn, sql, page_size, max_rows, timeout_ms)
+            stream["format"] = format
+            rows, page = _read_page(stream)
+        except Exception:
+            pool.release(conn)
+            raise
+        return stream, rows, page
+
+    rollup = None
+    if match is not None and get_rollups(db).backend == "matview":
+        try:
+            stream, rows, page = start(match.sql)
+            rollup = match.meta
+        except Exception as e:
+            get_rollups(db).fallback(match, e)
+    if rollup is None:
+        try:
+            stream, rows, page = start(query)
+        except Exception as e:
+            logger.error(f"Query execution failed: {e}")
+            raise
+
+    cursor_id = None
+    if page["done"]:
+        _close_stream(stream)
+        # Results that fit in one page are small enough to cache
+        if cache_key and not page["truncated"]:
+            get_result_cache().put(
+                cache_key[0],
+                {"columns": stream["columns"], "types": stream["types"], "rows": rows},
+                cache_key[1]
+            )
+    else:
+        cursor_id = uuid.uuid4().hex
+        _streams[cursor_id] = stream
+    return _respond({
+        "cursor_id": cursor_id,
+        "columns": stream["columns"],
+        **page,
+        **_encode(stream["columns"], stream["types"], rows, format),
+        "cost_guard": stream["cost_guard"],
+        "cache": _cache_meta(cache_key),
+        "rollup": rollup
+    })
+
+@mcp.tool()
+@traced("tool.fetch_page")
+def fetch_page(cursor_id: str) -> str:
+    """Fetch the next page of a query started with open_query."""
+    stream = _streams.get(cursor_id)
+    if stream is None:
+        raise ValueError(f"Unknown or expired cursor: {cursor_id}")
+    try:
+        rows, page = _read_page(stream)
+    except Exception:
+        _close_stream(_streams.pop(cursor_id))
         raise
-    finally:
-        conn.close()
+    if page["done"]:
+        _close_stream(_streams.pop(cursor_id))
+    return _respond({**page, **_encode(stream["columns"], stream["types"], rows, stream["format"])})
+
+@mcp.tool()
+def close_query(cursor_id: str) -> Dict[str, Any]:
+    """Release a paged query before all of its pages were fetched."""
+    stream = _streams.pop(cursor_id, None)
+    if stream is not None:
+        _close_stream(stream)
+    return {"closed": stream is not None}
+
+@mcp.tool()
+def invalidate_result_cache(tables: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Drop cached results that read any of the given tables, or all results if none are given."""
+    return {"invalidated": get_result_cache().invalidate(tables)}
+
+@mcp.tool()
+def result_cache_stats() -> Dict[str, Any]:
+    """Report result cache size and hit/miss counters."""
+    return get_result_cache().stats()
+
+@mcp.tool()
+def rollup_stats(profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Report rollups (definition, rows, staleness, hits) and how many queries they served."""
+    return get_rollups(resolve_profile(profile)).stats()
+
+@mcp.tool()
+def refresh_rollups(profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Mine the query log and rebuild every rollup now, instead of waiting for
+    ROLLUP_REFRESH_SECS. When another server process maintains the rollups,
+    it does so on its next run (within a minute) and this reports the
+    rollups as they are.
+    """
+    rollups = get_rollups(resolve_profile(profile))
+    if rollups.enabled:
+        rollups.maintain(force=True)
+    return rollups.stats()
+
+@mcp.tool()
+def cost_guard_stats() -> Dict[str, Any]:
+    """Report how many queries the cost guard allowed, limited and rejected."""
+    return get_cost_guard().stats()
+
+@mcp.tool()
+def pool_stats(profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Report connection pool occupancy and wait-time metrics for a profile's database."""
+    return get_pool(resolve_profile(profile)).stats()
 
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,135 @@
+"""
+Connection profiles: which database a session queries, and how many of the
+shared MCP sessions it may hold at once.
+
+The "default" profile comes from DB_HOST, DB_PORT, DB_NAME, DB_USER and
+DB_PASSWORD. More named profiles can be defined in DB_PROFILES, either as a
+JSON object or as the path of a JSON file:
+
+    {"analytics": {"dbname": "warehouse", "user": "reader", "max_concurrency": 2}}
+
+A profiles file is parsed once and read again only after it is modified.
+Fields a profile leaves out fall back to the default profile. Clients send
+a profile to the MCP server as its name plus the database and user to use
+(``to_arguments``). Hosts, ports and passwords are only ever read from the
+server's own configuration, so a client cannot point the server's
+credentials at a host of its choosing.
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger("connection-profiles")
+
+# Fields a client may override per session; the host, port and password come from a named profile
+OVERRIDABLE_FIELDS = ("dbname", "user")
+
+
+@dataclass(frozen=True)
+class ConnectionProfile:
+    """Connection settings for one database, plus its share of the MCP session pool."""
+    name: str = "default"
+    host: Optional[str] = None
+    port: Optional[str] = None
+    dbname: Optional[str] = None
+    user: Optional[str] = None
+    password: Optional[str] = field(default=None, repr=False, compare=False)
+    # MCP sessions this profile may use at once across all users; 0 means no cap below the pool size
+    max_concurrency: int = 0
+
+    @property
+    def key(self) -> Tuple:
+        """Identifies the database, for keying pools and caches."""
+        return (self.host, self.port, self.dbname, self.user)
+
+    def connect_kwargs(self) -> Dict[str, Any]:
+        return {
+            "host": self.host or "localhost",
+            "port": self.port or "5432",
+            "dbname": self.dbname,
+            "user": self.user,
+            "password": self.password,
+        }
+
+    def with_overrides(self, **fields: Optional[str]) -> "ConnectionProfile":
+        """This profile with the given non-empty connection fields replaced."""
+        changes = {name: value for name, value in fields.items() if name in OVERRIDABLE_FIELDS and value}
+        return replace(self, **changes) if changes else self
+
+    def to_arguments(self) -> Dict[str, Any]:
+        """The profile as sent with MCP tool calls (no password)."""
+        arguments = {"name": self.name}
+        arguments.update({name: getattr(self, name) for name in OVERRIDABLE_FIELDS if getattr(self, name)})
+        return arguments
+
+
+def default_profile() -> ConnectionProfile:
+    return ConnectionProfile(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        max_concurrency=int(os.getenv("DB_MAX_CONCURRENCY", "0")),
+    )
+
+
+# (DB_PROFILES, file mtime) and the profile settings parsed from it
+_parsed: Optional[Tuple[Tuple, Dict[str, Any]]] = None
+
+
+def _profile_settings(spec: str) -> Dict[str, Any]:
+    """
+    DB_PROFILES parsed, read again only when the variable or the file's
+    mtime changes. A file that stops parsing keeps the last good settings.
+    """
+    global _parsed
+    inline = spec.startswith("{")
+    key = (spec, None if inline else os.path.getmtime(spec))
+    if _parsed is not None and _parsed[0] == key:
+        return _parsed[1]
+    try:
+        if inline:
+            settings = json.loads(spec)
+        else:
+            with open(spec) as f:
+                settings = json.load(f)
+    except ValueError as e:
+        if _parsed is None or _parsed[0][0] != spec:
+            raise
+        logger.warning(f"Keeping the previous connection profiles, {spec} is not valid JSON: {e}")
+        settings = _parsed[1]
+    _parsed = (key, settings)
+    return settings
+
+
+def get_profiles() -> Dict[str, ConnectionProfile]:
+    """The default profile and any named profiles from DB_PROFILES."""
+    default = default_profile()
+    profiles = {default.name: default}
+    spec = os.getenv("DB_PROFILES", "").strip()
+    if not spec:
+        return profiles
+    for name, settings in _profile_settings(spec).items():
+        settings = {key: value for key, value in settings.items() if key in ConnectionProfile.__dataclass_fields__}
+        if "port" in settings:
+            settings["port"] = str(settings["port"])
+        profiles[name] = replace(default, **{**settings, "name": name})
+    return profiles
+
+
+def resolve_profile(arguments: Optional[Dict[str, Any]] = None) -> ConnectionProfile:
+    """The profile a tool call asked for: a named profile with the caller's dbname/user overrides applied."""
+    if not arguments:
+        return default_profile()
+    profiles = get_profiles()
+    name = arguments.get("name") or "default"
+    if name not in profiles:
+        raise ValueError(f"Unknown connection profile '{name}'. Expected one of {sorted(profiles)}.")
+    profile = profiles[name]
+    for key in ("host", "port"):
+        if arguments.get(key) and str(arguments[key]) != getattr(profile, key):
+            raise ValueError(f"Connection profile '{name}' does not allow a different {key}; define a named profile.")
+    return profile.with_overrides(**{key: arguments.get(key) for key in OVERRIDABLE_FIELDS})
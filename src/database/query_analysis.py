@@ -0,0 +1,99 @@
+"""
+Single parse-and-validate stage for SQL, shared by the agent and the MCP server.
+
+``analyze_query`` parses a query once with the postgres dialect, checks the
+whole tree for anything that is not a plain read, and returns the AST and
+the tables it reads. Parses are memoized by SQL text, so the validator, the
+result cache and the cost guard all reuse the same tree. Cached trees are
+shared: copy them before transforming in place.
+"""
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import FrozenSet, List, Optional
+
+import sqlglot
+from sqlglot import exp
+
+logger = logging.getLogger("query-analysis")
+
+# Statements and clauses that write, lock or run something other than a query,
+# wherever they appear in the tree (e.g. a DELETE inside a CTE)
+FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.TruncateTable, exp.Command, exp.Copy, exp.Set, exp.Into, exp.Lock,
+)
+
+# Functions that sleep, reach outside the database, read files, execute SQL
+# strings or change server state
+FORBIDDEN_FUNCTIONS = re.compile(
+    r"^(pg_sleep\w*|dblink\w*|pg_read_\w+|pg_ls_\w+|pg_stat_file|lo_\w+|pg_file_\w+"
+    r"|pg_terminate_backend|pg_cancel_backend|pg_reload_conf|pg_rotate_logfile|pg_promote"
+    r"|pg_advisory\w*|pg_try_advisory\w*|pg_notify|set_config|nextval|setval"
+    r"|query_to_xml\w*|cursor_to_xml\w*|pg_logical_\w+|pg_replication_\w+|pg_create_\w+|pg_drop_\w+)$"
+)
+
+PARSE_CACHE_SIZE = int(os.getenv("SQL_PARSE_CACHE_SIZE", "512"))
+
+
+@dataclass(frozen=True)
+class QueryAnalysis:
+    """Outcome of validating one query."""
+    sql: str
+    ok: bool
+    error: Optional[str] = None
+    expression: Optional[exp.Expression] = field(default=None, compare=False, repr=False)
+    tables: FrozenSet[str] = frozenset()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_statements(sql: str) -> List[exp.Expression]:
+    """Parse SQL with the postgres dialect, memoized by SQL text."""
+    return [statement for statement in sqlglot.parse(sql, read="postgres") if statement is not None]
+
+
+def parse_query(sql: str) -> exp.Expression:
+    """The (cached) tree of a single-statement query; raises if it does not parse."""
+    statements = parse_statements(sql)
+    if len(statements) != 1:
+        raise ValueError(f"Expected one SQL statement, found {len(statements)}.")
+    return statements[0]
+
+
+def _function_name(node: exp.Func) -> str:
+    return (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def analyze_query(sql: str) -> QueryAnalysis:
+    """Check that ``sql`` is a single read-only query and describe what it reads."""
+    try:
+        statements = parse_statements(sql)
+    except Exception as e:
+        return QueryAnalysis(sql, False, f"Could not parse query: {str(e).splitlines()[0]}")
+    if len(statements) != 1:
+        return QueryAnalysis(sql, False, f"Expected one SQL statement, found {len(statements)}.")
+
+    expression = statements[0]
+    if not isinstance(expression, exp.Query):
+        return QueryAnalysis(sql, False, f"Only SELECT queries are allowed, got {expression.key.upper()}.")
+
+    # One pass over the tree for both the safety checks and table extraction
+    cte_names = set()
+    table_names = set()
+    for node in expression.walk():
+        if isinstance(node, exp.Func):
+            name = _function_name(node)
+            if FORBIDDEN_FUNCTIONS.match(name):
+                return QueryAnalysis(sql, False, f"Function {name}() is not allowed.")
+        elif isinstance(node, exp.Table):
+            table_names.add(node.name)
+        elif isinstance(node, exp.CTE):
+            cte_names.add(node.alias_or_name)
+        elif isinstance(node, FORBIDDEN_NODES):
+            return QueryAnalysis(sql, False, f"{node.key.upper()} is not allowed in a read-only query.")
+
+    tables = frozenset(name for name in table_names if name and name not in cte_names)
+    return QueryAnalysis(sql, True, expression=expression, tables=tables)
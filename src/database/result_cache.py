@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+from src.database.query_analysis import parse_query
+
+logger = logging.getLogger("result-cache")
+
+# Queries calling these return different results on every run
+VOLATILE_FUNCTIONS = {
+    "now", "random", "clock_timestamp", "statement_timestamp", "transaction_timestamp",
+    "timeofday", "gen_random_uuid", "uuid_generate_v4", "nextval", "currval", "txid_current",
+}
+VOLATILE_EXPRESSIONS = (exp.CurrentTimestamp, exp.CurrentDate, exp.CurrentTime, exp.Rand)
+
+
+def _parse_table_ttls(spec: str) -> Dict[str, float]:
+    """Parse "orders=30,customers=600" into a per-table TTL map."""
+    ttls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            table, ttl = item.split("=", 1)
+            ttls[table.strip().lower()] = float(ttl)
+    return ttls
+
+
+def canonicalize(query: str) -> Optional[Tuple[str, Set[str]]]:
+    """
+    Return the canonical SQL text and referenced tables, or None when the
+    query should not be cached (unparseable, no tables, or volatile).
+    """
+    try:
+        expression = parse_query(query)
+    except Exception:
+        return None
+    expression = normalize_identifiers(expression.copy(), dialect="postgres")
+
+    for node in expression.find_all(exp.Func):
+        if isinstance(node, VOLATILE_EXPRESSIONS):
+            return None
+        if isinstance(node, exp.Anonymous) and node.name.lower() in VOLATILE_FUNCTIONS:
+            return None
+
+    cte_names = {cte.alias_or_name for cte in expression.find_all(exp.CTE)}
+    tables = {
+        table.name for table in expression.find_all(exp.Table)
+        if table.name and table.name not in cte_names
+    }
+    if not tables:
+        return None
+    return expression.sql(dialect="postgres", comments=False), tables
+
+
+class ResultCache:
+    """
+    In-memory cache of query results inside the MCP server.
+
+    Keys are sqlglot-canonicalized SQL, so formatting and keyword case do not
+    matter. Each entry lives for the smallest TTL of the tables it reads,
+    entries are evicted least-recently-used first once ``max_bytes`` is
+    exceeded, and entries can be invalidated by table name.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        default_ttl: Optional[float] = None,
+        table_ttls: Optional[Dict[str, float]] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("RESULT_CACHE_ENABLED", "false").lower() == "true"
+        )
+        self.default_ttl = default_ttl if default_ttl is not None else float(os.getenv("RESULT_CACHE_TTL_SECS", "60"))
+        self.table_ttls = (
+            table_ttls if table_ttls is not None
+            else _parse_table_ttls(os.getenv("RESULT_CACHE_TABLE_TTLS", ""))
+        )
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, tables: Iterable[str]) -> float:
+        return min(self.table_ttls.get(table, self.default_ttl) for table in tables)
+
+    def get(self, key: str) -> Optional[Tuple[Any, float, float]]:
+        """Return (rows, age_seconds, ttl_seconds) for a fresh entry, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            age = time.time() - entry["stored_at"]
+            if age > entry["ttl"]:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["rows"], age, entry["ttl"]
+
+    def put(self, key: str, rows: Any, tables: Set[str]):
+        size = len(json.dumps(rows, default=str))
+        if size > self.max_bytes // 4:
+            # One huge result would flush everything else
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "rows": rows,
+                "tables": tables,
+                "size": size,
+                "ttl": self.ttl_for(tables),
+                "stored_at": time.time(),
+            }
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def invalidate(self, tables: Optional[List[str]] = None, prefix: Optional[str] = None) -> int:
+        """
+        Drop entries reading any of ``tables`` (all entries when None),
+        restricted to keys starting with ``prefix`` if given.
+        """
+        with self._lock:
+            if tables is None and prefix is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return dropped
+            targets = set(tables) | {table.lower() for table in tables} if tables is not None else None
+            keys = [
+                key for key, entry in self._entries.items()
+                if (targets is None or entry["tables"] & targets) and (prefix is None or key.startswith(prefix))
+            ]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
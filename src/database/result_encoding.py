@@ -0,0 +1,185 @@
+"""
+Wire formats for query results sent from the MCP server to the client.
+
+``rows``     JSON array of row objects (column names repeated on every row).
+``columns``  Column-major JSON with a typed schema header.
+``arrow``    Base64-encoded Arrow IPC stream (requires pyarrow on both sides).
+
+The server encodes pages with ``encode_page`` and the client turns any of
+them into a DataFrame with ``decode_page``.
+"""
+import base64
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence
+
+import pydantic_core
+
+FORMATS = ("rows", "columns", "arrow")
+
+# PostgreSQL type OIDs mapped to the logical types carried in the schema header
+PG_TYPE_NAMES = {
+    16: "bool",
+    20: "int", 21: "int", 23: "int", 26: "int",
+    700: "float", 701: "float",
+    1700: "decimal",
+    25: "string", 1043: "string", 1042: "string", 19: "string", 18: "string",
+    1082: "date",
+    1114: "timestamp",
+    1184: "timestamptz",
+    1083: "time", 1266: "time",
+    1186: "interval",
+    2950: "uuid",
+    114: "json", 3802: "json",
+    17: "bytes",
+}
+
+
+def column_types(description) -> List[str]:
+    """Logical types for a psycopg2 cursor description."""
+    return [PG_TYPE_NAMES.get(desc.type_code, "string") for desc in description]
+
+
+def to_json(payload: Dict[str, Any]) -> str:
+    """Serialize a response compactly; FastMCP would pretty-print a returned dict."""
+    return pydantic_core.to_json(payload, fallback=str).decode()
+
+
+def _json_column(values: List[Any], kind: str) -> List[Any]:
+    """
+    Convert one column to JSON-ready values. Datetimes and UUIDs are left to
+    ``to_json``, which writes them as ISO 8601 and plain strings.
+    """
+    if kind == "decimal":
+        return [None if v is None else float(v) for v in values]
+    if kind == "interval":
+        return [None if v is None else v.total_seconds() for v in values]
+    if kind == "bytes":
+        return [None if v is None else base64.b64encode(bytes(v)).decode("ascii") for v in values]
+    return values
+
+
+@lru_cache(maxsize=None)
+def _pyarrow():
+    """pyarrow, or None if not installed; imported with the first Arrow page, not with every server."""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _arrow_array(values: List[Any], kind: str):
+    pa = _pyarrow()
+    if kind == "bool":
+        return pa.array(values, type=pa.bool_())
+    if kind == "int":
+        return pa.array(values, type=pa.int64())
+    if kind in ("float", "decimal"):
+        return pa.array([None if v is None else float(v) for v in values], type=pa.float64())
+    if kind == "timestamp":
+        return pa.array(values, type=pa.timestamp("us"))
+    if kind == "timestamptz":
+        return pa.array(values, type=pa.timestamp("us", tz="UTC"))
+    if kind == "date":
+        return pa.array(values, type=pa.date32())
+    if kind == "interval":
+        return pa.array([None if v is None else v.total_seconds() for v in values], type=pa.float64())
+    if kind == "bytes":
+        return pa.array([None if v is None else bytes(v) for v in values], type=pa.binary())
+    if kind == "json":
+        return pa.array([None if v is None else json.dumps(v) for v in values], type=pa.string())
+    if kind in ("time", "uuid"):
+        values = [None if v is None else str(v) for v in values]
+    return pa.array(values, type=pa.string())
+
+
+def unique_names(names: Sequence[str]) -> List[str]:
+    """
+    Column names made unique by suffixing repeats (``id``, ``id_1``, ...).
+
+    Joins easily select two columns of the same name; pandas keeps both, but
+    Streamlit and Arrow conversion reject the frame.
+    """
+    taken = set(names)
+    seen = set()
+    unique = []
+    for name in names:
+        if name not in seen:
+            seen.add(name)
+            unique.append(name)
+            continue
+        n = 1
+        while f"{name}_{n}" in taken:
+            n += 1
+        taken.add(f"{name}_{n}")
+        unique.append(f"{name}_{n}")
+    return unique
+
+
+def encode_page(names: Sequence[str], types: Sequence[str], rows: Sequence[tuple], fmt: str) -> Dict[str, Any]:
+    """Encode a page of row tuples in the requested wire format."""
+    if fmt == "rows":
+        keys = unique_names(names)
+        return {"rows": [dict(zip(keys, row)) for row in rows]}
+
+    schema = [{"name": name, "type": kind} for name, kind in zip(names, types)]
+    columns = [list(values) for values in zip(*rows)] if rows else [[] for _ in names]
+
+    if fmt == "arrow":
+        pa = _pyarrow()
+        if pa is None:
+            raise ValueError("The 'arrow' result format requires pyarrow to be installed.")
+        batch = pa.RecordBatch.from_arrays(
+            [_arrow_array(values, kind) for values, kind in zip(columns, types)],
+            names=list(names)
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return {"schema": schema, "arrow": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")}
+
+    if fmt == "columns":
+        return {
+            "schema": schema,
+            "data": [_json_column(values, kind) for values, kind in zip(columns, types)]
+        }
+    raise ValueError(f"Unknown result format '{fmt}'. Expected one of {FORMATS}.")
+
+
+def _decode_column(values: List[Any], kind: str):
+    import numpy as np
+    import pandas as pd
+
+    if kind in ("float", "decimal", "interval"):
+        return np.array(values, dtype=np.float64)
+    if kind == "int":
+        return pd.array(values, dtype="Int64") if None in values else np.array(values, dtype=np.int64)
+    if kind == "bool":
+        return pd.array(values, dtype="boolean") if None in values else np.array(values, dtype=bool)
+    if kind in ("timestamp", "date"):
+        return pd.to_datetime(values, format="ISO8601")
+    if kind == "timestamptz":
+        return pd.to_datetime(values, format="ISO8601", utc=True)
+    # Keep empty text columns as objects rather than letting pandas guess float
+    return values if values else np.array([], dtype=object)
+
+
+def decode_page(page: Dict[str, Any], columns: Sequence[str] = ()):
+    """Build a DataFrame from a page in any wire format, with unique column names."""
+    import pandas as pd
+
+    if "arrow" in page:
+        reader = _pyarrow().ipc.open_stream(base64.b64decode(page["arrow"]))
+        table = reader.read_all()
+        return table.rename_columns(unique_names(table.column_names)).to_pandas(date_as_object=False)
+    if "data" in page:
+        # Key by position so duplicate column names (e.g. two "id"s) survive until renamed
+        df = pd.DataFrame({
+            i: _decode_column(values, col["type"])
+            for i, (col, values) in enumerate(zip(page["schema"], page["data"]))
+        })
+        df.columns = unique_names([col["name"] for col in page["schema"]])
+        return df
+    # Row objects are keyed by the unique names (see encode_page)
+    return pd.DataFrame.from_records(page.get("rows", []), columns=unique_names(columns) or None)
@@ -0,0 +1,820 @@
+"""
+Precomputed rollups for the GROUP BY shapes users ask for most.
+
+Every query the server runs is logged by shape, read from its sqlglot tree:
+the FROM clause (tables and joins), the WHERE conjuncts, the group keys and
+the aggregated measures. Shapes seen at least ROLLUP_MIN_HITS times within
+ROLLUP_WINDOW_SECS become rollups: the same FROM and filters grouped by the
+same keys, keeping COUNT(*) and the SUM, COUNT, MIN and MAX of each measure
+that the logged queries need. A rollup lives either as a table in a local
+SQLite file, filled from a read-only extract (backend "sqlite"), or as a
+PostgreSQL materialized view (backend "matview", for roles allowed to create
+them), and is refreshed every ROLLUP_REFRESH_SECS. Every pooled server
+process logs to the same file, but only the one holding the maintenance
+lease in it mines and builds rollups; the others reload the rollup list
+from the file.
+
+``RollupManager.route`` rewrites a query that a fresh rollup can answer:
+same FROM, the rollup's filters plus optional filters on its group keys,
+and group keys and aggregates expressible over the rollup's columns (AVG is
+re-aggregated as SUM / COUNT). Rollups older than ROLLUP_MAX_STALENESS_SECS
+are not used.
+"""
+import datetime as dt
+import decimal
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+from src.database.query_analysis import parse_query
+from src.database.result_encoding import column_types
+
+logger = logging.getLogger("rollups")
+
+BACKENDS = ("sqlite", "matview")
+
+# Aggregates a rollup can re-aggregate, and the per-measure columns each needs
+REAGGREGABLE = {
+    exp.Sum: ("sum",),
+    exp.Count: ("count",),
+    exp.Min: ("min",),
+    exp.Max: ("max",),
+    exp.Avg: ("sum", "count"),
+}
+
+# Logical types of values as they are stored in the SQLite side store
+SQLITE_TYPES = {"decimal": "float", "interval": "float", "json": "string", "uuid": "string"}
+
+
+def _sql(node: exp.Expression) -> str:
+    return node.sql(dialect="postgres", comments=False)
+
+
+def _arg(node: exp.Expression, name: str) -> Any:
+    # Newer sqlglot versions store keyword-named args such as FROM under "from_"
+    return node.args.get(name) or node.args.get(f"{name}_")
+
+
+def _conjuncts(condition: exp.Expression) -> List[exp.Expression]:
+    return list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+
+
+def _normalize(expression: exp.Select) -> Optional[exp.Select]:
+    """
+    Copy of a query with identifiers lowercased and, for single-table
+    queries, the table alias and column qualifiers dropped, so ``o.amount``
+    and ``amount`` give the same shape.
+    """
+    select = normalize_identifiers(expression.copy(), dialect="postgres")
+    if select.args.get("joins"):
+        return select
+    table = _arg(select, "from").this
+    if not isinstance(table, exp.Table):
+        return None
+    qualifiers = {table.alias_or_name, table.name}
+    for column in select.find_all(exp.Column):
+        if column.table in qualifiers:
+            column.set("table", None)
+    table.set("alias", None)
+    return select
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """What a GROUP BY query reads and aggregates, in canonical SQL."""
+    source: str
+    filters: Tuple[str, ...]
+    keys: Tuple[str, ...]
+    measures: Dict[str, Tuple[str, ...]] = field(compare=False)
+
+    @property
+    def key(self) -> str:
+        """Identifies the rollup that serves this shape (measures are merged into it)."""
+        text = json.dumps([self.source, self.filters, self.keys])
+        return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"source": self.source, "filters": self.filters, "keys": self.keys, "measures": self.measures}
+
+
+@lru_cache(maxsize=512)
+def query_shape(sql: str) -> Optional[Tuple[QueryShape, exp.Select]]:
+    """
+    The GROUP BY shape of a query and its normalized tree, or None for
+    queries a rollup cannot answer (no aggregation, subqueries, window
+    functions, DISTINCT aggregates, grouping sets). Trees are shared: copy
+    them before transforming.
+    """
+    try:
+        expression = parse_query(sql)
+    except Exception:
+        return None
+    if not isinstance(expression, exp.Select) or _arg(expression, "from") is None:
+        return None
+    if any(_arg(expression, arg) for arg in ("with", "distinct", "laterals", "pivots", "qualify", "windows")):
+        return None
+    for node in expression.walk():
+        if node is not expression and isinstance(node, (exp.Query, exp.Window, exp.Filter)):
+            return None
+
+    select = _normalize(expression)
+    if select is None:
+        return None
+    group = select.args.get("group")
+    if group is not None and any(group.args.get(arg) for arg in ("grouping_sets", "cube", "rollup")):
+        return None
+    aggregates = list(select.find_all(exp.AggFunc))
+    if group is None and not aggregates:
+        return None
+
+    measures: Dict[str, set] = {}
+    for aggregate in aggregates:
+        stats = REAGGREGABLE.get(type(aggregate))
+        argument = aggregate.this
+        if stats is None or argument is None or isinstance(argument, exp.Distinct) or argument.find(exp.AggFunc):
+            return None
+        if isinstance(aggregate, exp.Count) and isinstance(argument, exp.Star):
+            # Every rollup keeps COUNT(*)
+            continue
+        measures.setdefault(_sql(argument), set()).update(stats)
+
+    aliases = {item.alias: item.this for item in select.expressions if isinstance(item, exp.Alias)}
+    inputs = {column.name for item in select.expressions for column in item.find_all(exp.Column)}
+    keys = set()
+    for item in group.expressions if group is not None else []:
+        if isinstance(item, exp.Literal) and item.is_int:
+            position = int(item.name) - 1
+            if not 0 <= position < len(select.expressions):
+                return None
+            item = select.expressions[position].unalias()
+        elif isinstance(item, exp.Column) and not item.table and item.name in aliases:
+            if item.name in inputs:
+                # Postgres would group by the input column of that name, not the alias
+                return None
+            item = aliases[item.name]
+        keys.add(_sql(item))
+
+    where = select.args.get("where")
+    filters = sorted(_sql(condition) for condition in _conjuncts(where.this)) if where is not None else []
+    source = " ".join(_sql(part) for part in [_arg(select, "from"), *(select.args.get("joins") or [])])
+    shape = QueryShape(
+        source=source,
+        filters=tuple(filters),
+        keys=tuple(sorted(keys)),
+        measures={measure: tuple(sorted(stats)) for measure, stats in sorted(measures.items())},
+    )
+    return shape, select
+
+
+def _output_name(node: exp.Expression) -> Optional[str]:
+    """The column name Postgres gives an unaliased select expression."""
+    if isinstance(node, exp.Column):
+        return node.name
+    if isinstance(node, exp.Cast):
+        return _output_name(node.this)
+    if isinstance(node, exp.Func):
+        return _sql(node).split("(", 1)[0].strip().lower() or None
+    return None
+
+
+@dataclass
+class Rollup:
+    """One precomputed aggregate and its refresh state."""
+    name: str
+    source: str
+    filters: Tuple[str, ...]
+    keys: Tuple[str, ...]
+    measures: Dict[str, Tuple[str, ...]]
+    status: str = "pending"
+    refreshed_at: Optional[float] = None
+    checked_at: Optional[float] = None
+    rows: int = 0
+    types: Dict[str, str] = field(default_factory=dict)
+    built: Optional[str] = None
+    error: Optional[str] = None
+    hits: int = 0
+
+    def column(self, measure: str, stat: str) -> str:
+        return f"m{list(self.measures).index(measure)}_{stat}"
+
+    def definition(self) -> str:
+        """The aggregate query that fills the rollup."""
+        columns = [f"{key} AS k{i}" for i, key in enumerate(self.keys)]
+        for measure, stats in self.measures.items():
+            columns += [f"{stat.upper()}({measure}) AS {self.column(measure, stat)}" for stat in stats]
+        columns.append("COUNT(*) AS n")
+        sql = f"SELECT {', '.join(columns)} {self.source}"
+        if self.filters:
+            sql += " WHERE " + " AND ".join(f"({condition})" for condition in self.filters)
+        if self.keys:
+            sql += " GROUP BY " + ", ".join(self.keys)
+        return sql
+
+    def _reaggregate(self, node: exp.AggFunc) -> exp.Expression:
+        if isinstance(node, exp.Count) and isinstance(node.this, exp.Star):
+            return exp.cast(exp.Sum(this=exp.column("n")), "BIGINT")
+        measure = _sql(node.this)
+        needed = REAGGREGABLE[type(node)]
+        if measure not in self.measures or not set(needed) <= set(self.measures[measure]):
+            raise KeyError(measure)
+        column = lambda stat: exp.column(self.column(measure, stat))
+        if isinstance(node, exp.Avg):
+            # Times 1.0 keeps the division fractional in both Postgres and SQLite
+            return exp.Div(
+                this=exp.Mul(this=exp.Sum(this=column("sum")), expression=exp.Literal.number("1.0")),
+                expression=exp.Nullif(this=exp.Sum(this=column("count")), expression=exp.Literal.number(0)),
+                typed=True,
+            )
+        if isinstance(node, exp.Count):
+            return exp.cast(exp.Sum(this=column("count")), "BIGINT")
+        if isinstance(node, exp.Sum):
+            return exp.Sum(this=column("sum"))
+        return type(node)(this=column(needed[0]))
+
+    def rewrite(self, select: exp.Select, shape: QueryShape) -> Optional[exp.Select]:
+        """``select`` reading this rollup instead of the base tables, or None if it cannot."""
+        key_columns = {key: f"k{i}" for i, key in enumerate(self.keys)}
+
+        def replace(node: exp.Expression) -> exp.Expression:
+            if isinstance(node, exp.AggFunc):
+                return self._reaggregate(node)
+            if isinstance(node, exp.Condition) and not isinstance(node, exp.Literal):
+                column = key_columns.get(_sql(node))
+                if column is not None:
+                    return exp.column(column)
+            return node
+
+        rewritten = select.copy()
+        rewritten.from_(self.name, copy=False)
+        rewritten.set("joins", None)
+        where = rewritten.args.get("where")
+        # Filters the rollup already applied go; the rest must be on its group keys
+        extra = [
+            condition for condition in (_conjuncts(where.this) if where is not None else [])
+            if _sql(condition) not in self.filters
+        ]
+        rewritten.set("where", exp.Where(this=exp.and_(*extra)) if extra else None)
+        # Keep the output column names the original query would have had
+        rewritten.set("expressions", [
+            item if isinstance(item, exp.Alias) or _output_name(item) is None
+            else exp.alias_(item, _output_name(item), quoted=True)
+            for item in rewritten.expressions
+        ])
+        try:
+            rewritten = rewritten.transform(replace)
+        except KeyError:
+            return None
+
+        allowed = set(key_columns.values()) | {"n"} | {item.alias for item in rewritten.expressions if isinstance(item, exp.Alias)}
+        allowed |= {self.column(measure, stat) for measure, stats in self.measures.items() for stat in stats}
+        for column in rewritten.find_all(exp.Column):
+            if column.table or column.name not in allowed:
+                return None
+        return rewritten
+
+    def to_row(self) -> Tuple:
+        definition = {"source": self.source, "filters": self.filters, "keys": self.keys, "measures": self.measures}
+        return (
+            self.name, json.dumps(definition), self.status, self.refreshed_at, self.checked_at,
+            self.rows, json.dumps(self.types), self.built, self.error, self.hits,
+        )
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> "Rollup":
+        name, definition, status, refreshed_at, checked_at, rows, types, built, error, hits = row
+        definition = json.loads(definition)
+        return cls(
+            name=name,
+            source=definition["source"],
+            filters=tuple(definition["filters"]),
+            keys=tuple(definition["keys"]),
+            measures={measure: tuple(stats) for measure, stats in definition["measures"].items()},
+            status=status, refreshed_at=refreshed_at, checked_at=checked_at, rows=rows,
+            types=json.loads(types), built=built, error=error, hits=hits,
+        )
+
+
+@dataclass
+class RollupMatch:
+    """A query rewritten to read a rollup."""
+    rollup: Rollup
+    sql: str
+    types: List[Optional[str]]
+    meta: Dict[str, Any]
+
+
+def _to_sqlite(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, dt.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _from_sqlite(value: Any, kind: str) -> Any:
+    if value is None or not isinstance(value, str):
+        return value
+    if kind == "date":
+        return dt.date.fromisoformat(value)
+    if kind in ("timestamp", "timestamptz"):
+        return dt.datetime.fromisoformat(value)
+    if kind == "time":
+        return dt.time.fromisoformat(value)
+    return value
+
+
+def _value_type(values: List[Any]) -> str:
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return "bool"
+        if isinstance(value, int):
+            return "int"
+        if isinstance(value, float):
+            return "float"
+        if isinstance(value, bytes):
+            return "bytes"
+        return "string"
+    return "string"
+
+
+class RollupManager:
+    """
+    Mines the query log for hot GROUP BY shapes, keeps a rollup for each and
+    routes matching queries to them.
+
+    ``pool`` returns the server's read-only connection pool (extracts for the
+    SQLite backend); ``connect`` opens a writable connection, used only by
+    the matview backend to create and refresh materialized views.
+
+    Managers in several processes may share ``path``: maintenance runs only
+    in the one holding the lease row in it, renewed before each refresh and
+    taken over once it expires (e.g. when its process exits).
+    """
+
+    def __init__(
+        self,
+        pool: Optional[Callable[[], Any]] = None,
+        connect: Optional[Callable[[], Any]] = None,
+        enabled: Optional[bool] = None,
+        backend: Optional[str] = None,
+        path: Optional[str] = None,
+        min_hits: Optional[int] = None,
+        window: Optional[float] = None,
+        refresh_interval: Optional[float] = None,
+        max_staleness: Optional[float] = None,
+        max_rollups: Optional[int] = None,
+        max_rows: Optional[int] = None,
+    ):
+        self.pool = pool
+        self.connect = connect
+        self.enabled = (
+            enabled if enabled is not None
+            else os.getenv("ROLLUPS_ENABLED", "false").lower() == "true"
+        )
+        self.backend = (backend or os.getenv("ROLLUP_BACKEND", "sqlite")).lower()
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown rollup backend '{self.backend}'. Expected one of {BACKENDS}.")
+        self.path = path or os.getenv("ROLLUP_PATH", os.path.join(".cache", "rollups.sqlite"))
+        self.min_hits = min_hits if min_hits is not None else int(os.getenv("ROLLUP_MIN_HITS", "3"))
+        self.window = window if window is not None else float(os.getenv("ROLLUP_WINDOW_SECS", "86400"))
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None else float(os.getenv("ROLLUP_REFRESH_SECS", "900"))
+        )
+        self.max_staleness = (
+            max_staleness if max_staleness is not None
+            else float(os.getenv("ROLLUP_MAX_STALENESS_SECS", str(2 * self.refresh_interval)))
+        )
+        self.max_rollups = max_rollups if max_rollups is not None else int(os.getenv("ROLLUP_MAX_ROLLUPS", "20"))
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv("ROLLUP_MAX_ROWS", "50000"))
+        self.refresh_timeout_ms = int(os.getenv("ROLLUP_REFRESH_TIMEOUT_MS", "300000"))
+        # Long enough to outlast one refresh and the wait for the next maintenance run
+        self.lease_seconds = 2 * min(self.refresh_interval, 60) + self.refresh_timeout_ms / 1000
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._rollups: Dict[str, Rollup] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._owner = uuid.uuid4().hex
+
+        self.routed = 0
+        self.fallbacks = 0
+        self.refreshes = 0
+        if self.enabled:
+            self._reload()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS query_log (
+                    shape_key TEXT NOT NULL,
+                    shape TEXT NOT NULL,
+                    executed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS query_log_executed_at ON query_log (executed_at);
+                CREATE INDEX IF NOT EXISTS query_log_shape_key ON query_log (shape_key);
+                CREATE TABLE IF NOT EXISTS rollups (
+                    name TEXT PRIMARY KEY,
+                    definition TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    refreshed_at REAL,
+                    checked_at REAL,
+                    rows INTEGER NOT NULL DEFAULT 0,
+                    types TEXT NOT NULL,
+                    built TEXT,
+                    error TEXT,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS maintenance_lease (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    forced INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _reload(self):
+        """Replace the in-memory rollups with those in the store."""
+        with self._lock:
+            rows = self._db().execute("SELECT * FROM rollups").fetchall()
+            self._rollups = {row[0]: Rollup.from_row(row) for row in rows}
+
+    def _claim(self, force: bool = False) -> bool:
+        """
+        Take or renew the maintenance lease; False while another process
+        holds it, in which case ``force`` leaves it a full-refresh request.
+        """
+        now = time.time()
+        expires_at = now + self.lease_seconds
+        with self._lock:
+            db = self._db()
+            # One write transaction, so two processes can't both see the lease as free
+            db.execute("INSERT OR IGNORE INTO maintenance_lease VALUES (1, ?, ?, 0)", (self._owner, expires_at))
+            claimed = db.execute(
+                "UPDATE maintenance_lease SET owner = ?, expires_at = ? WHERE owner = ? OR expires_at < ?",
+                (self._owner, expires_at, self._owner, now)
+            ).rowcount
+            if not claimed and force:
+                db.execute("UPDATE maintenance_lease SET forced = 1")
+            db.commit()
+        return bool(claimed)
+
+    def _take_forced(self) -> bool:
+        """Whether another process asked for a full refresh since the last run, clearing the request."""
+        with self._lock:
+            db = self._db()
+            forced = db.execute("SELECT forced FROM maintenance_lease").fetchone()
+            db.execute("UPDATE maintenance_lease SET forced = 0")
+            db.commit()
+        return bool(forced and forced[0])
+
+    def _save(self, rollup: Rollup):
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rollup.to_row())
+            db.commit()
+
+    def observe(self, sql: str):
+        """Log an executed query's shape for mining."""
+        parsed = query_shape(sql)
+        if parsed is None:
+            return
+        shape = parsed[0]
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO query_log VALUES (?, ?, ?)",
+                (shape.key, json.dumps(shape.to_dict()), time.time())
+            )
+            db.commit()
+
+    def route(self, sql: str) -> Optional[RollupMatch]:
+        """Rewrite ``sql`` to read the smallest fresh rollup that can answer it, if any."""
+        if not self._rollups:
+            return None
+        parsed = query_shape(sql)
+        if parsed is None:
+            return None
+        shape, select = parsed
+        now = time.time()
+        with self._lock:
+            candidates = sorted(
+                (
+                    rollup for rollup in self._rollups.values()
+                    if rollup.status == "ready" and rollup.source == shape.source
+                    and set(rollup.filters) <= set(shape.filters)
+                    and now - rollup.refreshed_at <= self.max_staleness
+                ),
+                key=lambda rollup: rollup.rows
+            )
+        for rollup in candidates:
+            rewritten = rollup.rewrite(select, shape)
+            if rewritten is None:
+                continue
+            rollup.hits += 1
+            self.routed += 1
+            types = []
+            for item in rewritten.expressions:
+                node = item.unalias()
+                if isinstance(node, (exp.Min, exp.Max)):
+                    node = node.this
+                types.append(rollup.types.get(node.name) if isinstance(node, exp.Column) else None)
+            return RollupMatch(
+                rollup=rollup,
+                sql=rewritten.sql(dialect="sqlite" if self.backend == "sqlite" else "postgres"),
+                types=types,
+                meta={
+                    "name": rollup.name,
+                    "backend": self.backend,
+                    "refreshed_at": dt.datetime.fromtimestamp(rollup.refreshed_at, dt.timezone.utc).isoformat(),
+                    "age_seconds": round(now - rollup.refreshed_at, 1),
+                    "rows": rollup.rows,
+                },
+            )
+        return None
+
+    def execute(self, match: RollupMatch, max_rows: int) -> Tuple[List[str], List[str], List[tuple], bool]:
+        """Run a rewritten query against the SQLite side store: (columns, types, rows, truncated)."""
+        with self._lock:
+            cur = self._db().execute(match.sql)
+            columns = [desc[0] for desc in cur.description]
+            rows = cur.fetchmany(max_rows + 1)
+        truncated = len(rows) > max_rows
+        rows = rows[:max_rows]
+        types = [
+            kind or _value_type([row[i] for row in rows])
+            for i, kind in enumerate(match.types)
+        ]
+        if any(kind in ("date", "timestamp", "timestamptz", "time") for kind in types):
+            rows = [tuple(_from_sqlite(value, kind) for value, kind in zip(row, types)) for row in rows]
+        return columns, types, rows, truncated
+
+    def fallback(self, match: RollupMatch, error: Exception):
+        """Record that a routed query had to run on the base tables after all."""
+        self.fallbacks += 1
+        logger.warning(f"Rollup {match.rollup.name} could not serve a query, using base tables: {error}")
+
+    def mine(self) -> List[Rollup]:
+        """
+        Turn hot shapes from the query log into rollups and drop rollups whose
+        shapes went cold. Returns the rollups that need (re)building.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM query_log WHERE executed_at < ?", (now - self.window,))
+            db.commit()
+            hot = db.execute(
+                "SELECT shape_key FROM query_log GROUP BY shape_key HAVING COUNT(*) >= ? "
+                "ORDER BY COUNT(*) DESC LIMIT ?",
+                (self.min_hits, self.max_rollups)
+            ).fetchall()
+            shapes = {
+                key: [json.loads(text) for (text,) in db.execute(
+                    "SELECT DISTINCT shape FROM query_log WHERE shape_key = ?", (key,)
+                )]
+                for (key,) in hot
+            }
+
+        changed = []
+        for key, variants in shapes.items():
+            name = f"rollup_{key}"
+            measures: Dict[str, set] = {}
+            for variant in variants:
+                for measure, stats in variant["measures"].items():
+                    measures.setdefault(measure, set()).update(stats)
+            measures = {measure: tuple(sorted(stats)) for measure, stats in sorted(measures.items())}
+            existing = self._rollups.get(name)
+            if existing is not None and all(
+                set(stats) <= set(existing.measures.get(measure, ())) for measure, stats in measures.items()
+            ):
+                continue
+            if existing is not None:
+                # Keep the measures already served alongside the new ones
+                for measure, stats in existing.measures.items():
+                    measures[measure] = tuple(sorted(set(stats) | set(measures.get(measure, ()))))
+            first = variants[0]
+            rollup = Rollup(
+                name=name,
+                source=first["source"],
+                filters=tuple(first["filters"]),
+                keys=tuple(first["keys"]),
+                measures=dict(sorted(measures.items())),
+                built=existing.built if existing else None,
+                hits=existing.hits if existing else 0,
+            )
+            with self._lock:
+                self._rollups[name] = rollup
+            self._save(rollup)
+            changed.append(rollup)
+
+        for name in [name for name in list(self._rollups) if name[len("rollup_"):] not in shapes]:
+            self.drop(name)
+        return changed
+
+    def drop(self, name: str):
+        """Remove a rollup and its stored data."""
+        with self._lock:
+            rollup = self._rollups.pop(name, None)
+            db = self._db()
+            db.execute("DELETE FROM rollups WHERE name = ?", (name,))
+            if self.backend == "sqlite":
+                db.execute(f'DROP TABLE IF EXISTS "{name}"')
+            db.commit()
+        if self.backend == "matview" and rollup is not None and rollup.built:
+            conn = self.connect()
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
+            finally:
+                conn.close()
+        logger.info(f"Dropped rollup {name}")
+
+    def _extract(self, rollup: Rollup):
+        """Fill a SQLite table from a read-only extract of the rollup's definition."""
+        with self.pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (self.refresh_timeout_ms,))
+                cur.execute(rollup.definition())
+                rows = cur.fetchmany(self.max_rows + 1)
+                description = cur.description
+        if len(rows) > self.max_rows:
+            return None
+        columns = [desc[0] for desc in description]
+        types = {name: SQLITE_TYPES.get(kind, kind) for name, kind in zip(columns, column_types(description))}
+        temporary = f"{rollup.name}__new"
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(f'DROP TABLE IF EXISTS "{temporary}"')
+                db.execute(f'CREATE TABLE "{temporary}" ({", ".join(columns)})')
+                db.executemany(
+                    f'INSERT INTO "{temporary}" VALUES ({", ".join("?" * len(columns))})',
+                    [tuple(_to_sqlite(value) for value in row) for row in rows]
+                )
+                db.execute(f'DROP TABLE IF EXISTS "{rollup.name}"')
+                db.execute(f'ALTER TABLE "{temporary}" RENAME TO "{rollup.name}"')
+        return len(rows), types
+
+    def _materialize(self, rollup: Rollup):
+        """Create or refresh the rollup's materialized view."""
+        definition = rollup.definition()
+        conn = self.connect()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SET statement_timeout = %s", (self.refresh_timeout_ms,))
+                # Servers on other hosts (another ROLLUP_PATH) may maintain the same view;
+                # the session lock is released when the connection closes
+                cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (rollup.name,))
+                if rollup.built != definition:
+                    cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {rollup.name}")
+                    cur.execute(f"CREATE MATERIALIZED VIEW {rollup.name} AS {definition}")
+                    if rollup.keys:
+                        # A unique index lets later refreshes run CONCURRENTLY, without blocking readers
+                        keys = ", ".join(f"k{i}" for i in range(len(rollup.keys)))
+                        cur.execute(f"CREATE UNIQUE INDEX {rollup.name}_keys ON {rollup.name} ({keys})")
+                    rollup.built = definition
+                else:
+                    concurrently = " CONCURRENTLY" if rollup.keys else ""
+                    cur.execute(f"REFRESH MATERIALIZED VIEW{concurrently} {rollup.name}")
+                cur.execute(f"SELECT * FROM {rollup.name} LIMIT 0")
+                types = dict(zip([desc[0] for desc in cur.description], column_types(cur.description)))
+                cur.execute(f"SELECT COUNT(*) FROM {rollup.name}")
+                rows = cur.fetchone()[0]
+                if rows > self.max_rows:
+                    cur.execute(f"DROP MATERIALIZED VIEW {rollup.name}")
+                    rollup.built = None
+                    return None
+        finally:
+            conn.close()
+        return rows, types
+
+    def refresh(self, rollup: Rollup):
+        """(Re)build one rollup from the base tables."""
+        started = time.perf_counter()
+        rollup.checked_at = time.time()
+        try:
+            built = self._extract(rollup) if self.backend == "sqlite" else self._materialize(rollup)
+        except Exception as e:
+            rollup.status, rollup.error = "failed", str(e).strip()
+            logger.warning(f"Refreshing rollup {rollup.name} failed: {rollup.error}")
+        else:
+            if built is None:
+                rollup.status, rollup.error = "too_large", f"More than {self.max_rows} rows"
+            else:
+                rollup.rows, rollup.types = built
+                rollup.status, rollup.error = "ready", None
+                rollup.refreshed_at = rollup.checked_at
+                self.refreshes += 1
+                logger.info(
+                    f"Refreshed rollup {rollup.name} ({rollup.rows} rows) "
+                    f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+                )
+        self._save(rollup)
+
+    def maintain(self, force: bool = False) -> bool:
+        """
+        Mine the log, then refresh new rollups and those older than the refresh interval.
+
+        Only the lease holder maintains; another process reloads the rollups
+        from the store instead, and a forced refresh is left to the holder's
+        next run. Returns whether this process maintained.
+        """
+        with self._refresh_lock:
+            if not self._claim(force):
+                self._reload()
+                return False
+            force = self._take_forced() or force
+            changed = {rollup.name for rollup in self.mine()}
+            now = time.time()
+            for rollup in list(self._rollups.values()):
+                # Too large stays that way until new measures change the definition
+                due = rollup.status != "too_large" and (
+                    rollup.checked_at is None or now - rollup.checked_at >= self.refresh_interval
+                )
+                if force or rollup.name in changed or due:
+                    if not self._claim():
+                        # Lost the lease mid-run (a refresh outlasted it); the new holder carries on
+                        self._reload()
+                        return False
+                    self.refresh(rollup)
+            return True
+
+    def start(self):
+        """Mine and refresh in a background thread, at most a minute apart."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="rollup-maintenance", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(min(self.refresh_interval, 60)):
+            try:
+                self.maintain()
+            except Exception as e:
+                logger.warning(f"Rollup maintenance failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self.enabled:
+            # Let another process take over maintenance without waiting for the lease to expire
+            with self._lock:
+                db = self._db()
+                db.execute("UPDATE maintenance_lease SET expires_at = 0 WHERE owner = ?", (self._owner,))
+                db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            rollups = list(self._rollups.values())
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "refreshes": self.refreshes,
+            "rollups": [
+                {
+                    "name": rollup.name,
+                    "status": rollup.status,
+                    "rows": rollup.rows,
+                    "hits": rollup.hits,
+                    "age_seconds": round(now - rollup.refreshed_at, 1) if rollup.refreshed_at else None,
+                    "error": rollup.error,
+                    "definition": rollup.definition(),
+                }
+                for rollup in rollups
+            ],
+        }
@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional
+
+logger = logging.getLogger("schema-cache")
+
+
+class SchemaCache:
+    """
+    Process-wide cache of the full database schema.
+
+    Within ``ttl`` seconds a cached schema is returned without contacting the
+    server. After that it is revalidated with the cheap schema fingerprint and
+    only re-fetched when the fingerprint has changed.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("SCHEMA_CACHE_TTL_SECS", "300"))
+        self._entries: Dict[Hashable, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.refreshes = 0
+
+    async def get(self, mcp) -> Dict[str, Any]:
+        """Return the schema for the database ``mcp`` is connected to."""
+        key = mcp.connection_key
+        with self._lock:
+            entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            if now - entry["checked_at"] < self.ttl:
+                self.hits += 1
+                return entry["schema"]
+            fingerprint = await mcp.get_schema_fingerprint()
+            if fingerprint == entry["schema"]["fingerprint"]:
+                self.revalidations += 1
+                entry["checked_at"] = now
+                return entry["schema"]
+            logger.info("Schema fingerprint changed, refreshing cached schema")
+
+        schema = await mcp.get_full_schema()
+        self.refreshes += 1
+        with self._lock:
+            self._entries[key] = {"schema": schema, "checked_at": now}
+        return schema
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop the cached schema for one database, or for all of them."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "refreshes": self.refreshes,
+        }
+
+
+_schema_cache = SchemaCache()
+
+
+def get_schema_cache() -> SchemaCache:
+    """Return the process-wide schema cache."""
+    return _schema_cache
@@ -0,0 +1,412 @@
+import asyncio
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Deque, Dict, Hashable, Optional, Tuple
+
+if TYPE_CHECKING:
+    from mcp import ClientSession, StdioServerParameters
+
+logger = logging.getLogger("mcp-session-pool")
+
+DEFAULT_TENANT = "default"
+# Tools acting on state held by one server process, which a reconnect loses
+STATEFUL_TOOLS = frozenset({"fetch_page", "close_query"})
+
+
+class FairScheduler:
+    """
+    Admits callers fairly across tenants, first come first served within a
+    tenant, with at most ``capacity`` admitted at once overall and at most a
+    profile's ``limit`` at once per connection profile. The next place goes
+    to the waiting tenant holding the fewest (ties round-robin), so a tenant
+    sending many requests together (e.g. a dashboard) queues behind itself
+    instead of in front of everyone else.
+
+    Not thread-safe: used only from the pool's event loop.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.running = 0
+        self._per_profile: Dict[Hashable, int] = {}
+        self._per_tenant: Dict[Hashable, int] = {}
+        self._waiting: "OrderedDict[Hashable, Deque[tuple]]" = OrderedDict()
+
+    def _admissible(self, profile: Hashable, limit: int) -> bool:
+        return limit <= 0 or self._per_profile.get(profile, 0) < limit
+
+    def _next(self) -> Optional[Tuple[Hashable, tuple]]:
+        best = None
+        for tenant, queue in self._waiting.items():
+            entry = next((entry for entry in queue if self._admissible(entry[1], entry[2])), None)
+            if entry is not None and (best is None or self._per_tenant.get(tenant, 0) < self._per_tenant.get(best[0], 0)):
+                best = (tenant, entry)
+        return best
+
+    def _dispatch(self):
+        while self.running < self.capacity:
+            found = self._next()
+            if found is None:
+                return
+            tenant, entry = found
+            queue = self._waiting[tenant]
+            queue.remove(entry)
+            if queue:
+                # Served tenants go to the back of the round
+                self._waiting.move_to_end(tenant)
+            else:
+                del self._waiting[tenant]
+            future, profile, _ = entry
+            self.running += 1
+            self._per_profile[profile] = self._per_profile.get(profile, 0) + 1
+            self._per_tenant[tenant] = self._per_tenant.get(tenant, 0) + 1
+            future.set_result(None)
+
+    async def acquire(self, tenant: Hashable, profile: Hashable = None, limit: int = 0):
+        """Wait for this tenant's turn and a free place for its profile."""
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, profile, limit)
+        self._waiting.setdefault(tenant, deque()).append(entry)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the wait was given up
+                self.release(tenant, profile)
+            else:
+                queue = self._waiting.get(tenant)
+                if queue is not None and entry in queue:
+                    queue.remove(entry)
+                    if not queue:
+                        del self._waiting[tenant]
+            raise
+
+    def release(self, tenant: Hashable, profile: Hashable = None):
+        self.running -= 1
+        for counts, key in ((self._per_profile, profile), (self._per_tenant, tenant)):
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+        self._dispatch()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "waiting": sum(len(queue) for queue in self._waiting.values()),
+            "tenants_waiting": len(self._waiting),
+        }
+
+
+class _Slot:
+    """A warm MCP server process plus its initialized ClientSession."""
+
+    def __init__(self, slot_id: int):
+        self.slot_id = slot_id
+        self.session: Optional["ClientSession"] = None
+        self.ready = asyncio.Event()
+        self.closing = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.error: Optional[BaseException] = None
+        self.broken = False
+        self.last_used = time.monotonic()
+        # (tenant, profile) the slot was admitted for, released with it
+        self.admission: Tuple[Hashable, Hashable] = (DEFAULT_TENANT, None)
+
+
+class PooledSession:
+    """
+    Session handle lent out by the pool.
+
+    Exposes the subset of the ClientSession API used by MCPClient. Calls are
+    forwarded to the pool's event loop, so the handle can be used from any
+    event loop (Streamlit runs a fresh one per message).
+    """
+
+    def __init__(self, pool: "MCPSessionPool", slot: _Slot):
+        self._pool = pool
+        self._slot = slot
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None):
+        return await self._pool._run(self._pool._call_tool(self, name, arguments or {}))
+
+    async def send_ping(self):
+        return await self._pool._run(self._slot.session.send_ping())
+
+
+class MCPSessionPool:
+    """
+    Process-wide pool of long-lived MCP server sessions.
+
+    Each server process is started once and kept alive on a dedicated event
+    loop running in a background thread. Callers borrow an initialized session,
+    idle sessions are pinged before reuse, and sessions whose transport fails
+    are discarded and transparently replaced.
+
+    Servers are shared by every connection profile (the profile travels with
+    each tool call). Borrowers queue through a ``FairScheduler``: sessions go
+    round-robin across tenants (e.g. Streamlit sessions), and a profile can
+    be capped to fewer concurrent sessions than the pool holds.
+    """
+
+    def __init__(self, server_script: str, size: Optional[int] = None, env: Optional[Dict[str, str]] = None):
+        self.server_script = server_script
+        self.size = size if size is not None else int(os.getenv("MCP_POOL_SIZE", "2"))
+        self.env = env if env is not None else os.environ.copy()
+        self.health_check_interval = float(os.getenv("MCP_POOL_HEALTH_CHECK_SECS", "30"))
+        self.ping_timeout = float(os.getenv("MCP_POOL_PING_TIMEOUT_SECS", "5"))
+        self.connect_timeout = float(os.getenv("MCP_POOL_CONNECT_TIMEOUT_SECS", "30"))
+        self.acquire_timeout = float(os.getenv("MCP_POOL_ACQUIRE_TIMEOUT_SECS", "60"))
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._idle: Optional[asyncio.Queue] = None
+        self._scheduler: Optional[FairScheduler] = None
+        self._slots: Dict[int, _Slot] = {}
+        self._next_slot_id = 0
+
+    # -- Event loop plumbing -------------------------------------------------
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="mcp-session-pool", daemon=True)
+            thread.start()
+            self._loop = loop
+            self._thread = thread
+
+    async def _run(self, coro):
+        """Run a coroutine on the pool loop and await it from the caller's loop."""
+        self._ensure_started()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    # -- Slot lifecycle (pool loop only) -------------------------------------
+
+    def _server_params(self) -> "StdioServerParameters":
+        from mcp import StdioServerParameters
+
+        return StdioServerParameters(
+            command=sys.executable,
+            args=[self.server_script],
+            env=self.env
+        )
+
+    async def _hold(self, slot: _Slot):
+        """Own the transport context for one slot until asked to close."""
+        # Imported with the first session rather than with the app: mcp is slow to load
+        from mcp import ClientSession
+        from mcp.client.stdio import stdio_client
+
+        try:
+            async with stdio_client(self._server_params()) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    slot.session = session
+                    slot.ready.set()
+                    await slot.closing.wait()
+        except Exception as e:
+            logger.warning(f"MCP session {slot.slot_id} terminated: {e}")
+            slot.error = e
+        finally:
+            slot.broken = True
+            slot.session = None
+            slot.ready.set()
+
+    async def _open_slot(self) -> _Slot:
+        slot = _Slot(self._next_slot_id)
+        self._next_slot_id += 1
+        self._slots[slot.slot_id] = slot
+        started = time.perf_counter()
+        slot.task = asyncio.get_running_loop().create_task(self._hold(slot))
+        try:
+            await asyncio.wait_for(slot.ready.wait(), self.connect_timeout)
+        except asyncio.TimeoutError:
+            await self._discard(slot)
+            raise RuntimeError(f"Timed out starting MCP server after {self.connect_timeout}s")
+        except BaseException:
+            # Cancelled by the caller (e.g. an acquire timeout): don't leave a
+            # half-opened slot counting towards the pool size
+            await asyncio.shield(self._discard(slot))
+            raise
+        if slot.session is None:
+            await self._discard(slot)
+            raise RuntimeError(f"Failed to start MCP server: {slot.error}")
+        logger.info(f"Started MCP session {slot.slot_id} in {time.perf_counter() - started:.3f}s")
+        return slot
+
+    async def _discard(self, slot: _Slot):
+        self._slots.pop(slot.slot_id, None)
+        slot.closing.set()
+        if slot.task is not None and not slot.task.done():
+            try:
+                await asyncio.wait_for(slot.task, 5)
+            except Exception:
+                slot.task.cancel()
+
+    async def _is_healthy(self, slot: _Slot) -> bool:
+        if slot.broken or slot.session is None:
+            return False
+        if time.monotonic() - slot.last_used < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(slot.session.send_ping(), self.ping_timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"MCP session {slot.slot_id} failed health check: {e}")
+            return False
+
+    async def _acquire_slot(self) -> _Slot:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        while True:
+            # Slots count from the moment they start opening (see _open_slot)
+            if self._idle.empty() and len(self._slots) < self.size:
+                return await self._open_slot()
+            slot = await self._idle.get()
+            if await self._is_healthy(slot):
+                return slot
+            await self._discard(slot)
+
+    async def _admitted_slot(self, tenant: Hashable, profile: Hashable, limit: int) -> _Slot:
+        if self._scheduler is None:
+            self._scheduler = FairScheduler(self.size)
+        await self._scheduler.acquire(tenant, profile, limit)
+        try:
+            # At most `size` borrowers are admitted, so a slot is idle or may be opened
+            slot = await self._acquire_slot()
+        except BaseException:
+            self._scheduler.release(tenant, profile)
+            raise
+        slot.admission = (tenant, profile)
+        return slot
+
+    async def _acquire(self, tenant: Hashable = DEFAULT_TENANT, profile: Hashable = None, limit: int = 0) -> _Slot:
+        return await asyncio.wait_for(self._admitted_slot(tenant, profile, limit), self.acquire_timeout)
+
+    async def _release(self, slot: _Slot):
+        self._scheduler.release(*slot.admission)
+        if slot.broken or slot.session is None:
+            await self._discard(slot)
+            return
+        slot.last_used = time.monotonic()
+        self._idle.put_nowait(slot)
+
+    async def _call_tool(self, handle: PooledSession, name: str, arguments: Dict[str, Any]):
+        """
+        Call a tool, reconnecting once if the session transport has failed.
+
+        Only stateless tools are retried: the cursors fetch_page and
+        close_query refer to live in the server process that was lost.
+        """
+        # Imported with the first call rather than with the app: mcp is slow to load
+        from mcp.shared.exceptions import McpError
+
+        slot = handle._slot
+        try:
+            if slot.session is None:
+                raise RuntimeError("MCP session is closed")
+            result = await slot.session.call_tool(name, arguments=arguments)
+            slot.last_used = time.monotonic()
+            return result
+        except McpError:
+            # The server answered with a protocol error, so the session is fine
+            raise
+        except Exception as e:
+            # Tool-level failures come back as isError results; an exception
+            # here means the transport or server process is gone
+            slot.broken = True
+            await self._discard(slot)
+            if name in STATEFUL_TOOLS:
+                raise RuntimeError(f"MCP session failed during '{name}': {e}") from e
+            logger.warning(f"MCP session {slot.slot_id} failed during '{name}', reconnecting: {e}")
+            handle._slot = await self._open_slot()
+            handle._slot.admission = slot.admission
+            return await handle._slot.session.call_tool(name, arguments=arguments)
+
+    async def _close_all(self):
+        for slot in list(self._slots.values()):
+            await self._discard(slot)
+        self._idle = None
+        self._scheduler = None
+
+    # -- Public API ----------------------------------------------------------
+
+    @asynccontextmanager
+    async def session(self, tenant: Hashable = DEFAULT_TENANT, profile: Hashable = None, limit: int = 0):
+        """
+        Borrow a warm session for the duration of the context, queued fairly
+        among ``tenant``s and with at most ``limit`` sessions (0: no cap)
+        held at once for ``profile``.
+        """
+        slot = await self._run(self._acquire(tenant, profile, limit))
+        handle = PooledSession(self, slot)
+        try:
+            yield handle
+        finally:
+            await self._run(self._release(handle._slot))
+
+    async def warm_up(self):
+        """Start sessions until the pool is full so the first request is warm."""
+        async def fill():
+            # Servers start in parallel: each spends most of a second importing
+            slots = await asyncio.gather(*(self._acquire() for _ in range(self.size)), return_exceptions=True)
+            for slot in slots:
+                if isinstance(slot, _Slot):
+                    await self._release(slot)
+            errors = [slot for slot in slots if isinstance(slot, BaseException)]
+            if errors:
+                raise errors[0]
+        await self._run(fill())
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of pool occupancy and of borrowers waiting for a session."""
+        idle = self._idle.qsize() if self._idle is not None else 0
+        queued = self._scheduler.stats() if self._scheduler is not None else {"waiting": 0, "tenants_waiting": 0}
+        return {"size": self.size, "open": len(self._slots), "idle": idle, "in_use": len(self._slots) - idle, **queued}
+
+    def close(self):
+        """Stop all server processes and the pool's event loop."""
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_all(), self._loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Error while closing MCP session pool: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+_pools: Dict[str, MCPSessionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_session_pool(server_script: str) -> MCPSessionPool:
+    """Return the process-wide pool of sessions to a server script, shared by all profiles."""
+    with _pools_lock:
+        pool = _pools.get(server_script)
+        if pool is None:
+            pool = MCPSessionPool(server_script)
+            _pools[server_script] = pool
+        return pool
+
+
+@atexit.register
+def _close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,215 @@
+"""
+On-disk storage for chat results, so session state only holds references.
+
+Each result's DataFrame is written to an Arrow IPC file (pickle when pyarrow
+is not installed) and its figure to a Plotly JSON spec, under one directory
+per session. ``HistoryStore`` keeps recently loaded frames and figures in
+memory up to a per-session byte cap and evicts the least recently used;
+only the newest ``max_results`` results are kept on disk. Session
+directories left behind by closed browser tabs are removed after
+HISTORY_TTL_SECS.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger("history-store")
+
+
+@lru_cache(maxsize=None)
+def _pyarrow():
+    """pyarrow, or None if not installed; imported with the first result saved, not with the app."""
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+class HistoryStore:
+    """Result files and a bounded in-memory cache for one browser session."""
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        session_id: Optional[str] = None,
+        memory_cap_bytes: Optional[int] = None,
+        max_results: Optional[int] = None,
+        ttl: Optional[float] = None
+    ):
+        self.root = root or os.getenv("HISTORY_DIR", os.path.join(".cache", "history"))
+        self.session_id = session_id or uuid.uuid4().hex
+        self.memory_cap_bytes = memory_cap_bytes or int(float(os.getenv("HISTORY_MEMORY_MB", "64")) * 1024 * 1024)
+        self.max_results = max_results or int(os.getenv("HISTORY_MAX_RESULTS", "50"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("HISTORY_TTL_SECS", "86400"))
+        self.directory = os.path.join(self.root, self.session_id)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loaded: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._loaded_bytes = 0
+        self._lock = threading.Lock()
+        self._sweep_stale_sessions()
+
+    def _sweep_stale_sessions(self):
+        now = time.time()
+        try:
+            entries = os.listdir(self.root)
+        except OSError:
+            return
+        for entry in entries:
+            path = os.path.join(self.root, entry)
+            if entry == self.session_id or not os.path.isdir(path):
+                continue
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def _path(self, result_id: str, kind: str) -> str:
+        extension = {"frame": "arrow" if _pyarrow() is not None else "pkl", "figure": "json"}[kind]
+        return os.path.join(self.directory, f"{result_id}.{extension}")
+
+    def save(self, df: pd.DataFrame, figure: Any = None) -> Dict[str, Any]:
+        """Write a result to disk and return the reference to keep in session state."""
+        result_id = uuid.uuid4().hex
+        frame_path = self._path(result_id, "frame")
+        pa = _pyarrow()
+        if pa is not None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.OSFile(frame_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        else:
+            df.to_pickle(frame_path)
+        if figure is not None:
+            with open(self._path(result_id, "figure"), "w") as f:
+                f.write(figure.to_json())
+
+        ref = {
+            "result_id": result_id,
+            "rows": len(df),
+            "columns": list(df.columns),
+            "has_figure": figure is not None,
+            "bytes": os.path.getsize(frame_path),
+        }
+        with self._lock:
+            self._results[result_id] = ref
+            expired = []
+            while len(self._results) > self.max_results:
+                expired.append(self._results.popitem(last=False)[0])
+        for old_id in expired:
+            self._delete(old_id)
+        return ref
+
+    def _delete(self, result_id: str):
+        with self._lock:
+            for kind in ("frame", "figure"):
+                entry = self._loaded.pop((result_id, kind), None)
+                if entry is not None:
+                    self._loaded_bytes -= entry[1]
+        for kind in ("frame", "figure"):
+            try:
+                os.remove(self._path(result_id, kind))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self):
+        # Keeps an active session's directory from being swept as stale
+        try:
+            os.utime(self.directory)
+        except OSError:
+            pass
+
+    def available(self, ref: Dict[str, Any]) -> bool:
+        """Whether a result is still on disk (older ones are evicted)."""
+        return os.path.exists(self._path(ref["result_id"], "frame"))
+
+    def _remember(self, key: tuple, value: Any, size: int):
+        with self._lock:
+            if key in self._loaded:
+                self._loaded_bytes -= self._loaded.pop(key)[1]
+            if size > self.memory_cap_bytes:
+                # Larger than the whole cap: serve it without caching
+                return
+            self._loaded[key] = (value, size)
+            self._loaded_bytes += size
+            while self._loaded_bytes > self.memory_cap_bytes:
+                _, (_, evicted_size) = self._loaded.popitem(last=False)
+                self._loaded_bytes -= evicted_size
+
+    def _cached(self, key: tuple) -> Any:
+        with self._lock:
+            entry = self._loaded.get(key)
+            if entry is None:
+                return None
+            self._loaded.move_to_end(key)
+            return entry[0]
+
+    def load_frame(self, ref: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """The result's DataFrame, or None if it has been evicted."""
+        key = (ref["result_id"], "frame")
+        df = self._cached(key)
+        if df is not None:
+            return df
+        path = self._path(ref["result_id"], "frame")
+        pa = _pyarrow()
+        try:
+            if pa is not None:
+                # to_pandas copies every column, so a memory map would save nothing
+                with pa.OSFile(path, "rb") as source:
+                    df = pa.ipc.open_file(source).read_all().to_pandas()
+            else:
+                df = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        self._touch()
+        self._remember(key, df, int(df.memory_usage(deep=True).sum()))
+        return df
+
+    def load_figure(self, ref: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The result's figure spec (a Plotly JSON dict), or None if it has none or was evicted."""
+        if not ref.get("has_figure"):
+            return None
+        key = (ref["result_id"], "figure")
+        spec = self._cached(key)
+        if spec is not None:
+            return spec
+        try:
+            with open(self._path(ref["result_id"], "figure")) as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        spec = json.loads(text)
+        self._touch()
+        self._remember(key, spec, len(text))
+        return spec
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "results": len(self._results),
+                "disk_bytes": sum(ref["bytes"] for ref in self._results.values()),
+                "cached_items": len(self._loaded),
+                "cached_bytes": self._loaded_bytes,
+                "memory_cap_bytes": self.memory_cap_bytes,
+            }
+
+    def clear(self):
+        """Remove every result of this session."""
+        with self._lock:
+            self._results.clear()
+            self._loaded.clear()
+            self._loaded_bytes = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
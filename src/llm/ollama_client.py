@@ -1,39 +1,198 @@
 import os
+import time
+import asyncio
 import logging
-from typing import Optional, Dict, Any
-import ollama
-from tenacity import retry, stop_after_attempt, wait_exponential
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Callable
+from tenacity import AsyncRetrying, Retrying, stop_after_attempt, stop_before_delay, wait_exponential
+
+from src.tracing import record, span
+
+if TYPE_CHECKING:
+    import ollama
 
 logger = logging.getLogger("ollama-client")
 
+# Generation stops at any of these; a blank line or closing fence ends the SQL
+SQL_STOP_SEQUENCES = ["\n\n\n", "\n```\n", "\nExplanation", "\nNote:"]
+
 class OllamaClient:
     def __init__(self, host: Optional[str] = None, model: Optional[str] = None):
         self.host = host or os.getenv("OLLAMA_HOST", "http://localhost:11434")
         self.model = model or os.getenv("OLLAMA_MODEL", "llama3")
+        self.embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+        # Cap on generated tokens; a single SQL statement rarely needs more
+        self.num_predict = int(os.getenv("OLLAMA_NUM_PREDICT", "512"))
+        # Retries are bounded by attempts and by a wall-clock budget, so a
+        # failing server costs an interactive request seconds, not minutes
+        self.max_retries = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+        self.retry_backoff = float(os.getenv("OLLAMA_RETRY_BACKOFF_SECS", "0.5"))
+        self.retry_budget = float(os.getenv("OLLAMA_RETRY_BUDGET_SECS", "20"))
+        # How long Ollama keeps the model loaded after a request (e.g. "30m", "-1" for ever)
+        self.keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+        self._async_client: Optional["ollama.AsyncClient"] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
         
         # Configure client if needed (ollama python lib uses env vars or defaults)
         # If host is different from default, we might need to set OLLAMA_HOST env var
         if self.host:
             os.environ["OLLAMA_HOST"] = self.host
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    def _retry_policy(self) -> Dict[str, Any]:
+        return {
+            # Give up before a backoff would overrun the budget
+            "stop": stop_after_attempt(self.max_retries + 1) | stop_before_delay(self.retry_budget),
+            "wait": wait_exponential(multiplier=self.retry_backoff, max=4 * self.retry_backoff),
+            "reraise": True,
+        }
+
+    @staticmethod
+    def _record_timings(response) -> None:
+        """Record Ollama's own load/prompt-eval/eval timings (reported in nanoseconds)."""
+        if response.get('load_duration'):
+            record("llm.load", response['load_duration'] / 1e6)
+        if response.get('prompt_eval_duration'):
+            record("llm.prompt_eval", response['prompt_eval_duration'] / 1e6, tokens=response.get('prompt_eval_count'))
+        if response.get('eval_duration'):
+            record("llm.eval", response['eval_duration'] / 1e6, tokens=response.get('eval_count'))
+
+    @staticmethod
+    def _messages(prompt: str, system_prompt: Optional[str]) -> List[Dict[str, str]]:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
     def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> str:
         """Generate a response from the LLM."""
+        import ollama
+
         try:
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            
-            messages.append({"role": "user", "content": prompt})
-            
-            response = ollama.chat(model=self.model, messages=messages)
+            with span("llm.generate", model=self.model):
+                for attempt in Retrying(**self._retry_policy()):
+                    with attempt:
+                        response = ollama.chat(
+                            model=self.model,
+                            messages=self._messages(prompt, system_prompt),
+                            options={"num_predict": self.num_predict},
+                            keep_alive=self.keep_alive
+                        )
+            self._record_timings(response)
             return response['message']['content']
         except Exception as e:
             logger.error(f"Failed to generate response from Ollama: {e}")
             raise
 
+    def _get_async_client(self) -> "ollama.AsyncClient":
+        # Imported on first use: the library (and httpx/pydantic under it) is slow to load
+        import ollama
+
+        # The underlying HTTP client is bound to the loop it was first used on
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = ollama.AsyncClient(host=self.host)
+            self._async_loop = loop
+        return self._async_client
+
+    async def stream_response(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+        stop_when: Optional[Callable[[str], Optional[str]]] = None,
+        stop: Optional[List[str]] = None
+    ) -> str:
+        """
+        Stream a response from the LLM without blocking the event loop.
+
+        ``on_token`` is called with the text generated so far after every
+        chunk (and again from the start if a retry happens). ``stop_when``
+        receives the same text and returns the final response as soon as it
+        is complete; the stream is then closed, which stops generation.
+
+        Ollama only reports eval timings in its final chunk; when generation
+        is cut short, time to first token and the chunk count stand in for
+        prompt evaluation and generated tokens.
+        """
+        options = {"num_predict": self.num_predict}
+        if stop:
+            options["stop"] = stop
+        try:
+            with span("llm.generate", model=self.model) as attributes:
+                async for attempt in AsyncRetrying(**self._retry_policy()):
+                    with attempt:
+                        text = ""
+                        chunks = 0
+                        started = time.perf_counter()
+                        first_token = None
+                        final = None
+                        stream = await self._get_async_client().chat(
+                            model=self.model,
+                            messages=self._messages(prompt, system_prompt),
+                            options=options,
+                            keep_alive=self.keep_alive,
+                            stream=True
+                        )
+                        try:
+                            async for chunk in stream:
+                                if first_token is None:
+                                    first_token = time.perf_counter()
+                                chunks += 1
+                                if chunk.get('done'):
+                                    final = chunk
+                                text += chunk['message']['content']
+                                if on_token:
+                                    on_token(text)
+                                complete = stop_when(text) if stop_when else None
+                                if complete is not None:
+                                    text = complete
+                                    break
+                        finally:
+                            await stream.aclose()
+                attributes.update(chunks=chunks, stopped_early=final is None)
+
+            if final is not None:
+                self._record_timings(final)
+            elif first_token is not None:
+                record("llm.prompt_eval", (first_token - started) * 1000, source="client")
+                record("llm.eval", (time.perf_counter() - first_token) * 1000, tokens=chunks, source="client")
+            return text
+        except Exception as e:
+            logger.error(f"Failed to stream response from Ollama: {e}")
+            raise
+
+    async def preload(self) -> None:
+        """
+        Load the model into Ollama's memory ahead of the first question.
+
+        An empty prompt makes Ollama load the model and return without
+        generating; ``keep_alive`` then keeps it resident between questions.
+        """
+        try:
+            with span("llm.preload", model=self.model):
+                response = await self._get_async_client().generate(
+                    model=self.model, prompt="", keep_alive=self.keep_alive
+                )
+            self._record_timings(response)
+        except Exception as e:
+            logger.error(f"Failed to preload model '{self.model}' in Ollama: {e}")
+            raise
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the local embedding model."""
+        import ollama
+
+        try:
+            response = ollama.embed(model=self.embed_model, input=texts)
+            return response['embeddings']
+        except Exception as e:
+            logger.error(f"Failed to generate embeddings from Ollama: {e}")
+            raise
+
     def check_connection(self) -> bool:
         """Check if Ollama is reachable."""
+        import ollama
+
         try:
             ollama.list()
             return True
@@ -12,7 +12,7 @@ Rules:
 SQL_GENERATION_TEMPLATE = """
 Database Schema:
 {schema_context}
-
+{examples}
 User Question: {user_query}
 
 Generate the SQL query:
@@ -21,6 +21,9 @@ Generate the SQL query:
 ERROR_CORRECTION_TEMPLATE = """
 The previous query you generated resulted in an error.
 
+Database Schema:
+{schema_context}
+
 User Question: {user_query}
 
 Generated SQL: {previous_sql}
@@ -0,0 +1,204 @@
+"""
+Lightweight latency tracing for the question-to-chart pipeline.
+
+``span`` times a block of code (sync or async) and ``record`` adds a
+duration measured elsewhere, such as Ollama's eval timings or the MCP
+server's own stages. Spans are collected on the trace active in the
+current context (see ``start_trace``). Every span also feeds a rolling
+window per stage for p50/p95 summaries (``stage_summary``). When
+TRACING_EXPORTER is "console" or "file" and opentelemetry-sdk is
+installed, spans are exported through OpenTelemetry as well.
+"""
+import contextvars
+import functools
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("tracing")
+
+# Spans kept per stage for the rolling percentiles
+STATS_WINDOW = int(os.getenv("TRACING_WINDOW", "500"))
+
+
+class Trace:
+    """Spans recorded while answering one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration_ms: float, attributes: Optional[Dict[str, Any]] = None):
+        entry = {
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 1),
+            "duration_ms": round(duration_ms, 1),
+        }
+        if attributes:
+            entry.update(attributes)
+        with self._lock:
+            self.spans.append(entry)
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Spans in start order."""
+        with self._lock:
+            return sorted(self.spans, key=lambda entry: entry["start_ms"])
+
+    def durations(self) -> Dict[str, float]:
+        """Total milliseconds per span name."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for entry in self.spans:
+                totals[entry["name"]] = round(totals.get(entry["name"], 0.0) + entry["duration_ms"], 1)
+        return totals
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_stats: Dict[str, deque] = {}
+_stats_lock = threading.Lock()
+_tracer = None
+_tracer_ready = False
+
+
+def _get_tracer():
+    """OpenTelemetry tracer for TRACING_EXPORTER, or None when export is off."""
+    global _tracer, _tracer_ready
+    if _tracer_ready:
+        return _tracer
+    _tracer_ready = True
+    exporter_name = os.getenv("TRACING_EXPORTER", "").lower()
+    if not exporter_name:
+        return None
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SimpleSpanProcessor
+    except ImportError:
+        logger.warning("TRACING_EXPORTER is set but opentelemetry-sdk is not installed; spans are not exported")
+        return None
+
+    if exporter_name == "file":
+        path = os.getenv("TRACING_FILE", os.path.join(".cache", "traces.jsonl"))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        exporter = ConsoleSpanExporter(
+            out=open(path, "a"), formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    else:
+        # stderr, because stdout carries the MCP protocol in the server process
+        exporter = ConsoleSpanExporter(out=sys.stderr)
+    service = os.getenv("OTEL_SERVICE_NAME", os.path.basename(sys.argv[0]) or "database-to-dashboard")
+    provider = TracerProvider(resource=Resource.create({"service.name": service}))
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    _tracer = provider.get_tracer("database-to-dashboard")
+    return _tracer
+
+
+def _observe(name: str, duration_ms: float):
+    with _stats_lock:
+        window = _stats.get(name)
+        if window is None:
+            window = _stats[name] = deque(maxlen=STATS_WINDOW)
+        window.append(duration_ms)
+
+
+@contextmanager
+def start_trace(new: bool = False) -> Iterator[Trace]:
+    """
+    Collect spans for one request. Nested calls share the outer trace unless
+    ``new`` is set (e.g. one trace per question of a batch).
+    """
+    trace = _current_trace.get()
+    if trace is not None and not new:
+        yield trace
+        return
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block. The yielded dict can be filled with attributes (row
+    counts, token counts, ...) that are attached when the span ends.
+    """
+    tracer = _get_tracer()
+    otel_context = tracer.start_as_current_span(name) if tracer else None
+    otel_span = otel_context.__enter__() if otel_context else None
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _observe(name, duration_ms)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, start, duration_ms, attributes)
+        if otel_span is not None:
+            for key, value in attributes.items():
+                if isinstance(value, (str, bool, int, float)):
+                    otel_span.set_attribute(key, value)
+            otel_context.__exit__(*sys.exc_info())
+
+
+def record(name: str, duration_ms: float, export: bool = True, **attributes):
+    """
+    Add a span that ended now and was timed elsewhere. ``export=False`` keeps
+    it out of OpenTelemetry, for spans another process already exported.
+    """
+    start = time.perf_counter() - duration_ms / 1000
+    _observe(name, duration_ms)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, duration_ms, attributes)
+    tracer = _get_tracer() if export else None
+    if tracer is not None:
+        end_ns = time.time_ns()
+        otel_span = tracer.start_span(
+            name,
+            start_time=end_ns - int(duration_ms * 1e6),
+            attributes={key: value for key, value in attributes.items() if isinstance(value, (str, bool, int, float))}
+        )
+        otel_span.end(end_time=end_ns)
+
+
+def traced(name: str):
+    """Decorator running a function inside its own trace and a span named ``name``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_trace(), span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stage_summary() -> Dict[str, Dict[str, float]]:
+    """Rolling count, p50 and p95 (milliseconds) per span name."""
+    with _stats_lock:
+        windows = {name: list(window) for name, window in _stats.items()}
+    summary = {}
+    for name, samples in sorted(windows.items()):
+        if len(samples) >= 2:
+            quantiles = statistics.quantiles(samples, n=20, method="inclusive")
+            p50, p95 = statistics.median(samples), quantiles[18]
+        else:
+            p50 = p95 = samples[0]
+        summary[name] = {"count": len(samples), "p50_ms": round(p50, 1), "p95_ms": round(p95, 1)}
+    return summary
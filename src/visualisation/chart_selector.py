@@ -1,38 +1,48 @@
 import pandas as pd
 from typing import List, Dict, Any, Optional
 
+from src.visualisation.column_profiler import DataProfile, get_profile
+
+# Pies only read well with a handful of slices
+PIE_MAX_CATEGORIES = 5
+
 class ChartSelector:
-    def select_chart_type(self, df: pd.DataFrame) -> str:
+    def select_chart_type(self, df: pd.DataFrame, profile: Optional[DataProfile] = None) -> str:
         """
         Determine the best chart type based on the dataframe structure.
+
+        Decisions come from the cached column profile, so dates sent as ISO
+        strings count as dates and identifier columns are not plotted as values.
         """
         if df.empty:
             return "none"
 
-        num_cols = df.select_dtypes(include=['number']).columns
-        cat_cols = df.select_dtypes(include=['object', 'category']).columns
-        date_cols = df.select_dtypes(include=['datetime']).columns
+        profile = profile or get_profile(df)
+        measures = profile.measures
+        categories = profile.categories
+        dates = profile.dates
 
         # Heuristics
-        
+
         # Time Series: Date column + Numeric column
-        if len(date_cols) >= 1 and len(num_cols) >= 1:
+        if len(dates) >= 1 and len(measures) >= 1:
             return "line"
-        
-        # Comparison: 1 Categorical + 1 Numeric
-        if len(cat_cols) == 1 and len(num_cols) == 1:
-            # If few categories, maybe pie? But bar is safer.
-            if df[cat_cols[0]].nunique() < 10:
-                return "bar"
+
+        if len(categories) == 1 and len(measures) >= 1:
+            # Composition: few categories and no negative values
+            column = profile.columns[measures[0]]
+            if profile.columns[categories[0]].cardinality <= PIE_MAX_CATEGORIES and (column.min is None or column.min >= 0):
+                return "pie"
+            # Comparison: 1 Categorical + Numeric
             return "bar"
 
-        # Correlation: 2+ Numeric columns
-        if len(num_cols) >= 2:
+        # Sequence: a steadily increasing numeric x (e.g. year) + another numeric
+        if len(measures) >= 2:
+            first = profile.columns[measures[0]]
+            if first.monotonic == "increasing" and first.unique_ratio > 0.9:
+                return "line"
+            # Correlation: 2+ Numeric columns
             return "scatter"
 
-        # Composition: 1 Categorical + 1 Numeric (small number of categories)
-        if len(cat_cols) == 1 and len(num_cols) == 1 and df[cat_cols[0]].nunique() <= 5:
-            return "pie"
-
         # Default to table if no clear pattern
         return "table"
@@ -0,0 +1,198 @@
+"""
+Column profiles shared by chart selection, render planning and plotting.
+
+``profile_dataframe`` makes one vectorized pass over a sample of a result
+and describes each column: its kind (numeric, datetime, categorical,
+boolean), whether that kind was inferred from strings (ISO dates or numbers
+sent as text), null rate, estimated cardinality, monotonicity and range.
+``get_profile`` caches the profile per DataFrame, so the selector, the
+planner and the generator all reuse one profile per result.
+"""
+import math
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "10000"))
+PROFILE_CACHE_SIZE = 64
+
+# Share of non-null sampled strings that must parse for a column to count as dates or numbers
+INFERENCE_THRESHOLD = 0.95
+ISO_DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?)?$"
+
+
+@dataclass(frozen=True)
+class ColumnProfile:
+    """What one column holds, measured on a sample."""
+    name: str
+    dtype: str
+    kind: str
+    inferred: bool = False
+    null_rate: float = 0.0
+    cardinality: int = 0
+    unique_ratio: float = 0.0
+    monotonic: Optional[str] = None
+    min: Any = None
+    max: Any = None
+
+    @property
+    def is_identifier(self) -> bool:
+        """Integer keys such as ``id`` or ``customer_id``: numeric, but not a measure."""
+        name = self.name.lower()
+        return self.kind == "numeric" and (name == "id" or name.endswith("_id")) and self.unique_ratio > 0.9
+
+
+@dataclass(frozen=True)
+class DataProfile:
+    """Profiles of every column of one result, in column order."""
+    rows: int
+    sampled: int
+    columns: Dict[str, ColumnProfile]
+
+    def of_kind(self, kind: str) -> List[str]:
+        return [name for name, column in self.columns.items() if column.kind == kind]
+
+    @property
+    def measures(self) -> List[str]:
+        """Numeric columns worth plotting as values (identifiers excluded)."""
+        return [name for name, column in self.columns.items() if column.kind == "numeric" and not column.is_identifier]
+
+    @property
+    def categories(self) -> List[str]:
+        return [name for name, column in self.columns.items() if column.kind in ("categorical", "boolean")]
+
+    @property
+    def dates(self) -> List[str]:
+        return self.of_kind("datetime")
+
+    def series(self, df: pd.DataFrame, name: str) -> pd.Series:
+        """The column converted to its profiled kind (e.g. ISO strings parsed to datetimes)."""
+        column = self.columns[name]
+        values = df[name]
+        if not column.inferred:
+            return values
+        if column.kind == "datetime":
+            return pd.to_datetime(values, format="ISO8601", errors="coerce", utc=_has_timezone(values))
+        return pd.to_numeric(values, errors="coerce")
+
+
+def _has_timezone(values: pd.Series) -> bool:
+    first = values.dropna()
+    return bool(len(first)) and bool(pd.Series(first.iloc[:1]).str.contains(r"(?:Z|[+-]\d{2}:?\d{2})$").iloc[0])
+
+
+def _sample(df: pd.DataFrame, size: int) -> pd.DataFrame:
+    """Evenly spaced rows, which keeps the row order so monotonicity survives."""
+    if len(df) <= size:
+        return df
+    return df.iloc[np.linspace(0, len(df) - 1, size).astype(np.int64)]
+
+
+def estimate_cardinality(values: pd.Series, total_rows: int) -> int:
+    """
+    Distinct values in the full column, estimated from a sample with the
+    GEE estimator: values seen once are scaled by sqrt(N / n), the rest
+    counted once. A sample of (nearly) all distinct values looks like a key
+    and is scaled linearly instead.
+    """
+    counts = values.value_counts(dropna=True)
+    if len(values) >= total_rows:
+        return len(counts)
+    singletons = int((counts == 1).sum())
+    if singletons >= 0.95 * len(values):
+        return int(min(round(len(counts) * total_rows / max(len(values), 1)), total_rows))
+    estimate = math.sqrt(total_rows / max(len(values), 1)) * singletons + (len(counts) - singletons)
+    return int(min(round(estimate), total_rows))
+
+
+def _infer_from_strings(values: pd.Series):
+    """Parse text columns that hold dates or numbers; returns (kind, parsed) or (None, None)."""
+    text = values.dropna()
+    if text.empty or not (pd.api.types.is_string_dtype(text) or pd.api.types.is_object_dtype(text)):
+        return None, None
+    text = text.astype(str)
+    if text.str.match(ISO_DATE_PATTERN).mean() >= INFERENCE_THRESHOLD:
+        parsed = pd.to_datetime(text, format="ISO8601", errors="coerce", utc=_has_timezone(text))
+        if parsed.notna().mean() >= INFERENCE_THRESHOLD:
+            return "datetime", parsed
+    parsed = pd.to_numeric(text, errors="coerce")
+    if parsed.notna().mean() >= INFERENCE_THRESHOLD:
+        return "numeric", parsed
+    return None, None
+
+
+def _profile_column(name: str, values: pd.Series, total_rows: int) -> ColumnProfile:
+    kind, inferred, parsed = "categorical", False, values
+    if pd.api.types.is_bool_dtype(values):
+        kind = "boolean"
+    elif pd.api.types.is_numeric_dtype(values):
+        kind = "numeric"
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        kind = "datetime"
+    elif isinstance(values.dtype, pd.CategoricalDtype):
+        kind = "categorical"
+    else:
+        inferred_kind, inferred_values = _infer_from_strings(values)
+        if inferred_kind is not None:
+            kind, inferred, parsed = inferred_kind, True, inferred_values
+
+    non_null = parsed.dropna()
+    cardinality = estimate_cardinality(non_null, int(total_rows * len(non_null) / max(len(values), 1)))
+    monotonic, low, high = None, None, None
+    if kind in ("numeric", "datetime") and not non_null.empty:
+        low, high = non_null.min(), non_null.max()
+        if non_null.is_monotonic_increasing:
+            monotonic = "increasing"
+        elif non_null.is_monotonic_decreasing:
+            monotonic = "decreasing"
+    return ColumnProfile(
+        name=name,
+        dtype=str(values.dtype),
+        kind=kind,
+        inferred=inferred,
+        null_rate=round(1 - len(non_null) / len(values), 4) if len(values) else 0.0,
+        cardinality=cardinality,
+        unique_ratio=round(cardinality / max(total_rows, 1), 4),
+        monotonic=monotonic,
+        min=low,
+        max=high,
+    )
+
+
+def profile_dataframe(df: pd.DataFrame, sample_size: Optional[int] = None) -> DataProfile:
+    """Profile every column of ``df`` from a sample of at most ``sample_size`` rows."""
+    sample = _sample(df, sample_size or PROFILE_SAMPLE_ROWS)
+    columns = {}
+    for i, name in enumerate(df.columns):
+        # Duplicate column names keep the first occurrence
+        if name not in columns:
+            columns[name] = _profile_column(name, sample.iloc[:, i], len(df))
+    return DataProfile(rows=len(df), sampled=len(sample), columns=columns)
+
+
+_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_profile(df: pd.DataFrame) -> DataProfile:
+    """The profile of ``df``, computed once per DataFrame (and recomputed if its shape changes)."""
+    key = id(df)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0]() is df and entry[1] == (df.shape, tuple(df.columns)):
+            _cache.move_to_end(key)
+            return entry[2]
+
+    profile = profile_dataframe(df)
+    with _cache_lock:
+        _cache[key] = (weakref.ref(df), (df.shape, tuple(df.columns)), profile)
+        _cache.move_to_end(key)
+        while len(_cache) > PROFILE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return profile
@@ -0,0 +1,74 @@
+import json
+import os
+from typing import Any, Dict, List
+
+import yaml
+
+CHART_TYPES = ("auto", "bar", "line", "scatter", "pie", "table")
+
+
+def load_dashboard_spec(text: str) -> Dict[str, Any]:
+    """
+    Parse a dashboard spec written in YAML or JSON.
+
+    The spec is either a list of questions or a mapping like::
+
+        title: Sales overview
+        columns: 2
+        refresh: 30
+        panels:
+          - question: Total revenue per month
+            title: Revenue
+            chart: line
+          - question: How many orders per region?
+            live: false
+
+    ``refresh`` is the seconds between live refreshes of time-series panels
+    (LIVE_REFRESH_SECS by default, 0 turns them off); ``live: false`` keeps
+    a panel as drawn.
+
+    Returns ``{"title", "columns", "refresh", "panels": [{"title", "question", "chart", "live"}]}``.
+    """
+    text = text.strip()
+    if not text:
+        raise ValueError("The dashboard spec is empty.")
+    try:
+        spec = json.loads(text) if text[0] in "[{" else yaml.safe_load(text)
+    except (json.JSONDecodeError, yaml.YAMLError) as e:
+        raise ValueError(f"Could not parse the dashboard spec: {e}")
+
+    if isinstance(spec, list):
+        spec = {"panels": spec}
+    if not isinstance(spec, dict) or not isinstance(spec.get("panels"), list) or not spec["panels"]:
+        raise ValueError("The dashboard spec needs a non-empty 'panels' list.")
+
+    panels: List[Dict[str, Any]] = []
+    for i, panel in enumerate(spec["panels"], 1):
+        if isinstance(panel, str):
+            panel = {"question": panel}
+        if not isinstance(panel, dict) or not str(panel.get("question") or "").strip():
+            raise ValueError(f"Panel {i} needs a 'question'.")
+        chart = str(panel.get("chart", "auto")).lower()
+        if chart not in CHART_TYPES:
+            raise ValueError(f"Panel {i} has unknown chart type '{chart}'. Expected one of {CHART_TYPES}.")
+        question = str(panel["question"]).strip()
+        panels.append({
+            "title": str(panel.get("title") or question),
+            "question": question,
+            "chart": chart,
+            "live": bool(panel.get("live", True)),
+        })
+
+    try:
+        refresh = float(spec.get("refresh", os.getenv("LIVE_REFRESH_SECS", "60")))
+    except (TypeError, ValueError):
+        refresh = -1
+    if refresh < 0:
+        raise ValueError("'refresh' must be a number of seconds (0 turns live refresh off).")
+
+    return {
+        "title": str(spec.get("title") or "Dashboard"),
+        "columns": max(1, min(int(spec.get("columns", 2)), 4)),
+        "refresh": refresh,
+        "panels": panels,
+    }
@@ -0,0 +1,227 @@
+"""
+Live panels: keep a time-series chart current without asking its question again.
+
+A panel whose chart is a line over a time column keeps its validated SQL,
+its rows and the latest time value drawn (the watermark). ``delta_sql``
+wraps the SQL in a filter on that column from the watermark, so a refresh
+reads only the rows added since, straight from the database (no LLM, no
+result cache, no rollup). Rows at the watermark are read again and replace
+the stored ones: the last bucket of an aggregate (e.g. the current month)
+is updated rather than duplicated.
+
+``LivePanel.apply`` merges a delta into the stored rows and extends the
+figure's trace in place, keeping the layout and the user's zoom. Only when
+appended points push the chart past the point budget is it planned and
+drawn again from the stored rows.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from src.tracing import span
+from src.visualisation.plotly_generator import PlotlyGenerator
+from src.visualisation.render_planner import RenderPlan, RenderPlanner, _identifier
+
+logger = logging.getLogger("live-panel")
+
+LIVE_MAX_ROWS = int(os.getenv("LIVE_MAX_ROWS", "50000"))
+# Appended raw points may take a downsampled chart this far over its point budget before it is planned again
+REPLAN_SLACK = 1.2
+
+
+def _delta_source(sql: str) -> Tuple[str, Optional[int]]:
+    """The query without its outer LIMIT/OFFSET, and that LIMIT when it is a literal."""
+    # sqlglot is only needed once a panel goes live
+    from sqlglot import exp
+
+    from src.database.query_analysis import parse_query
+
+    expression = parse_query(sql)
+    if not isinstance(expression, exp.Query):
+        raise ValueError("Only queries can be refreshed.")
+    limit = expression.args.get("limit")
+    window = None
+    if limit is not None and isinstance(limit.expression, exp.Literal) and limit.expression.is_int:
+        window = int(limit.expression.name)
+    expression = expression.copy()
+    expression.set("limit", None)
+    expression.set("offset", None)
+    return expression.sql(dialect="postgres"), window
+
+
+@dataclass
+class LivePanel:
+    """A line chart over a time column, refreshed by watermark delta queries."""
+    source_sql: str
+    time_column: str
+    value_column: str
+    data: pd.DataFrame = field(repr=False)
+    figure: Any = field(repr=False)
+    # The points currently in the figure's trace, in time order
+    shown: pd.DataFrame = field(repr=False)
+    watermark: Any = None
+    window: int = LIVE_MAX_ROWS
+    cast: Optional[str] = None
+    refreshed_at: float = 0.0
+    refreshes: int = 0
+    rows_added: int = 0
+    redraws: int = 0
+    error: Optional[str] = None
+
+    def delta_sql(self) -> str:
+        """The panel's query restricted to rows at or after the watermark, oldest first."""
+        column = _identifier(self.time_column)
+        # Dates sent as ISO text compare as timestamps, as in render pushdown
+        value = f"{column}::{self.cast}" if self.cast else column
+        kind = "TIMESTAMPTZ" if self.watermark.tzinfo is not None else "TIMESTAMP"
+        return (
+            f"SELECT * FROM ({self.source_sql}) AS live_source "
+            f"WHERE {value} >= {kind} '{self.watermark.isoformat()}' ORDER BY {column}"
+        )
+
+    def _converted(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Parse the time and value columns when they arrive as text, and order by time."""
+        converted = {}
+        if not pd.api.types.is_datetime64_any_dtype(df[self.time_column]):
+            converted[self.time_column] = pd.to_datetime(
+                df[self.time_column], format="ISO8601", errors="coerce", utc=self.cast == "timestamptz"
+            )
+        if not pd.api.types.is_numeric_dtype(df[self.value_column]):
+            converted[self.value_column] = pd.to_numeric(df[self.value_column], errors="coerce")
+        if converted:
+            df = df.assign(**converted)
+        df = df.dropna(subset=[self.time_column])
+        if not df[self.time_column].is_monotonic_increasing:
+            df = df.sort_values(self.time_column, kind="stable")
+        return df.reset_index(drop=True)
+
+    def apply(self, delta: pd.DataFrame, planner: Optional[RenderPlanner] = None) -> int:
+        """
+        Merge a delta query's rows into the panel and update its figure.
+
+        Returns the number of rows newer than the previous watermark.
+        """
+        delta = self._converted(delta)
+        previous = self.watermark
+        data = pd.concat([self.data[self.data[self.time_column] < previous], delta], ignore_index=True)
+        if len(data) > self.window:
+            data = data.iloc[len(data) - self.window:].reset_index(drop=True)
+        self.data = data
+        if not data.empty:
+            self.watermark = data[self.time_column].iloc[-1]
+
+        with span("live.extend", rows=len(delta)):
+            shown = self.shown[self.shown[self.time_column] < previous]
+            if not data.empty:
+                shown = shown[shown[self.time_column] >= data[self.time_column].iloc[0]]
+            self.shown = pd.concat([shown, delta[[self.time_column, self.value_column]]], ignore_index=True)
+            planner = planner or RenderPlanner()
+            if len(self.shown) > planner.point_budget * REPLAN_SLACK:
+                self._redraw(planner)
+            else:
+                trace = self.figure.data[0]
+                trace.x = self.shown[self.time_column]
+                trace.y = self.shown[self.value_column]
+        return int((delta[self.time_column] > previous).sum())
+
+    def _redraw(self, planner: RenderPlanner):
+        """Plan and draw the chart again from the stored rows, keeping the title and zoom."""
+        plan = planner.plan(self.data[[self.time_column, self.value_column]], "line")
+        layout = self.figure.layout
+        figure = PlotlyGenerator(planner).generate_chart(plan.data, plan.chart_type, plan=plan)
+        figure.update_layout(title=layout.title, uirevision=layout.uirevision)
+        self.figure = figure
+        self.shown = plan.data[[self.time_column, self.value_column]].reset_index(drop=True)
+        self.redraws += 1
+
+
+def make_live_panel(
+    sql: str,
+    df: pd.DataFrame,
+    plan: RenderPlan,
+    figure: Any,
+    max_rows: Optional[int] = None
+) -> Optional[LivePanel]:
+    """
+    A live panel for a drawn chart, or None when the chart is not a single
+    line over a time column or its SQL cannot be filtered by that column.
+
+    The stored rows are capped at the query's own LIMIT (so "the latest 100"
+    stays the latest 100) or ``max_rows`` (LIVE_MAX_ROWS).
+    """
+    if plan.chart_type != "line" or plan.method not in ("full", "lttb") or plan.profile is None:
+        return None
+    if plan.x not in plan.profile.dates or len(figure.data) != 1 or not df.columns.is_unique:
+        return None
+    try:
+        source_sql, limit = _delta_source(sql)
+    except Exception as e:
+        logger.info(f"Panel cannot be refreshed live: {e}")
+        return None
+
+    cast = None
+    if plan.profile.columns[plan.x].inferred:
+        cast = "timestamptz" if plan.profile.series(df, plan.x).dt.tz is not None else "timestamp"
+    window = min(limit or max_rows or LIVE_MAX_ROWS, max_rows or LIVE_MAX_ROWS)
+    panel = LivePanel(
+        source_sql=source_sql,
+        time_column=plan.x,
+        value_column=plan.y,
+        data=df,
+        figure=figure,
+        shown=plan.data[[plan.x, plan.y]],
+        window=window,
+        cast=cast,
+        refreshed_at=time.time(),
+    )
+    panel.data = panel._converted(df)
+    if panel.data.empty:
+        return None
+    panel.watermark = panel.data[plan.x].iloc[-1]
+    # Draw the trace in time order, so appended points continue the line
+    panel.shown = panel._converted(panel.shown)
+    trace = figure.data[0]
+    trace.x = panel.shown[plan.x]
+    trace.y = panel.shown[plan.y]
+    figure.update_layout(uirevision=plan.x)
+    return panel
+
+
+async def refresh_live_panels(
+    panels: List[LivePanel],
+    run_sql: Callable[..., Awaitable[Tuple[pd.DataFrame, Dict[str, Any]]]],
+    concurrency: Optional[int] = None,
+    planner: Optional[RenderPlanner] = None
+) -> List[int]:
+    """
+    Run every panel's delta query concurrently and apply the results.
+
+    ``run_sql(sql, max_rows=..., fresh=True)`` executes a query (e.g.
+    ``SQLAgent.run_sql``). A panel whose delta fails keeps its rows and
+    records the error. Returns the new rows each panel received.
+    """
+    slots = asyncio.Semaphore(concurrency or int(os.getenv("BATCH_QUERY_CONCURRENCY", "4")))
+    planner = planner or RenderPlanner()
+
+    async def refresh(panel: LivePanel) -> int:
+        async with slots:
+            try:
+                with span("live.delta"):
+                    delta, _ = await run_sql(panel.delta_sql(), max_rows=panel.window, fresh=True)
+            except Exception as e:
+                logger.warning(f"Live refresh failed: {e}")
+                panel.error = str(e)
+                return 0
+        panel.error = None
+        panel.refreshed_at = time.time()
+        panel.refreshes += 1
+        added = panel.apply(delta, planner)
+        panel.rows_added += added
+        return added
+
+    return list(await asyncio.gather(*(refresh(panel) for panel in panels)))
@@ -1,37 +1,52 @@
-import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-from typing import Any
+from typing import Any, Optional
+
+from src.visualisation.render_planner import RenderPlan, RenderPlanner
+from src.tracing import span
 
 class PlotlyGenerator:
-    def generate_chart(self, df: pd.DataFrame, chart_type: str) -> Any:
-        """Generate a Plotly figure based on the chart type."""
-        
-        if chart_type == "bar":
-            # Assume first categorical is x, first numeric is y
-            cat_cols = df.select_dtypes(include=['object', 'category']).columns
-            num_cols = df.select_dtypes(include=['number']).columns
-            if len(cat_cols) > 0 and len(num_cols) > 0:
-                return px.bar(df, x=cat_cols[0], y=num_cols[0], title=f"{num_cols[0]} by {cat_cols[0]}")
-        
-        elif chart_type == "line":
-            # Assume first date/cat is x, first numeric is y
-            date_cols = df.select_dtypes(include=['datetime']).columns
-            num_cols = df.select_dtypes(include=['number']).columns
-            x_col = date_cols[0] if len(date_cols) > 0 else df.columns[0]
-            if len(num_cols) > 0:
-                return px.line(df, x=x_col, y=num_cols[0], title=f"{num_cols[0]} over Time")
-
-        elif chart_type == "scatter":
-            num_cols = df.select_dtypes(include=['number']).columns
-            if len(num_cols) >= 2:
-                return px.scatter(df, x=num_cols[0], y=num_cols[1], title=f"{num_cols[1]} vs {num_cols[0]}")
-
-        elif chart_type == "pie":
-            cat_cols = df.select_dtypes(include=['object', 'category']).columns
-            num_cols = df.select_dtypes(include=['number']).columns
-            if len(cat_cols) > 0 and len(num_cols) > 0:
-                return px.pie(df, names=cat_cols[0], values=num_cols[0], title=f"Distribution of {num_cols[0]}")
+    def __init__(self, planner: Optional[RenderPlanner] = None):
+        self.planner = planner or RenderPlanner()
+
+    def generate_chart(self, df: pd.DataFrame, chart_type: str, plan: Optional[RenderPlan] = None) -> Any:
+        """
+        Generate a Plotly figure based on the chart type.
+
+        The data is first fitted to the point budget by the render planner
+        (pass a ``plan`` to reuse one, e.g. with aggregation pushed down to SQL).
+        """
+        if plan is None:
+            plan = self.planner.plan(df, chart_type)
+        with span("chart.render", points=len(plan.data), method=plan.method):
+            return self._figure(plan)
+
+    def _figure(self, plan: RenderPlan) -> Any:
+        # plotly.express pulls in much of plotly at import, so load it with the first chart
+        import plotly.express as px
+
+        df, x, y = plan.data, plan.x, plan.y
+
+        if plan.chart_type == "bar":
+            return px.bar(df, x=x, y=y, title=f"{y} by {x}")
+
+        elif plan.chart_type == "line":
+            return px.line(df, x=x, y=y, title=f"{y} over Time")
+
+        elif plan.chart_type == "scatter":
+            if plan.method == "density":
+                grid = df.pivot(index=y, columns=x, values="count")
+                fig = go.Figure(go.Heatmap(z=grid.to_numpy(), x=grid.columns, y=grid.index, colorscale="Viridis"))
+                fig.update_layout(
+                    title=f"{y} vs {x} ({plan.source_rows:,} points)", xaxis_title=x, yaxis_title=y
+                )
+                return fig
+            # WebGL draws tens of thousands of points without stalling the browser
+            render_mode = "webgl" if plan.method == "webgl" else "auto"
+            return px.scatter(df, x=x, y=y, render_mode=render_mode, title=f"{y} vs {x}")
+
+        elif plan.chart_type == "pie":
+            return px.pie(df, names=x, values=y, title=f"Distribution of {y}")
 
         # Default/Table
         return go.Figure(data=[go.Table(
@@ -0,0 +1,331 @@
+"""
+Render planning: fit query results into a point budget before Plotly sees them.
+
+Plotly embeds every point in the page, so a 100k-row result becomes a
+multi-megabyte payload that freezes the browser. ``RenderPlanner.plan``
+decides how each chart type is reduced:
+
+``line``     Min-max preselection, then Largest-Triangle-Three-Buckets (LTTB),
+             which keeps peaks and the shape of the series.
+``scatter``  WebGL (Scattergl) up to RENDER_WEBGL_MAX_POINTS, above that a
+             2D histogram of point density.
+``bar/pie``  Top N categories plus an "Other" bucket.
+``table``    One page of rows.
+
+Where the data came from SQL, ``pushdown_sql`` writes the same reduction as
+an aggregate over the original query (``date_trunc`` buckets for time series,
+ranked categories for bars), so the database does the work and the chart
+covers the whole result even when the raw rows were truncated.
+"""
+import logging
+import math
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.tracing import span
+from src.visualisation.column_profiler import DataProfile, get_profile
+
+logger = logging.getLogger("render-planner")
+
+# Approximate seconds per date_trunc unit, smallest first
+TIME_UNITS = [
+    ("second", 1), ("minute", 60), ("hour", 3600), ("day", 86400), ("week", 604800),
+    ("month", 2629746), ("quarter", 7889238), ("year", 31556952),
+]
+PIE_MAX_SLICES = 10
+
+
+@dataclass
+class RenderPlan:
+    """What to draw for one chart and how the data was reduced to fit."""
+    chart_type: str
+    data: pd.DataFrame = field(repr=False)
+    x: Optional[str] = None
+    y: Optional[str] = None
+    method: str = "full"
+    source_rows: int = 0
+    page: int = 0
+    pages: int = 1
+    pushdown_sql: Optional[str] = None
+    notes: List[str] = field(default_factory=list)
+    profile: Optional[DataProfile] = field(default=None, repr=False)
+
+    @property
+    def reduced(self) -> bool:
+        return self.method != "full"
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the minimum and maximum of ``y`` in ``n_out // 2`` equal buckets."""
+    n = len(y)
+    size = math.ceil(n / max(n_out // 2, 1))
+    # Rounding the size up can leave trailing buckets empty, so count the buckets actually filled
+    buckets = math.ceil(n / size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    # Every bucket holds at least one real value, so nanargmin never sees an all-NaN row
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate([
+        np.nanargmin(padded, axis=1) + offsets,
+        np.nanargmax(padded, axis=1) + offsets,
+        [0, n - 1],
+    ])
+    return np.unique(indices)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of ``n_out`` points that preserve the series' shape."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_end <= end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # Twice the area of the triangle formed with the last selected point and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """LTTB, preceded by a cheap min-max pass when the series is much larger than ``n_out``."""
+    if len(x) > 4 * n_out:
+        candidates = minmax_indices(y, 4 * n_out)
+        return candidates[lttb_indices(x[candidates], y[candidates], n_out)]
+    return lttb_indices(x, y, n_out)
+
+
+def top_n_other(df: pd.DataFrame, category: str, value: str, n: int) -> pd.DataFrame:
+    """Sum ``value`` per category, keeping the ``n - 1`` largest and folding the rest into "Other"."""
+    totals = df.groupby(category, sort=False, dropna=False)[value].sum().sort_values(ascending=False)
+    if len(totals) > n:
+        rest = totals.iloc[n - 1:]
+        totals = totals.iloc[:n - 1]
+        totals.index = totals.index.astype(object)
+        totals[f"Other ({len(rest)})"] = rest.sum()
+    return totals.rename_axis(category).reset_index()
+
+
+def _identifier(name: str) -> str:
+    # Only SQL pushdown needs sqlglot, so it is not imported with the planner
+    from sqlglot import exp
+
+    return exp.to_identifier(name, quoted=True).sql(dialect="postgres")
+
+
+class RenderPlanner:
+    """
+    Reduces results to a point budget per chart.
+
+    ``point_budget`` caps the points drawn per chart (RENDER_POINT_BUDGET),
+    ``webgl_max_points`` is the largest scatter drawn point by point, ``top_n``
+    the number of bars kept and ``table_page_size`` the rows per table page.
+    """
+
+    def __init__(
+        self,
+        point_budget: Optional[int] = None,
+        webgl_max_points: Optional[int] = None,
+        top_n: Optional[int] = None,
+        table_page_size: Optional[int] = None
+    ):
+        self.point_budget = point_budget or int(os.getenv("RENDER_POINT_BUDGET", "5000"))
+        self.webgl_max_points = webgl_max_points or int(os.getenv("RENDER_WEBGL_MAX_POINTS", "50000"))
+        self.top_n = top_n or int(os.getenv("RENDER_TOP_N", "25"))
+        self.table_page_size = table_page_size or int(os.getenv("RENDER_TABLE_PAGE_SIZE", "500"))
+
+    @staticmethod
+    def _columns(df: pd.DataFrame, profile: DataProfile, chart_type: str) -> Tuple[Optional[str], Optional[str]]:
+        """The x and y columns a chart type draws, or (None, None) if the frame has none."""
+        measures, categories, dates = profile.measures, profile.categories, profile.dates
+        if chart_type in ("bar", "pie") and categories and measures:
+            return categories[0], measures[0]
+        if chart_type == "line" and measures:
+            if dates:
+                return dates[0], measures[0]
+            if len(measures) >= 2 and profile.columns[measures[0]].monotonic == "increasing":
+                return measures[0], measures[1]
+            x = df.columns[0]
+            y = next((name for name in measures if name != x), None)
+            return (x, y) if y is not None else (None, None)
+        if chart_type == "scatter" and len(measures) >= 2:
+            return measures[0], measures[1]
+        return None, None
+
+    def plan(
+        self, df: pd.DataFrame, chart_type: str, page: int = 0, profile: Optional[DataProfile] = None
+    ) -> RenderPlan:
+        """Decide what to draw for ``chart_type`` within the point budget."""
+        with span("chart.plan", rows=len(df)) as attributes:
+            plan = self._plan(df, chart_type, page, profile or get_profile(df))
+            attributes["method"] = plan.method
+            attributes["points"] = len(plan.data)
+        return plan
+
+    def _plan(self, df: pd.DataFrame, chart_type: str, page: int, profile: DataProfile) -> RenderPlan:
+        rows = len(df)
+        x, y = self._columns(df, profile, chart_type)
+        if x is None:
+            chart_type = "table"
+        else:
+            # Plot dates and numbers that arrived as strings by their parsed values
+            converted = {name: profile.series(df, name) for name in (x, y) if profile.columns[name].inferred}
+            if converted:
+                df = df.assign(**converted)
+        plan = RenderPlan(chart_type, df, x, y, source_rows=rows, profile=profile)
+
+        if chart_type == "line" and rows > self.point_budget:
+            return self._plan_line(plan)
+        if chart_type == "scatter" and rows > self.point_budget:
+            return self._plan_scatter(plan)
+        if chart_type in ("bar", "pie"):
+            limit = self.top_n if chart_type == "bar" else min(self.top_n, PIE_MAX_SLICES)
+            if profile.columns[x].cardinality > limit:
+                plan.data = top_n_other(df, x, y, limit)
+                plan.method = "top_n"
+                plan.notes.append(f"Showing the top {limit - 1} categories; the rest are grouped as Other.")
+            return plan
+        if chart_type == "table" and rows > self.table_page_size:
+            plan.pages = math.ceil(rows / self.table_page_size)
+            plan.page = min(max(page, 0), plan.pages - 1)
+            start = plan.page * self.table_page_size
+            plan.data = df.iloc[start:start + self.table_page_size]
+            plan.method = "page"
+            plan.notes.append(
+                f"Table shows rows {start + 1:,}-{start + len(plan.data):,} of {rows:,} "
+                f"(page {plan.page + 1} of {plan.pages})."
+            )
+        return plan
+
+    def _plan_line(self, plan: RenderPlan) -> RenderPlan:
+        df = plan.data[[plan.x, plan.y]].dropna()
+        x_values = df[plan.x]
+        if pd.api.types.is_datetime64_any_dtype(x_values):
+            x_numeric = x_values.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+        elif pd.api.types.is_numeric_dtype(x_values):
+            x_numeric = x_values.to_numpy(dtype=np.float64)
+        else:
+            x_numeric = None
+        if x_numeric is not None and not x_values.is_monotonic_increasing:
+            order = np.argsort(x_numeric, kind="stable")
+            df, x_numeric = df.iloc[order], x_numeric[order]
+        if x_numeric is None:
+            # Categorical x: downsample by position
+            x_numeric = np.arange(len(df), dtype=np.float64)
+        else:
+            x_numeric = x_numeric - x_numeric[0]
+
+        indices = downsample_indices(x_numeric, df[plan.y].to_numpy(dtype=np.float64), self.point_budget)
+        plan.data = df.iloc[indices]
+        plan.method = "lttb"
+        plan.notes.append(f"Downsampled {plan.source_rows:,} points to {len(plan.data):,} (LTTB).")
+        return plan
+
+    def _plan_scatter(self, plan: RenderPlan) -> RenderPlan:
+        if plan.source_rows <= self.webgl_max_points:
+            plan.method = "webgl"
+            return plan
+        df = plan.data[[plan.x, plan.y]].dropna()
+        bins = max(int(math.sqrt(self.point_budget)), 2)
+        counts, x_edges, y_edges = np.histogram2d(
+            df[plan.x].to_numpy(dtype=np.float64), df[plan.y].to_numpy(dtype=np.float64), bins=bins
+        )
+        x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+        y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+        xi, yi = np.nonzero(counts)
+        plan.data = pd.DataFrame({plan.x: x_centers[xi], plan.y: y_centers[yi], "count": counts[xi, yi]})
+        plan.method = "density"
+        plan.notes.append(f"{plan.source_rows:,} points shown as density in {bins}x{bins} bins.")
+        return plan
+
+    def _time_unit(self, values: pd.Series) -> str:
+        """The finest date_trunc unit that keeps the series within the point budget."""
+        span_seconds = (values.max() - values.min()).total_seconds()
+        for unit, seconds in TIME_UNITS:
+            if span_seconds / seconds <= self.point_budget:
+                return unit
+        return TIME_UNITS[-1][0]
+
+    def pushdown_sql(self, sql: str, plan: RenderPlan) -> Optional[str]:
+        """
+        The plan's reduction as SQL over ``sql``, or None when it cannot be
+        expressed there (scatter density, tables, non-time line charts).
+        """
+        query = sql.strip().rstrip(";")
+        if plan.x is None:
+            return None
+        x, y = _identifier(plan.x), _identifier(plan.y)
+        # Columns the profile parsed from text need the same cast in SQL
+        inferred = plan.profile.columns if plan.profile is not None else {}
+        x_value = f"{x}::timestamp" if plan.x in inferred and inferred[plan.x].inferred else x
+        y_value = f"{y}::numeric" if plan.y in inferred and inferred[plan.y].inferred else y
+        if plan.chart_type == "line" and pd.api.types.is_datetime64_any_dtype(plan.data[plan.x]):
+            unit = self._time_unit(plan.data[plan.x])
+            return (
+                f"SELECT date_trunc('{unit}', {x_value}) AS {x}, AVG({y_value}) AS {y} "
+                f"FROM ({query}) AS source GROUP BY 1 ORDER BY 1"
+            )
+        if plan.chart_type in ("bar", "pie"):
+            limit = self.top_n if plan.chart_type == "bar" else min(self.top_n, PIE_MAX_SLICES)
+            return (
+                f"SELECT CASE WHEN bucket_rank < {limit} THEN {x}::text ELSE 'Other' END AS {x}, SUM({y}) AS {y} "
+                f"FROM (SELECT {x}, SUM({y_value}) AS {y}, ROW_NUMBER() OVER (ORDER BY SUM({y_value}) DESC) "
+                f"AS bucket_rank FROM ({query}) AS source GROUP BY {x}) AS ranked "
+                f"GROUP BY 1 ORDER BY MIN(bucket_rank)"
+            )
+        return None
+
+    async def plan_with_pushdown(
+        self,
+        df: pd.DataFrame,
+        chart_type: str,
+        sql: str,
+        run_sql: Callable[[str], Awaitable[Tuple[pd.DataFrame, Dict[str, Any]]]],
+        truncated: bool = False
+    ) -> RenderPlan:
+        """
+        Plan a chart, aggregating in the database instead when the result is
+        over budget or was truncated. Falls back to the local plan if the
+        aggregate query fails.
+        """
+        plan = self.plan(df, chart_type)
+        if not (plan.reduced or truncated) or plan.chart_type not in ("line", "bar", "pie"):
+            return plan
+        pushed = self.pushdown_sql(sql, plan)
+        if pushed is None:
+            return plan
+        try:
+            with span("chart.pushdown"):
+                aggregated, meta = await run_sql(pushed)
+        except Exception as e:
+            logger.warning(f"Aggregation pushdown failed, using the local plan: {e}")
+            return plan
+        if aggregated.empty:
+            return plan
+
+        pushed_plan = self.plan(aggregated, plan.chart_type)
+        if pushed_plan.chart_type != plan.chart_type:
+            return plan
+        note = f"Aggregated in the database from {'over ' if truncated else ''}{plan.source_rows:,} rows."
+        return replace(
+            pushed_plan,
+            method="pushdown",
+            pushdown_sql=pushed,
+            source_rows=plan.source_rows,
+            notes=[note] + pushed_plan.notes
+        )